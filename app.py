@@ -1,8 +1,24 @@
-from flask import Flask, render_template, request, session, redirect, url_for
-from modules.ploter import plot_figure
-from modules.avg_senzor_time import process_files
+from flask import Flask, render_template, request, session, redirect, url_for, jsonify, Response, abort, g
+from modules.ploter import plot_figure, load_window
+from modules.downsample import MAX_POINTS
+from modules.avg_senzor_time import process_files, stats_table
 from modules.least_squares import plot_calibrated_data
+from modules.calibration import calibrate, REFERENCE, TIME_BLOCKS
+from modules.drift import update_summary, sensor_health, plot_drift, TOLERANCE
+from modules.result_cache import ResultCache, make_key
+from modules.jobs import JobQueue
+from modules.ingest import IngestService, tcp_source
+from modules.tools import validate_files, parse_time_ranges
+from modules.dataset import Dataset
+from modules.series_store import parsed_files, CHANNELS
+from modules.rollups import RESOLUTIONS
+from modules.alignment import sensor_offsets
+from modules.profiling import METRICS, span, start_trace, end_trace, server_timing, start_profile, save_profile, profiled
 import os
+import json
+import time
+import pandas as pd
+from plotly.offline import get_plotlyjs
 from flask_session import Session
 
 app = Flask(__name__)
@@ -14,23 +30,87 @@ app.config['SESSION_FILE_DIR'] = './flask_sessions'  # Directory to store sessio
 app.config['SESSION_PERMANENT'] = False  # Sessions will not persist when the server restarts
 Session(app)
 
+# Profilování každého požadavku pomocí cProfile (výstupy ve složce ./profiles)
+app.config['PROFILE'] = os.environ.get('PROFILE_REQUESTS') == '1'
+
+# Cache hotových grafů sdílená všemi uživateli; v session je uložen jen klíč
+result_cache = ResultCache('./result_cache')
+
+# Výpočty grafů a kalibrací běží na pozadí, stránka se dotazuje na stav úlohy
+jobs = JobQueue(result_cache)
+
+# Živý příjem dat (spouští se jen s proměnnou prostředí INGEST_PORT)
+ingest = None
+
+def start_ingest(port):
+    """Start the ingest service listening for JSON lines on the given port."""
+    global ingest
+    ingest = IngestService(DATA_DIR)
+    ingest.start_in_thread(tcp_source('127.0.0.1', port))
+
 # Nastavení adresáře pro CSV soubory
 DATA_DIR = './data_parsed/'
 
 try:
-    choice = [os.path.splitext(f)[0] for f in os.listdir(DATA_DIR) if f.endswith('.csv')]
+    choice = parsed_files(DATA_DIR)
 except FileNotFoundError:
     choice = []
 
 # Degub choice
 #print("Files:", choice)
 
+def profiling_enabled():
+    """Profile this request: always with PROFILE_REQUESTS=1, in debug mode also with ?profile=1."""
+    return app.config['PROFILE'] or (app.debug and request.args.get('profile') == '1')
+
+def background(compute, label):
+    """Return the job function, wrapped in cProfile when this request is profiled."""
+    return profiled(compute, label) if profiling_enabled() else compute
+
+@app.before_request
+def start_request_trace():
+    g.trace = start_trace()
+    g.started = time.perf_counter()
+    g.profiler = start_profile() if profiling_enabled() else None
+
+@app.after_request
+def add_server_timing(response):
+    """Record the request duration and send the stage durations in the Server-Timing header."""
+    if 'trace' not in g:
+        return response
+    timings = end_trace(g.trace)
+    timings['total'] = time.perf_counter() - g.started
+    METRICS.observe(f"request.{request.endpoint}", timings['total'])
+    existing = response.headers.get('Server-Timing')
+    response.headers['Server-Timing'] = f"{existing}, {server_timing(timings)}" if existing else server_timing(timings)
+    return response
+
+@app.teardown_request
+def stop_request_profile(exception=None):
+    """Stop and save the profiler of the request, also when the request failed."""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        app.logger.info("Profile saved: %s", save_profile(profiler, request.endpoint or 'request'))
+
 @app.context_processor
 def inject_notes():
     """Inject notes into templates."""
     notes = session.get('notes', [])
     return dict(notes=notes)
 
+@app.context_processor
+def inject_channels():
+    """Inject the measured channels (checkboxes of the forms)."""
+    return dict(all_channels=CHANNELS)
+
+def selected_channels():
+    """Return the channels checked in the form (temperature if none)."""
+    channels = request.form.getlist('channels') or ['temp']
+    for channel in channels:
+        if channel not in CHANNELS:
+            raise ValueError(f"Unknown channel '{channel}'.")
+    return channels
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -43,29 +123,117 @@ def progress_graph():
         files = [file.strip() for file in files]
         ref_file = request.form.get('ref_file', '').strip()
         show_points = 'show_points' in request.form
+        points_only = 'points_only' in request.form
+        grid_step = request.form.get('grid_step', 1, type=float)
+        live_hours = request.form.get('live_hours', 0, type=float) or 0
+        resolution = request.form.get('resolution', 0, type=int) or None
+        align = 'align' in request.form
 
         if ref_file and ref_file not in files:
             return render_template('progress_graph.html', choice=choice, error="Reference file is not in the provided list of files.")
+        if not grid_step or grid_step <= 0:
+            return render_template('progress_graph.html', choice=choice, error="Interpolation step must be a positive number of seconds.")
+        if live_hours and ingest is None:
+            return render_template('progress_graph.html', choice=choice, error="Live data are not available (start the app with INGEST_PORT).")
+        if align and (not ref_file or live_hours):
+            return render_template('progress_graph.html', choice=choice, error="Clock alignment needs a reference file and stored data.")
+        if resolution and (resolution not in RESOLUTIONS or live_hours):
+            return render_template('progress_graph.html', choice=choice, error="Rollups are available only for stored files in the offered resolutions.")
 
         try:
-            fig = plot_figure(files, ref_file, show_points)
-            session['last_graph'] = fig.to_html(full_html=False)
+            channels = selected_channels()
+            file_paths = validate_files(files)
+            params = {'files': files, 'ref_file': ref_file, 'show_points': show_points,
+                      'grid_step': grid_step, 'points_only': points_only, 'channels': channels, 'resolution': resolution,
+                      'align': align}
+            if live_hours:
+                # Živá data se mění s každou přijatou zprávou
+                params.update({'live_hours': live_hours, 'live_version': ingest.version})
+            key = make_key('progress_graph', params, file_paths)
+            info_key = make_key('progress_graph_info', params, file_paths)
         except Exception as e:
             return render_template('progress_graph.html', choice=choice, error=str(e))
 
-        # Process intervals
-        try:
-            intervals = process_files(files)
-            session['intervals'] = "<ul>" + "".join([f"<li>{file}: {interval}</li>" for file, interval in intervals.items()]) + "</ul>"
-        except Exception as e:
-            session['intervals'] = f"Error calculating intervals: {str(e)}"
+        def compute(progress):
+            # Každý soubor se během výpočtu načte jen jednou a sdílí se grafem i intervaly
+            if live_hours:
+                latest = ingest.latest(files)
+                if latest is None:
+                    raise ValueError("No live data for the selected files.")
+                dataset = Dataset(files, (latest - int(live_hours * 3600), latest), reader=ingest.read_range)
+            elif align:
+                # Posuny hodin senzorů vůči referenci (odhad je uložen po sezeních)
+                progress(0.05, "Zarovnání")
+                with span('align.offsets'):
+                    offsets = sensor_offsets(ref_file, files, column=channels[0])
+                dataset = Dataset(files, offsets=offsets)
+            else:
+                dataset = Dataset(files)
+            progress(0.1, "Graf")
+            fig = plot_figure(files, ref_file, show_points, grid_step=grid_step, points_only=points_only, dataset=dataset,
+                              channels=channels, resolution=resolution)
+
+            # Process intervals
+            progress(0.8, "Intervaly")
+            try:
+                intervals = stats_table(process_files(files, dataset)).reset_index().to_dict('records')
+                intervals_error = None
+            except Exception as e:
+                intervals, intervals_error = [], f"Error calculating intervals: {str(e)}"
 
+            load_stats = dataset.summary()
+            app.logger.info("progress_graph: %(files)d files, %(rows)d rows, %(bytes_read)d B read in %(seconds).3f s", load_stats)
+            result_cache.put(info_key, json.dumps({'intervals': intervals, 'intervals_error': intervals_error,
+                                                   'load_stats': load_stats}))
+            with span('serialize'):
+                return fig.to_json()
+
+        session['last_graph'] = jobs.submit(key, background(compute, 'progress_graph'))
+        session['last_graph_info'] = info_key
         return redirect(url_for('progress_graph'))
 
-    graph_html = session.get('last_graph', None)
-    intervals_html = session.get('intervals', None)
-    return render_template('progress_graph.html', choice=choice, plot=graph_html, intervals=intervals_html)
+    graph_key = session.get('last_graph', None)
+    info_key = session.get('last_graph_info', None)
+    info = json.loads(result_cache.get(info_key) or '{}') if info_key else {}
+    return render_template('progress_graph.html', choice=choice, plot=graph_key, job=job_status(graph_key), **info)
+
+@app.route('/api/figure/<key>')
+def api_figure(key):
+    """Return a cached figure as Plotly JSON."""
+    try:
+        figure = result_cache.get(key)
+    except ValueError:
+        abort(404)
+    if figure is None:
+        return jsonify(error="Graf už není v cache, vytvořte ho znovu."), 404
+    response = Response(figure, mimetype='application/json')
+    # Klíč je odvozen z obsahu, odpověď se pod ním nikdy nezmění
+    response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    return response
+
+@app.route('/plotly.min.js')
+def plotly_js():
+    """Serve the plotly.js bundled with the plotly package (cached by the browser)."""
+    response = Response(get_plotlyjs(), mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'public, max-age=604800'
+    return response
 
+@app.route('/api/series')
+def api_series():
+    """Return measured samples of the selected files in a zoomed time window."""
+    files = [file.strip() for file in request.args.get('files', '').split(',') if file.strip()]
+    if not files or any(file not in choice for file in files):
+        return jsonify(error="Unknown file."), 400
+    try:
+        start = pd.Timestamp(request.args['start'])
+        end = pd.Timestamp(request.args['end'])
+        max_points = request.args.get('points', MAX_POINTS, type=int)
+        # Posuny hodin ve tvaru 'soubor:sekundy,...' (graf zarovnaný na referenci)
+        offsets = {name: int(offset) for name, offset in
+                   (item.split(':') for item in request.args.get('offsets', '').split(',') if item)}
+        return jsonify(load_window(files, start, end, max_points, offsets=offsets))
+    except Exception as e:
+        return jsonify(error=str(e)), 400
 
 @app.route('/least_squares', methods=['GET', 'POST'])
 def least_squares():
@@ -77,26 +245,139 @@ def least_squares():
         highlight_intervals = request.form.get('highlight_intervals', None)
 
         try:
-            fig = plot_calibrated_data(f"./data_parsed/{sensor_1}.csv", f"./data_parsed/{sensor_2}.csv", global_time_range, highlight_intervals)
+            # Formulář posílá text 'HH:MM:SS-HH:MM:SS, ...'
+            global_ranges = parse_time_ranges(global_time_range)
+            if len(global_ranges) > 1:
+                raise ValueError(f"Enter a single global time range, got {len(global_ranges)}.")
+            global_time_range = global_ranges[0] if global_ranges else None
+            if (highlight_intervals or '').strip().lower() == 'auto':
+                highlight_intervals = 'auto'
+            else:
+                highlight_intervals = parse_time_ranges(highlight_intervals) or None
+            channels = selected_channels()
+            params = {'sensor_1': sensor_1, 'sensor_2': sensor_2, 'global_time_range': global_time_range,
+                      'highlight_intervals': highlight_intervals, 'channels': channels}
+            key = make_key('least_squares', params, validate_files([sensor_1, sensor_2]))
+        except Exception as e:
+            return render_template('least_squares.html', choice=choice, error=f"Chyba: {str(e)}")
+
+        def compute(progress):
+            fig = plot_calibrated_data(f"./data_parsed/{sensor_1}.csv", f"./data_parsed/{sensor_2}.csv", global_time_range, highlight_intervals,
+                                       channels=channels)
 
             # Check if the plot is None
             if fig is None:
-                return render_template('least_squares.html', choice=choice, error="Chyba při vytváření grafu.")
-            
-            fig_html = fig.to_html(full_html=False)
-            
-            # Save the generated plot in the session
-            session['last_least_squares_graph'] = fig_html
+                raise ValueError("Chyba při vytváření grafu.")
+            with span('serialize'):
+                return fig.to_json()
+
+        # Save the key of the generated plot in the session
+        session['last_least_squares_graph'] = jobs.submit(key, background(compute, 'least_squares'))
+        return redirect(url_for('least_squares'))
+
+    # Fetch the last graph from the session if it exists
+    graph_key = session.get('last_least_squares_graph', None)
+    return render_template('least_squares.html', choice=choice, plot=graph_key, job=job_status(graph_key))
+
+@app.route('/calibration', methods=['GET', 'POST'])
+def calibration():
+    if request.method == 'POST':
+        reference = request.form.get('reference', REFERENCE).strip()
+        sensors = [sensor.strip() for sensor in request.form.get('sensors', '').split(',') if sensor.strip()]
+        blocks_text = request.form.get('blocks', '').strip()
+        align = 'align' in request.form
 
+        try:
+            blocks = 'auto' if blocks_text.lower() == 'auto' else parse_time_ranges(blocks_text)
+            channels = selected_channels()
+            params = {'reference': reference, 'sensors': sensors, 'blocks': blocks, 'channels': channels, 'align': align}
+            key = make_key('calibration', params, validate_files([reference] + sensors))
         except Exception as e:
-            return render_template('least_squares.html', choice=choice, error=f"Chyba: {str(e)}")
+            return render_template('calibration.html', choice=choice, reference=reference, blocks=blocks_text,
+                                   channels=request.form.getlist('channels'), align=align, error=str(e))
 
-        
-        return render_template('least_squares.html', choice=choice, plot=fig_html)
+        def compute(progress):
+            with span('calibration.fit'):
+                fits, table = calibrate(reference, sensors, blocks, channels if len(channels) > 1 else channels[0],
+                                        align=align)
+            with span('serialize'):
+                return json.dumps({
+                    'fits': fits.round(4).to_html(border=0),
+                    'table': table.round(3).to_html(index=False, border=0),
+                })
 
-    # Fetch the last graph from the session if it exists
-    graph_html = session.get('last_least_squares_graph', None)
-    return render_template('least_squares.html', choice=choice, plot=graph_html)
+        session['last_calibration'] = jobs.submit(key, background(compute, 'calibration'))
+        session['calibration_form'] = {'reference': reference, 'blocks': blocks_text, 'channels': channels, 'align': align}
+        return redirect(url_for('calibration'))
+
+    form = session.get('calibration_form', {'reference': REFERENCE, 'channels': ['temp'],
+                                            'blocks': ", ".join(f"{start}-{end}" for start, end in TIME_BLOCKS)})
+    key = session.get('last_calibration', None)
+    result = json.loads(result_cache.get(key) or '{}') if key else {}
+    return render_template('calibration.html', choice=choice, job=job_status(key), **form, **result)
+
+@app.route('/drift', methods=['GET', 'POST'])
+def drift():
+    if request.method == 'POST':
+        reference = request.form.get('reference', REFERENCE).strip()
+        tolerance = request.form.get('tolerance', TOLERANCE, type=float)
+
+        try:
+            if not tolerance or tolerance <= 0:
+                raise ValueError("Tolerance must be a positive number of °C.")
+            sensors = [file for file in choice if file != reference]
+            params = {'reference': reference, 'sensors': sensors, 'tolerance': tolerance}
+            key = make_key('drift', params, validate_files([reference] + sensors))
+        except Exception as e:
+            return render_template('drift.html', choice=choice, reference=reference, tolerance=tolerance, error=str(e))
+
+        def compute(progress):
+            # Spočtou se jen nová nebo změněná sezení, ostatní se vezmou ze souhrnné tabulky
+            with span('drift.update'):
+                summary, computed = update_summary(reference, sensors)
+            if summary.empty:
+                raise ValueError("No sessions with data of the reference and the sensors.")
+            health = sensor_health(summary, tolerance)
+            with span('serialize'):
+                return json.dumps({
+                    'figure': plot_drift(summary, tolerance).to_json(),
+                    'health': health.round(4).to_html(border=0),
+                    'flagged': health.index[health['flagged']].tolist(),
+                    'sessions': int(summary['session'].nunique()),
+                    'computed': computed,
+                })
+
+        session['last_drift'] = jobs.submit(key, background(compute, 'drift'))
+        session['drift_form'] = {'reference': reference, 'tolerance': tolerance}
+        return redirect(url_for('drift'))
+
+    form = session.get('drift_form', {'reference': REFERENCE, 'tolerance': TOLERANCE})
+    key = session.get('last_drift', None)
+    result = json.loads(result_cache.get(key) or '{}') if key else {}
+    return render_template('drift.html', choice=choice, job=job_status(key), **form, **result)
+
+@app.route('/api/jobs/<key>')
+def api_job(key):
+    """Return the state of a background job (stage durations of a finished job also as Server-Timing)."""
+    try:
+        status = jobs.status(key)
+    except ValueError:
+        abort(404)
+    response = jsonify(status)
+    if status['timings']:
+        response.headers['Server-Timing'] = server_timing(status['timings'])
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Duration histograms of the instrumented stages (Prometheus text format, ?format=json for a summary)."""
+    if request.args.get('format') == 'json':
+        return jsonify(METRICS.snapshot())
+    return Response(METRICS.to_text(), mimetype='text/plain; version=0.0.4')
+
+def job_status(key):
+    """Return the state of the job of a page, None if there is nothing to show."""
+    return dict(jobs.status(key), id=key) if key else None
 
 # Adding notepad functionality
 @app.route('/notepad', methods=['POST'])
@@ -120,4 +401,7 @@ def delete_notes():
     return redirect(request.referrer)
 
 if __name__ == '__main__':
+    # Příjem dat běží jen v procesu, který obsluhuje požadavky (ne v hlídači reloaderu)
+    if os.environ.get('INGEST_PORT') and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_ingest(int(os.environ['INGEST_PORT']))
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,249 @@
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+
+if not __package__:
+    from tools import validate_files
+    from series_store import (load_series, read_range, epoch_to_local, find_sessions, range_fingerprint,
+                              parsed_files, load_table, save_table, SESSION_GAP)
+else:
+    from modules.tools import validate_files
+    from modules.series_store import (load_series, read_range, epoch_to_local, find_sessions, range_fingerprint,
+                                      parsed_files, load_table, save_table, SESSION_GAP)
+
+# Tabulka odhadnutých posunů po sezeních, krok převzorkování (s), největší hledaný posun (s)
+# a nejmenší korelace, se kterou se posun použije
+OFFSETS_FILE = "./alignment_offsets.csv"
+RESAMPLE_STEP = 10
+MAX_LAG = 900
+MIN_CORRELATION = 0.5
+
+COLUMNS = ['reference', 'sensor', 'column', 'session_start', 'session_end', 'offset', 'correlation',
+           'reference_samples', 'reference_last', 'sensor_samples', 'sensor_last']
+
+# Zápis tabulky posunů z více úloh najednou
+_lock = threading.Lock()
+
+def _resample(timestamp, values, grid):
+    """Interpolate a series onto the grid; NaN outside its time range and for missing values."""
+    valid = ~np.isnan(values)
+    timestamp, values = timestamp[valid], values[valid]
+    if len(timestamp) < 2:
+        return np.full(len(grid), np.nan)
+    resampled = np.interp(grid, timestamp, values)
+    resampled[(grid < timestamp[0]) | (grid > timestamp[-1])] = np.nan
+    return resampled
+
+def _changes(values):
+    """First differences with their mean removed; zero where a value is missing."""
+    difference = np.diff(values, axis=-1)
+    valid = ~np.isnan(difference)
+    mean = np.where(valid, difference, 0.0).sum(axis=-1, keepdims=True) / np.maximum(valid.sum(axis=-1, keepdims=True), 1)
+    return np.where(valid, difference - mean, 0.0)
+
+def cross_correlation_lags(reference, signals, max_shift):
+    """
+    Find the shift of every signal against the reference by FFT cross-correlation.
+
+    All signals are transformed by one batched real FFT. The signals should be
+    zero-mean; missing values must be replaced by zeros beforehand.
+
+    Parameters:
+        reference (np.ndarray): Reference signal (sample).
+        signals (np.ndarray): Signals on the same grid (signal x sample).
+        max_shift (int): Largest searched shift in samples.
+
+    Returns:
+        tuple: Shifts in samples (signal, fractional by parabolic interpolation of the peak;
+        a positive shift means the signal is late) and the normalized correlation at the peak.
+    """
+    length = len(reference)
+    size = 1 << int(np.ceil(np.log2(2 * length)))
+    spectrum = np.fft.rfft(signals, size, axis=1) * np.conj(np.fft.rfft(reference, size))[None, :]
+    correlation = np.fft.irfft(spectrum, size, axis=1)
+    # Posuny -max_shift..max_shift (záporné jsou na konci kruhové korelace)
+    max_shift = min(max_shift, length - 1)
+    window = np.concatenate((correlation[:, size - max_shift:], correlation[:, :max_shift + 1]), axis=1)
+    peak = np.argmax(window, axis=1)
+    rows = np.arange(len(signals))
+
+    # Parabola přes vrchol a jeho sousedy zpřesní posun pod krok mřížky
+    inner = (peak > 0) & (peak < window.shape[1] - 1)
+    left = window[rows, np.clip(peak - 1, 0, None)]
+    middle = window[rows, peak]
+    right = window[rows, np.clip(peak + 1, None, window.shape[1] - 1)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        refined = np.where(inner, 0.5 * (left - right) / (left - 2 * middle + right), 0.0)
+        norm = np.sqrt(np.sum(reference ** 2) * np.sum(signals ** 2, axis=1))
+        peak_correlation = middle / norm
+    shifts = peak - max_shift + np.nan_to_num(refined)
+    return shifts, peak_correlation
+
+def estimate_offsets(reference_path, sensor_paths, start, end, column='temp', step=RESAMPLE_STEP, max_lag=MAX_LAG):
+    """
+    Estimate the clock offsets of sensors against the reference within one time window.
+
+    The series are resampled to a grid of step seconds and differenced (so the
+    offset q and gain k of a sensor do not matter, only the timing of changes);
+    the shifts of all sensors are then found by one batched FFT cross-correlation.
+
+    Parameters:
+        reference_path (str): Path to the parsed CSV file of the reference.
+        sensor_paths (list): Paths to the parsed CSV files of the sensors.
+        start (int): Window start in epoch seconds.
+        end (int): Window end in epoch seconds (inclusive).
+        column (str): Compared column.
+        step (float): Resampling step in seconds.
+        max_lag (float): Largest searched offset in seconds.
+
+    Returns:
+        tuple: Offsets in seconds to add to the sensor times (sensor) and the correlation
+        of the aligned changes (NaN where the sensor has no data in the window).
+    """
+    grid = np.arange(start, end + 1, step, dtype=np.float64)
+    reference = read_range(reference_path, start, end)
+    reference_values = _resample(reference['timestamp'], np.asarray(reference[column], dtype=np.float64), grid)
+    signals = []
+    for path in sensor_paths:
+        # Senzor se čte i kousek za okraji okna, aby posunutá data nechyběla
+        data = read_range(path, int(start - max_lag), int(end + max_lag))
+        signals.append(_resample(data['timestamp'], np.asarray(data[column], dtype=np.float64), grid))
+    signals = np.array(signals).reshape(len(sensor_paths), len(grid))
+
+    reference_changes = _changes(reference_values)
+    if len(reference_changes) < 2 or not np.any(reference_changes):
+        return np.full(len(sensor_paths), np.nan), np.full(len(sensor_paths), np.nan)
+    shifts, correlation = cross_correlation_lags(reference_changes, _changes(signals), int(np.ceil(max_lag / step)))
+    empty = np.all(np.isnan(signals), axis=1)
+    offsets = np.where(empty, np.nan, -shifts * step)
+    return offsets, np.where(empty, np.nan, correlation)
+
+def load_offsets(offsets_file=OFFSETS_FILE):
+    """
+    Load the table of estimated offsets.
+
+    Parameters:
+        offsets_file (str): Path to the CSV file.
+
+    Returns:
+        pd.DataFrame: Offsets table (empty with COLUMNS if the file does not exist).
+    """
+    return load_table(offsets_file, COLUMNS)
+
+def save_offsets(offsets, offsets_file=OFFSETS_FILE):
+    """Write the offsets table to offsets_file atomically."""
+    save_table(offsets, offsets_file)
+
+def session_offsets(reference, sensors=None, time_range=None, column='temp', offsets_file=OFFSETS_FILE,
+                    gap=SESSION_GAP):
+    """
+    Return the clock offsets of sensors for every session of the reference, estimating only new ones.
+
+    Offsets are cached in offsets_file per reference, sensor, column and
+    session; a session is estimated again when the number of samples or the
+    last sample of the reference or the sensor in it changed.
+
+    Parameters:
+        reference (str): Reference file name without extension.
+        sensors (list): Sensor file names without extensions (default: all parsed files).
+        time_range (tuple): Start and end in epoch seconds; only sessions overlapping it are used (None = all).
+        column (str): Compared column.
+        offsets_file (str): Path to the cache CSV file (None = do not cache).
+        gap (float): Minimal gap between sessions in seconds (see series_store.find_sessions).
+
+    Returns:
+        pd.DataFrame: One row per sensor and session with 'offset' (s, add to the sensor times)
+        and 'correlation', sorted by sensor and session.
+    """
+    if sensors is None:
+        sensors = parsed_files()
+    sensors = [sensor for sensor in sensors if sensor != reference]
+    reference_path = validate_files([reference])[0]
+    sensor_paths = dict(zip(sensors, validate_files(sensors)))
+
+    sessions = find_sessions(load_series(reference_path)['timestamp'], gap)
+    if time_range is not None:
+        sessions = [(start, end) for start, end in sessions if start <= time_range[1] and end >= time_range[0]]
+
+    with _lock:
+        cached = load_offsets(offsets_file)
+        stored = {(row.reference, row.sensor, row.column, int(row.session_start)): row
+                  for row in cached.itertuples(index=False)}
+        rows = []
+        computed = 0
+        for start, end in sessions:
+            reference_fingerprint = range_fingerprint(reference_path, start, end)
+            changed = []
+            for sensor, path in sensor_paths.items():
+                fingerprint = range_fingerprint(path, start - MAX_LAG, end + MAX_LAG)
+                row = stored.get((reference, sensor, column, start))
+                if row is not None and (row.reference_samples, row.reference_last, row.sensor_samples, row.sensor_last) \
+                        == reference_fingerprint + fingerprint:
+                    rows.append(row._asdict())
+                else:
+                    changed.append((sensor, fingerprint))
+            if not changed:
+                continue
+            offsets, correlation = estimate_offsets(reference_path, [sensor_paths[sensor] for sensor, _ in changed],
+                                                    start, end, column)
+            for (sensor, fingerprint), offset, peak in zip(changed, offsets, correlation):
+                rows.append(dict(reference=reference, sensor=sensor, column=column, session_start=start, session_end=end,
+                                 offset=offset, correlation=peak,
+                                 reference_samples=reference_fingerprint[0], reference_last=reference_fingerprint[1],
+                                 sensor_samples=fingerprint[0], sensor_last=fingerprint[1]))
+            computed += len(changed)
+
+        result = pd.DataFrame(rows, columns=COLUMNS).sort_values(['sensor', 'session_start'], ignore_index=True)
+        if offsets_file and computed:
+            keys = set(zip(result['sensor'], result['column'], result['session_start']))
+            others = cached[[(row.reference != reference or (row.sensor, row.column, int(row.session_start)) not in keys)
+                             for row in cached.itertuples(index=False)]]
+            save_offsets(pd.concat([others, result], ignore_index=True) if len(others) else result, offsets_file)
+    return result
+
+def sensor_offsets(reference, sensors, time_range=None, column='temp', offsets_file=OFFSETS_FILE,
+                   min_correlation=MIN_CORRELATION):
+    """
+    Return one clock offset per sensor for a request.
+
+    The offset of the session with the largest overlap with the time range is
+    used; offsets with a correlation below min_correlation are not applied.
+
+    Parameters:
+        reference (str): Reference file name without extension.
+        sensors (list): Sensor file names without extensions.
+        time_range (tuple): Start and end in epoch seconds (None = whole files).
+        column (str): Compared column.
+        offsets_file (str): Path to the cache CSV file (None = do not cache).
+        min_correlation (float): Smallest correlation of an applied offset.
+
+    Returns:
+        dict: Sensor name -> offset in whole seconds (reference and unaligned sensors are 0).
+    """
+    rows = session_offsets(reference, sensors, time_range, column, offsets_file)
+    offsets = {sensor: 0 for sensor in sensors}
+    if rows.empty:
+        return offsets
+    start, end = time_range or (rows['session_start'].min(), rows['session_end'].max())
+    rows = rows.assign(overlap=np.minimum(rows['session_end'], end) - np.maximum(rows['session_start'], start))
+    for sensor, sessions in rows.groupby('sensor'):
+        best = sessions.loc[sessions['overlap'].idxmax()]
+        if best['correlation'] >= min_correlation and not np.isnan(best['offset']):
+            offsets[sensor] = int(round(best['offset']))
+    return offsets
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Estimate clock offsets of sensors against the reference by cross-correlation.")
+    arg_parser.add_argument('--reference', required=True, help="Reference file name without extension (e.g. klarka).")
+    arg_parser.add_argument('--sensors', nargs='+', help="Sensor file names without extensions (default: all parsed files).")
+    arg_parser.add_argument('--column', default='temp', help="Compared column (default: temp).")
+    arg_parser.add_argument('--offsets', default=OFFSETS_FILE, help=f"Cache CSV file (default: {OFFSETS_FILE}).")
+    args = arg_parser.parse_args()
+
+    rows = session_offsets(args.reference, args.sensors, column=args.column, offsets_file=args.offsets)
+    rows['session'] = epoch_to_local(rows['session_start']).strftime('%Y-%m-%d %H:%M')
+    print(rows[['sensor', 'session', 'offset', 'correlation']].round(3).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -2,34 +2,176 @@ import pandas as pd
 import numpy as np
 import os
 
-def load_file(file_path):
+if not __package__:
+    from tools import validate_files
+    from series_store import load_series, epoch_to_local
+    from profiling import span
+else:
+    from modules.tools import validate_files
+    from modules.series_store import load_series, epoch_to_local
+    from modules.profiling import span
+
+def load_timestamps(file_path, dataset=None):
     """
-    Load and process a CSV file.
+    Return the sorted timestamps of a file without copying them.
 
     Parameters:
         file_path (str): Path to the CSV file.
+        dataset (Dataset): Data already loaded for the current request.
 
     Returns:
-        pd.DataFrame: DataFrame containing the data.
+        np.ndarray: Epoch seconds (memory-mapped from the series store without a dataset).
+    """
+    if dataset is not None:
+        return dataset.frame(file_path)['timestamp'].to_numpy()
+    return load_series(file_path)['timestamp']
+
+# Délka čtených bloků (vzorků), rozsah přesného histogramu intervalů (s),
+# mezera = interval delší než GAP_FACTOR × medián, nejvýše MAX_GAPS vypsaných mezer
+CHUNK_SIZE = 1 << 20
+MAX_EXACT = 3600
+GAP_FACTOR = 1.5
+MAX_GAPS = 20
+
+class IntervalStats:
+    """
+    Sampling interval statistics accumulated over chunks of sorted timestamps.
+
+    Intervals shorter than MAX_EXACT seconds are counted in an exact histogram
+    of whole seconds, so the memory does not grow with the number of samples.
+    The gap limit depends on the median of all intervals, so gaps are
+    collected in a second pass over the same chunks (collect_gaps) once the
+    median is known.
     """
-    data = pd.read_csv(file_path, delimiter=',')
-    data['date_time'] = pd.to_datetime(data['date'] + ' ' + data['time'])
-    return data
 
-def calculate_average_interval(data):
+    def __init__(self, max_exact=MAX_EXACT, gap_factor=GAP_FACTOR):
+        self.max_exact = max_exact
+        self.gap_factor = gap_factor
+        self.histogram = np.zeros(max_exact, dtype=np.int64)
+        self.long = []
+        self.gaps = []
+        self.samples = 0
+        self.duplicates = 0
+        self.total = 0
+        self.last = None
+        self.gap_last = None
+
+    @staticmethod
+    def _intervals(timestamp, last):
+        """Starts and lengths of the intervals of a chunk, including the one from the previous chunk."""
+        if last is None:
+            return timestamp[:-1], np.diff(timestamp)
+        return np.concatenate(([last], timestamp[:-1])), np.diff(timestamp, prepend=last)
+
+    def update(self, timestamp):
+        """
+        Add the next chunk of sorted epoch seconds (first pass).
+
+        Parameters:
+            timestamp (np.ndarray): Times following the previous chunk.
+        """
+        timestamp = np.asarray(timestamp, dtype=np.int64)
+        if len(timestamp) == 0:
+            return
+        _, intervals = self._intervals(timestamp, self.last)
+        self.samples += len(timestamp)
+        self.last = int(timestamp[-1])
+        self.total += int(intervals.sum())
+        self.duplicates += int(np.count_nonzero(intervals == 0))
+
+        exact = intervals < self.max_exact
+        self.histogram += np.bincount(intervals[exact], minlength=self.max_exact)
+        self.long.extend(intervals[~exact].tolist())
+
+    def gap_limit(self):
+        """Return the shortest interval counted as a gap (GAP_FACTOR x median; None without intervals)."""
+        median = self.percentile(50)
+        return self.gap_factor * median if median else None
+
+    def collect_gaps(self, timestamp):
+        """
+        Collect the gaps of the next chunk (second pass, after all chunks were added by update).
+
+        Parameters:
+            timestamp (np.ndarray): The same chunks as in the first pass, in the same order.
+        """
+        timestamp = np.asarray(timestamp, dtype=np.int64)
+        limit = self.gap_limit()
+        if len(timestamp) == 0 or limit is None:
+            return
+        starts, intervals = self._intervals(timestamp, self.gap_last)
+        self.gap_last = int(timestamp[-1])
+        gap = intervals > limit
+        self.gaps.extend(zip(starts[gap].tolist(), intervals[gap].tolist()))
+
+    def percentile(self, q):
+        """Return the q-th percentile of the intervals in seconds (None without intervals)."""
+        count = int(self.histogram.sum()) + len(self.long)
+        if count == 0:
+            return None
+        rank = max(int(np.ceil(q / 100 * count)), 1)
+        cumulative = np.cumsum(self.histogram)
+        if rank <= cumulative[-1]:
+            return int(np.searchsorted(cumulative, rank))
+        return int(sorted(self.long)[rank - cumulative[-1] - 1])
+
+    def result(self, max_gaps=MAX_GAPS):
+        """
+        Return the statistics.
+
+        Returns:
+            dict: 'samples', 'duplicates', 'mean', 'median', 'p5', 'p95', 'p99', 'max' (s),
+            'gaps' (count), 'gap_list' (longest gaps as (start, seconds), start in epoch seconds),
+            'missing' (samples estimated lost in the gaps) and 'loss' (missing / expected samples).
+        """
+        intervals = self.samples - 1
+        median = self.percentile(50)
+        result = {
+            'samples': self.samples,
+            'duplicates': self.duplicates,
+            'mean': self.total / intervals if intervals > 0 else None,
+            'median': median,
+            'p5': self.percentile(5),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': max(self.long) if self.long else (int(np.flatnonzero(self.histogram)[-1]) if intervals > 0 else None),
+            'gaps': 0, 'gap_list': [], 'missing': 0, 'loss': None,
+        }
+        if not median:
+            return result
+        gaps = self.gaps
+        # Chybějící vzorky: kolik period se vejde do každé mezery navíc
+        # (kolísání kratší než mezera se za ztrátu nepovažuje)
+        missing = sum(int(round(length / median)) - 1 for _, length in gaps)
+        received = self.samples - self.duplicates
+        result.update({
+            'gaps': len(gaps),
+            'gap_list': sorted(gaps, key=lambda gap: -gap[1])[:max_gaps],
+            'missing': missing,
+            'loss': missing / (received + missing),
+        })
+        return result
+
+def interval_stats(timestamp, chunk_size=CHUNK_SIZE):
     """
-    Calculate the average time interval between readings.
+    Compute the sampling interval statistics in two streaming passes over chunks of the timestamps.
+
+    The first pass builds the interval histogram (and so the median), the
+    second one collects the gaps longer than the limit from the final median.
 
     Parameters:
-        data (pd.DataFrame): DataFrame with the data.
+        timestamp (np.ndarray): Sorted epoch seconds (e.g. a memory map; only one chunk is read at a time).
+        chunk_size (int): Number of samples per chunk.
 
     Returns:
-        float: Average interval in seconds.
+        dict: Statistics from IntervalStats.result.
     """
-    data.sort_values(by='date_time', inplace=True)
-    data['time_diff'] = data['date_time'].diff().dt.total_seconds()
-    average_interval = data['time_diff'].mean()
-    return average_interval
+    stats = IntervalStats()
+    for start in range(0, len(timestamp), chunk_size):
+        stats.update(timestamp[start:start + chunk_size])
+    for start in range(0, len(timestamp), chunk_size):
+        stats.collect_gaps(timestamp[start:start + chunk_size])
+    return stats.result()
 
 def format_interval(seconds):
     """
@@ -50,40 +192,63 @@ def format_interval(seconds):
         hours = seconds / 3600
         return f"{hours:.2f} hours"
 
-def process_files(files):
+def process_files(files, dataset=None):
     """
-    Process multiple CSV files and return the average sampling intervals.
+    Process multiple CSV files and return their sampling interval statistics.
 
     Parameters:
         files (list): List of file names without extensions.
+        dataset (Dataset): Data loaded once for the request and shared with other code paths.
 
     Returns:
-        dict: Dictionary with file names as keys and formatted intervals as values.
+        dict: Dictionary with file names as keys and statistics (see IntervalStats.result) as values.
     """
     intervals = {}
     try:
-        file_paths = validate_files(files)
+        file_paths = dataset.file_paths if dataset is not None else validate_files(files)
         for file_path in file_paths:
             try:
-                data = load_file(file_path)
-                average_interval = calculate_average_interval(data)
-                formatted_interval = format_interval(average_interval)
-                intervals[os.path.basename(file_path)] = formatted_interval
+                with span('intervals.load'):
+                    timestamp = load_timestamps(file_path, dataset)
+                with span('intervals.compute'):
+                    intervals[os.path.basename(file_path)] = interval_stats(timestamp)
             except Exception as e:
                 print(f"Error processing file {file_path}: {e}")
     except Exception as e:
         print(f"Error: {e}")
     return intervals
 
+def format_gap(start, seconds):
+    """Format a gap as 'YYYY-MM-DD HH:MM:SS (duration)' in local time."""
+    return f"{epoch_to_local([start])[0]:%Y-%m-%d %H:%M:%S} ({format_interval(seconds)})"
+
+def stats_table(intervals):
+    """
+    Convert the statistics of process_files to a table with formatted values.
+
+    Parameters:
+        intervals (dict): Result of process_files.
+
+    Returns:
+        pd.DataFrame: One row per file.
+    """
+    rows = {}
+    for file, stats in intervals.items():
+        formatted = {name: format_interval(stats[name]) if stats[name] is not None else '-'
+                     for name in ('mean', 'median', 'p5', 'p95', 'p99', 'max')}
+        rows[file] = dict(samples=stats['samples'], **formatted, duplicates=stats['duplicates'], gaps=stats['gaps'],
+                          missing=stats['missing'], loss=f"{stats['loss']:.1%}" if stats['loss'] is not None else '-',
+                          longest_gap=format_gap(*stats['gap_list'][0]) if stats['gap_list'] else '-')
+    return pd.DataFrame.from_dict(rows, orient='index').rename_axis('file')
+
 def main():
     files = input("Enter file names (comma-separated, without extensions): ").split(',')
     files = [file.strip() for file in files]
     intervals = process_files(files)
-    for file, interval in intervals.items():
-        print(f"{file}: Average sampling interval: {interval}")
+    print(stats_table(intervals).to_string())
+    for file, stats in intervals.items():
+        if stats['gap_list']:
+            print(f"{file}: gaps: " + ", ".join(format_gap(start, seconds) for start, seconds in stats['gap_list']))
 
 if __name__ == "__main__":
-    from tools import validate_files
     main()
-else:
-    from modules.tools import validate_files
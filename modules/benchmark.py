@@ -0,0 +1,331 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+    import tracemalloc
+
+if not __package__:
+    from parser import find_sources, parse_files, RAW_DIR
+    from ploter import plot_figure
+    from avg_senzor_time import process_files
+    from least_squares import plot_calibrated_data
+    from calibration import REFERENCE
+    from series_store import parsed_files
+else:
+    from modules.parser import find_sources, parse_files, RAW_DIR
+    from modules.ploter import plot_figure
+    from modules.avg_senzor_time import process_files
+    from modules.least_squares import plot_calibrated_data
+    from modules.calibration import REFERENCE
+    from modules.series_store import parsed_files
+
+# Výchozí zvětšení dat (počet kopií každého dne), počet opakování a soubor s historií měření
+SCALES = (1, 10, 100)
+REPEAT = 3
+HISTORY_FILE = "./benchmark_history.json"
+STEPS = ['parser', 'plot_figure', 'process_files', 'plot_calibrated_data']
+
+def replicate_folder(raw_dir, folder, factor, output_dir):
+    """
+    Copy the raw exports of one day factor times onto the following days.
+
+    Copy k is shifted by k days; ids are shifted so that they stay unique.
+
+    Parameters:
+        raw_dir (str): Directory with the raw exports.
+        folder (str): Day folder in raw_dir (YYYY-MM-DD).
+        factor (int): Number of copies (1 = the day itself).
+        output_dir (str): Directory for the new day folders (raw_dir layout).
+
+    Returns:
+        list: Names of the created day folders.
+    """
+    day = datetime.strptime(folder, '%Y-%m-%d')
+    folder_path = os.path.join(raw_dir, folder)
+    names = sorted(name for name in os.listdir(folder_path) if name.endswith('.csv'))
+
+    rows = {}
+    max_id = 0
+    for name in names:
+        with open(os.path.join(folder_path, name), mode="r", encoding="utf-8-sig", newline="") as infile:
+            reader = csv.reader(infile)
+            header = next(reader)
+            rows[name] = (header, list(reader))
+        max_id = max([max_id] + [int(values[0]) for values in rows[name][1] if values and values[0].isdigit()])
+
+    folders = []
+    shifted_dates = {}
+    for k in range(factor):
+        copy = (day + timedelta(days=k)).strftime('%Y-%m-%d')
+        os.makedirs(os.path.join(output_dir, copy), exist_ok=True)
+        folders.append(copy)
+        for name, (header, values_list) in rows.items():
+            with open(os.path.join(output_dir, copy, name), mode="w", encoding="utf-8", newline="") as outfile:
+                writer = csv.writer(outfile, quoting=csv.QUOTE_ALL)
+                writer.writerow(header)
+                for values in values_list:
+                    values = list(values)
+                    if values[0].isdigit():
+                        values[0] = str(int(values[0]) + k * (max_id + 1))
+                    date = values[1][:10]
+                    if (date, k) not in shifted_dates:
+                        shifted_dates[date, k] = (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=k)).strftime('%Y-%m-%d')
+                    values[1] = shifted_dates[date, k] + values[1][10:]
+                    writer.writerow(values)
+    return folders
+
+def _output_size(result):
+    """Size of a step result in bytes (figures as JSON)."""
+    if result is None:
+        return 0
+    if hasattr(result, 'to_json'):
+        return len(result.to_json())
+    return len(json.dumps(result))
+
+def _peak_rss():
+    """Peak resident set size of this process and its children in bytes."""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss je na Linuxu v kB, na macOS v bajtech
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _run_step(step, workdir, args):
+    """Run one benchmark case (in a separate process) and return its measurements."""
+    os.chdir(workdir)
+    if resource is None:
+        tracemalloc.start()
+    # Výpisy kroků (např. zahozené řádky parseru) se nezobrazují
+    with open(os.devnull, mode="w") as devnull, contextlib.redirect_stdout(devnull):
+        return _timed_step(step, args)
+
+def _timed_step(step, args):
+    started = time.perf_counter()
+    if step == 'parser':
+        folders, raw_dir, output_dir = args
+        stats = parse_files(find_sources(folders, raw_dir=raw_dir), output_dir, workers=1)
+        output_bytes = sum(os.path.getsize(os.path.join(output_dir, f"{file}.csv")) for file in stats)
+        rows = sum(file_stats['rows'] + file_stats['dropped'] for file_stats in stats.values())
+    else:
+        if step == 'plot_figure':
+            files, ref_file = args
+            result = plot_figure(files, ref_file)
+        elif step == 'process_files':
+            result = process_files(args)
+        else:
+            sensor_1, sensor_2 = args
+            result = plot_calibrated_data(f"./data_parsed/{sensor_1}.csv", f"./data_parsed/{sensor_2}.csv")
+        output_bytes = _output_size(result)
+        rows = None
+    seconds = time.perf_counter() - started
+    if resource is None:
+        peak, method = tracemalloc.get_traced_memory()[1], 'tracemalloc'
+    else:
+        peak, method = _peak_rss(), 'rss'
+    return {'seconds': seconds, 'peak_memory_bytes': peak, 'memory_method': method,
+            'output_bytes': output_bytes, 'rows': rows}
+
+def measure(step, workdir, args, repeat=REPEAT):
+    """
+    Run a benchmark case repeatedly, each run in a new process.
+
+    The first run is reported separately, it includes building the caches
+    of the series store.
+
+    Parameters:
+        step (str): One of STEPS.
+        workdir (str): Working directory with data_parsed for the run.
+        args: Arguments of the step.
+        repeat (int): Number of runs.
+
+    Returns:
+        dict: 'seconds' (fastest run), 'first_seconds', 'peak_memory_bytes' (highest),
+        'memory_method', 'output_bytes' and 'rows'.
+    """
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            runs.append(executor.submit(_run_step, step, workdir, args).result())
+    result = dict(runs[-1])
+    result['seconds'] = min(run['seconds'] for run in runs)
+    result['first_seconds'] = runs[0]['seconds']
+    result['peak_memory_bytes'] = max(run['peak_memory_bytes'] for run in runs)
+    return result
+
+def cases(workdir, raw_dir, folders, steps=STEPS):
+    """
+    Yield the benchmark cases of one scaled day.
+
+    Parameters:
+        workdir (str): Working directory; the parser writes into workdir/data_parsed.
+        raw_dir (str): Directory with the (replicated) raw exports.
+        folders (list): Day folders of the scaled day.
+        steps (list): Steps to run.
+
+    Yields:
+        tuple: (step, case name, arguments); the parser case always comes first.
+    """
+    # Parser se spouští vždy, ostatní kroky pracují s jeho výstupem
+    yield 'parser', 'all', (folders, raw_dir, os.path.join(workdir, 'data_parsed'))
+    files = parsed_files(os.path.join(workdir, 'data_parsed'))
+    others = [file for file in files if file != REFERENCE]
+    if 'plot_figure' in steps:
+        yield 'plot_figure', 'all', (files, REFERENCE if REFERENCE in files else None)
+        if REFERENCE in files:
+            for file in others:
+                yield 'plot_figure', f"{REFERENCE}+{file}", ([REFERENCE, file], REFERENCE)
+    if 'process_files' in steps:
+        yield 'process_files', 'all', files
+    if 'plot_calibrated_data' in steps and REFERENCE in files:
+        for file in others:
+            yield 'plot_calibrated_data', f"{REFERENCE}+{file}", (REFERENCE, file)
+
+def git_commit():
+    """
+    Return the current commit and whether the working tree has uncommitted changes.
+
+    Returns:
+        tuple: (commit hash or None outside a git repository, dirty flag).
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
+
+def run_benchmark(raw_dir=RAW_DIR, folders=None, scales=SCALES, steps=STEPS, repeat=REPEAT, keep=None):
+    """
+    Run all benchmark cases for every day folder and scale.
+
+    Parameters:
+        raw_dir (str): Directory with the raw exports.
+        folders (list): Day folders (default: all folders in raw_dir).
+        scales (list): Number of copies of each day.
+        steps (list): Steps to run besides the parser.
+        repeat (int): Number of runs of each case.
+        keep (str): Keep the generated data in this directory (default: temporary, deleted).
+
+    Returns:
+        dict: Run record with 'commit', 'dirty', 'date', 'python', 'platform' and 'results'.
+    """
+    folders = folders or sorted(name for name in os.listdir(raw_dir) if os.path.isdir(os.path.join(raw_dir, name)))
+    commit, dirty = git_commit()
+    record = {
+        'commit': commit,
+        'dirty': dirty,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': [],
+    }
+    workspace = keep or tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        for scale in scales:
+            for folder in folders:
+                workdir = os.path.join(os.path.abspath(workspace), f"x{scale}", folder)
+                os.makedirs(workdir, exist_ok=True)
+                if scale == 1:
+                    scaled_raw, scaled_folders = os.path.abspath(raw_dir), [folder]
+                else:
+                    scaled_raw = os.path.join(workdir, 'data_raw')
+                    scaled_folders = replicate_folder(raw_dir, folder, scale, scaled_raw)
+                for step, case, args in cases(workdir, scaled_raw, scaled_folders, steps):
+                    result = measure(step, workdir, args, repeat)
+                    result.update({'step': step, 'case': case, 'folder': folder, 'scale': scale})
+                    record['results'].append(result)
+                    print_result(result)
+    finally:
+        if keep is None:
+            shutil.rmtree(workspace, ignore_errors=True)
+    return record
+
+def load_history(history_file=HISTORY_FILE):
+    """Load the list of previous runs (empty if the file does not exist)."""
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, mode="r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_history(history, history_file=HISTORY_FILE):
+    tmp_path = f"{history_file}.tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, history_file)
+
+def compare(previous, current):
+    """
+    Compare two runs case by case.
+
+    Parameters:
+        previous (dict): Older run record.
+        current (dict): Newer run record.
+
+    Returns:
+        list: Dicts with 'step', 'case', 'folder', 'scale' and relative changes of
+        'seconds' and 'peak_memory_bytes' (0.1 = 10 % more); only cases present in both runs.
+    """
+    def key(result):
+        return result['step'], result['case'], result['folder'], result['scale']
+
+    old = {key(result): result for result in previous['results']}
+    changes = []
+    for result in current['results']:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        change = dict(zip(('step', 'case', 'folder', 'scale'), key(result)))
+        for name in ('seconds', 'peak_memory_bytes'):
+            change[name] = result[name] / before[name] - 1 if before[name] else None
+        changes.append(change)
+    return changes
+
+def print_result(result):
+    print(f"{result['step']} [{result['folder']} x{result['scale']}, {result['case']}]: "
+          f"{result['seconds']:.3f} s (první běh {result['first_seconds']:.3f} s), "
+          f"paměť {result['peak_memory_bytes'] / 2**20:.1f} MB ({result['memory_method']}), "
+          f"výstup {result['output_bytes'] / 1024:.1f} kB")
+
+def print_comparison(changes, previous):
+    print(f"Porovnání s během {(previous['commit'] or '?')[:10]} ({previous['date']}):")
+    for change in changes:
+        parts = [f"{name} {change[name]:+.1%}" for name in ('seconds', 'peak_memory_bytes') if change[name] is not None]
+        print(f"  {change['step']} [{change['folder']} x{change['scale']}, {change['case']}]: {', '.join(parts)}")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark parsing, plotting and calibration on the raw exports, scaled up by replicating days.")
+    arg_parser.add_argument('--raw-dir', default=RAW_DIR)
+    arg_parser.add_argument('--folders', nargs='+', help="Day folders in the raw directory (default: all).")
+    arg_parser.add_argument('--scales', nargs='+', type=int, default=list(SCALES), help="Number of copies of each day.")
+    arg_parser.add_argument('--steps', nargs='+', choices=STEPS[1:], default=STEPS[1:], help="Steps besides the parser.")
+    arg_parser.add_argument('--repeat', type=int, default=REPEAT)
+    arg_parser.add_argument('--history', default=HISTORY_FILE, help="JSON file with the results of previous runs.")
+    arg_parser.add_argument('--no-save', action='store_true', help="Do not append this run to the history.")
+    arg_parser.add_argument('--keep', help="Keep the generated data in this directory.")
+    args = arg_parser.parse_args()
+
+    record = run_benchmark(args.raw_dir, args.folders, args.scales, ['parser'] + args.steps, args.repeat, args.keep)
+    history = load_history(args.history)
+    if history:
+        print_comparison(compare(history[-1], record), history[-1])
+    if not args.no_save:
+        history.append(record)
+        save_history(history, args.history)
+        print(f"Výsledky uloženy do {args.history}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+# Nejmenší pokrytí bloku (podíl očekávaného počtu vzorků), se kterým se blok páruje s jiným senzorem
+MIN_COVERAGE = 0.5
+
+def sampling_interval(timestamp):
+    """
+    Return the typical sampling interval of a series.
+
+    Parameters:
+        timestamp (np.ndarray): Sorted epoch seconds.
+
+    Returns:
+        float: Median interval between samples in seconds (NaN for fewer than two samples).
+    """
+    timestamp = np.asarray(timestamp)
+    if len(timestamp) < 2:
+        return np.nan
+    return float(np.median(np.diff(timestamp)))
+
+def coverage(count, duration, interval):
+    """
+    Return the share of expected samples present in blocks.
+
+    A block of length duration always contains floor(duration / interval)
+    samples of a regularly sampled sensor, whatever the phase of the samples;
+    that is the expected count (at least one).
+
+    Parameters:
+        count (np.ndarray): Number of samples in each block.
+        duration (np.ndarray): Block lengths in seconds.
+        interval (float): Sampling interval of the sensor in seconds.
+
+    Returns:
+        np.ndarray: count / expected count, at most 1 (NaN if the interval is unknown).
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = np.maximum(np.floor(np.asarray(duration, dtype=np.float64) / interval), 1.0)
+        return np.minimum(np.asarray(count) / expected, 1.0)
+
+def block_stats(timestamp, values, starts, ends, interval=None):
+    """
+    Compute the count, mean, standard deviation and coverage of values in many time blocks.
+
+    The cumulative count, sum and sum of squares of the samples are built
+    once; each block is then two binary searches and a difference of prefix
+    sums, so the cost is O(rows + blocks log rows). Blocks may be in any order
+    and may overlap. Missing values (NaN) are skipped per column.
+
+    Parameters:
+        timestamp (np.ndarray): Sorted epoch seconds of the samples.
+        values (np.ndarray): Values (sample) or a 2-D array (sample x column).
+        starts (np.ndarray): Block starts in epoch seconds.
+        ends (np.ndarray): Block ends in epoch seconds (exclusive).
+        interval (float): Sampling interval for the coverage (None = sampling_interval(timestamp)).
+
+    Returns:
+        dict: 'count', 'mean', 'std' (sample standard deviation) and 'coverage' arrays (block),
+        or (column x block) for 2-D values; blocks without samples have NaN mean.
+    """
+    timestamp = np.asarray(timestamp)
+    values = np.asarray(values, dtype=np.float64)
+    single = values.ndim == 1
+    if single:
+        values = values[:, None]
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if interval is None:
+        interval = sampling_interval(timestamp)
+
+    valid = ~np.isnan(values)
+    # Posun o průměr sloupce omezí ztrátu přesnosti v součtu čtverců
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift = np.where(valid.any(axis=0), np.nansum(values, axis=0) / valid.sum(axis=0), 0.0)
+    centered = np.where(valid, values - shift, 0.0)
+    zero = np.zeros((1, values.shape[1]))
+    prefix_count = np.concatenate((zero, np.cumsum(valid, axis=0)))
+    prefix_sum = np.concatenate((zero, np.cumsum(centered, axis=0)))
+    prefix_square = np.concatenate((zero, np.cumsum(centered ** 2, axis=0)))
+
+    lo = np.searchsorted(timestamp, starts, side='left')
+    hi = np.searchsorted(timestamp, ends, side='left')
+    count = (prefix_count[hi] - prefix_count[lo]).T
+    total = (prefix_sum[hi] - prefix_sum[lo]).T
+    square = (prefix_square[hi] - prefix_square[lo]).T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = np.maximum(square - total * mean, 0.0) / (count - 1)
+    result = {
+        'count': count.astype(np.int64),
+        'mean': mean + shift[:, None],
+        'std': np.where(count > 1, np.sqrt(variance), np.nan),
+        'coverage': coverage(count, ends - starts, interval),
+    }
+    if single:
+        return {name: stat[0] for name, stat in result.items()}
+    return result
+
+def join_blocks(tables, columns=('temp',), on='datetime', min_coverage=MIN_COVERAGE, suffixes=None):
+    """
+    Join the block tables of several sensors on exact block identity.
+
+    Only blocks present in all tables are kept (no nearest-time matching), and
+    a channel value is set to NaN where the coverage of that sensor's block is
+    below min_coverage, so a gap in one sensor never pairs with another block.
+
+    Parameters:
+        tables (list): DataFrames with the block key, '<column>' means and '<column>_coverage'.
+        columns (tuple): Joined channels.
+        on (str): Block key column (e.g. block start in epoch seconds).
+        min_coverage (float): Smallest accepted coverage of a block.
+        suffixes (list): Suffix of the columns of each table (default '_1', '_2', ...).
+
+    Returns:
+        pd.DataFrame: The block key and '<column><suffix>' for every table and channel, sorted by the key.
+    """
+    columns = list(columns)
+    suffixes = suffixes or [f'_{i + 1}' for i in range(len(tables))]
+    joined = None
+    for table, suffix in zip(tables, suffixes):
+        part = pd.DataFrame({on: table[on].to_numpy()})
+        for column in columns:
+            part[f'{column}{suffix}'] = np.where(table[f'{column}_coverage'].to_numpy() >= min_coverage,
+                                                 table[column].to_numpy(), np.nan)
+        joined = part if joined is None else joined.merge(part, on=on, how='inner')
+    return joined.sort_values(on, ignore_index=True)
@@ -0,0 +1,227 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+if not __package__:
+    from tools import validate_files, parse_time_ranges
+    from series_store import time_ranges_on_day, parsed_files, CHANNELS
+    from dataset import Dataset
+    from plateau import detect_blocks
+    from blocks import block_stats, coverage, sampling_interval, MIN_COVERAGE
+    from alignment import sensor_offsets
+    from uncertainty import fit_uncertainty, BOOTSTRAP_SAMPLES
+else:
+    from modules.tools import validate_files, parse_time_ranges
+    from modules.series_store import time_ranges_on_day, parsed_files, CHANNELS
+    from modules.dataset import Dataset
+    from modules.plateau import detect_blocks
+    from modules.blocks import block_stats, coverage, sampling_interval, MIN_COVERAGE
+    from modules.alignment import sensor_offsets
+    from modules.uncertainty import fit_uncertainty, BOOTSTRAP_SAMPLES
+
+# Výchozí referenční senzor (Memmert) a ustálené bloky komory
+REFERENCE = "klarka"
+TIME_BLOCKS = [
+    ("16:25:00", "16:35:00"),
+    ("16:55:00", "17:15:00"),
+    ("17:35:00", "17:45:00"),
+    ("18:05:00", "18:15:00"),
+    ("18:35:00", "18:45:00"),
+    ("19:05:00", "19:15:00")
+]
+
+def block_edges(reference_path, blocks):
+    """
+    Convert local time blocks to epoch seconds (see series_store.time_ranges_on_day).
+
+    Parameters:
+        reference_path (str): Path to the parsed CSV file of the reference.
+        blocks (list): List of (start, end) 'HH:MM:SS' tuples on the first day of the reference
+            or 'YYYY-MM-DD HH:MM:SS' tuples.
+
+    Returns:
+        tuple: Start and end arrays in epoch seconds, sorted by start, and the indices
+        of blocks in that order.
+    """
+    if not blocks:
+        raise ValueError("No time blocks given.")
+    edges = time_ranges_on_day(reference_path, blocks)
+    if edges is None:
+        raise ValueError(f"Reference file {reference_path} is empty.")
+    order = np.lexsort((edges[1], edges[0]))
+    starts, ends = edges[0][order], edges[1][order]
+    if np.any(starts[1:] < ends[:-1]):
+        raise ValueError("Time blocks must not overlap.")
+    return starts, ends, order
+
+def block_means(frames, starts, ends, column='temp'):
+    """
+    Average all sensors over the same time blocks (see blocks.block_stats).
+
+    Each sensor is summed once into prefix sums and every block is read from
+    them by two binary searches. Several columns share the binary searches;
+    each of them skips only its own missing values.
+
+    Parameters:
+        frames (list): DataFrames with 'timestamp' (sorted) and the columns, one per sensor.
+        starts (np.ndarray): Block starts in epoch seconds.
+        ends (np.ndarray): Block ends in epoch seconds (exclusive).
+        column (str or list): Averaged column, or a list of columns.
+
+    Returns:
+        tuple: Means and sample counts, 2-D arrays (sensor x block), or 3-D arrays
+        (column x sensor x block) for a list of columns; blocks without samples are NaN.
+    """
+    columns = [column] if isinstance(column, str) else list(column)
+    stats = [block_stats(frame['timestamp'].to_numpy(), frame[columns].to_numpy(dtype=np.float64), starts, ends)
+             for frame in frames]
+    means = np.stack([stat['mean'] for stat in stats], axis=1)
+    counts = np.stack([stat['count'] for stat in stats], axis=1)
+    if isinstance(column, str):
+        return means[0], counts[0]
+    return means, counts
+
+def fit_all(x, y):
+    """
+    Fit y = k * x + q for every sensor at once.
+
+    Blocks missing in x or y are left out of the fit of that sensor. The
+    design matrices of all sensors are stacked and solved by one batched
+    least squares (pseudo-inverse).
+
+    Parameters:
+        x (np.ndarray): Reference block means (block).
+        y (np.ndarray): Sensor block means (sensor x block).
+
+    Returns:
+        pd.DataFrame: k, q, r2, rmse, max_residual and plateaus per sensor (row order of y),
+        and the residuals (sensor x block) as a second value.
+    """
+    used = ~np.isnan(y) & ~np.isnan(x)[None, :]
+    weight = used.astype(np.float64)
+    design = np.stack([np.where(used, x[None, :], 0.0), weight], axis=2)
+    target = np.where(used, y, 0.0)
+    coef = np.matmul(np.linalg.pinv(design), target[:, :, None])[:, :, 0]
+
+    plateaus = used.sum(axis=1)
+    coef[plateaus < 2] = np.nan
+    k, q = coef[:, 0], coef[:, 1]
+    residuals = np.where(used, y - (k[:, None] * x[None, :] + q[:, None]), np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ss_res = np.nansum(residuals ** 2, axis=1)
+        mean_y = np.nansum(target, axis=1) / plateaus
+        ss_tot = np.sum(weight * (target - mean_y[:, None]) ** 2, axis=1)
+        r2 = 1 - ss_res / ss_tot
+        rmse = np.sqrt(ss_res / plateaus)
+    max_residual = np.where(used, np.abs(residuals), -np.inf).max(axis=1, initial=-np.inf)
+    max_residual[plateaus < 2] = np.nan
+
+    fits = pd.DataFrame({'k': k, 'q': q, 'r2': r2, 'rmse': rmse, 'max_residual': max_residual, 'plateaus': plateaus})
+    fits.loc[plateaus < 2, ['r2', 'rmse']] = np.nan
+    return fits, residuals
+
+def calibrate(reference, sensors, blocks=TIME_BLOCKS, column='temp', min_coverage=MIN_COVERAGE, align=False,
+              bootstrap_samples=BOOTSTRAP_SAMPLES, workers=1):
+    """
+    Calibrate sensors against the reference over the same time blocks.
+
+    The reference is loaded once; each sensor is read only within the time
+    span covered by the blocks. Several columns (channels) are averaged in one
+    pass over the same blocks and fitted one after another.
+
+    Parameters:
+        reference (str): Reference file name without extension.
+        sensors (list): Sensor file names without extensions.
+        blocks (list): List of (start, end) 'HH:MM:SS' tuples on the first day of the reference
+            or 'YYYY-MM-DD HH:MM:SS' tuples, or 'auto' to detect the stable blocks of the
+            reference (modules/plateau.py, on the first column).
+        column (str or list): Calibrated column, or a list of columns (e.g. series_store.CHANNELS).
+        min_coverage (float): Blocks of a sensor with a smaller share of its expected samples
+            (see blocks.coverage) are left out of its fit.
+        align (bool): Shift the sensor times by their clock offsets against the reference
+            (modules/alignment.py) before averaging; the offsets are added to the fits as 'time_offset'.
+        bootstrap_samples (int): Number of bootstrap resamples for the confidence intervals of k and q
+            and the prediction band (modules/uncertainty.py; 0 = no intervals).
+        workers (int): Number of worker processes of the bootstrap (1 = no pool, None = number of CPUs).
+
+    Returns:
+        tuple: Table of fits indexed by sensor (sensor ≈ k * reference + q) and a table
+        of block means (reference and sensors) with the residuals of every sensor. For a list
+        of columns the fits are indexed by (channel, sensor) and the block table has one
+        '<name>_<channel>' column per sensor and channel.
+    """
+    columns = [column] if isinstance(column, str) else list(column)
+    sensors = [sensor for sensor in sensors if sensor != reference]
+    if not sensors:
+        raise ValueError("No sensors to calibrate.")
+    reference_path = validate_files([reference])[0]
+    if blocks == 'auto':
+        blocks = detect_blocks(reference_path, columns[0])
+    starts, ends, order = block_edges(reference_path, blocks)
+    # Bloky v časovém pořadí (blok přes půlnoc je až za bloky téhož večera)
+    blocks = [blocks[i] for i in order]
+    offsets = sensor_offsets(reference, sensors, (int(starts[0]), int(ends[-1])), columns[0]) if align else {}
+    dataset = Dataset([reference] + sensors, (int(starts[0]), int(ends[-1])), offsets=offsets)
+
+    frames = [dataset.frame(path) for path in dataset.file_paths]
+    means, counts = block_means(frames, starts, ends, columns)
+    # Bloky s mezerou v datech senzoru (nebo reference) se do fitu nepočítají
+    intervals = np.array([sampling_interval(frame['timestamp'].to_numpy()) for frame in frames])
+    covered = coverage(counts, (ends - starts)[None, None, :], intervals[None, :, None])
+    means = np.where(covered >= min_coverage, means, np.nan)
+
+    labels = [f"{start}-{end}" for start, end in blocks]
+    table = pd.DataFrame({'block': labels})
+    all_fits = []
+    for c, channel in enumerate(columns):
+        fits, residuals = fit_all(means[c, 0], means[c, 1:])
+        fits.index = pd.Index(sensors, name='sensor')
+        if align:
+            fits['time_offset'] = [offsets[sensor] for sensor in sensors]
+        if bootstrap_samples:
+            uncertainty = pd.DataFrame([fit_uncertainty(means[c, 0], means[c, i + 1], bootstrap_samples, workers=workers)
+                                      for i in range(len(sensors))], index=fits.index)
+            fits = fits.join(uncertainty[['k_low', 'k_high', 'q_low', 'q_high', 'band', 'within_tolerance']])
+        all_fits.append(fits)
+        suffix = f'_{channel}' if len(columns) > 1 else ''
+        table[f'{reference}{suffix}'] = means[c, 0]
+        table[f'samples{suffix}'] = counts[c, 0]
+        for i, sensor in enumerate(sensors):
+            table[f'{sensor}{suffix}'] = means[c, i + 1]
+            table[f'{sensor}{suffix}_coverage'] = covered[c, i + 1]
+            table[f'{sensor}{suffix}_residual'] = residuals[i]
+    if len(columns) == 1:
+        return all_fits[0], table
+    return pd.concat(all_fits, keys=columns, names=['channel', 'sensor']), table
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Calibrate sensors against the reference over stable time blocks.")
+    arg_parser.add_argument('--reference', default=REFERENCE, help=f"Reference file name without extension (default: {REFERENCE}).")
+    arg_parser.add_argument('--sensors', nargs='+', help="Sensor file names without extensions (default: all parsed files).")
+    arg_parser.add_argument('--blocks', help="Time blocks 'HH:MM:SS-HH:MM:SS, ...' or 'auto' (default: TIME_BLOCKS).")
+    arg_parser.add_argument('--channels', nargs='+', default=['temp'], choices=CHANNELS, help="Calibrated channels (default: temp).")
+    arg_parser.add_argument('--min-coverage', type=float, default=MIN_COVERAGE, help=f"Smallest share of expected samples in a block (default: {MIN_COVERAGE}).")
+    arg_parser.add_argument('--align', action='store_true', help="Align sensor clocks to the reference (modules/alignment.py).")
+    arg_parser.add_argument('--bootstrap', type=int, default=BOOTSTRAP_SAMPLES, help=f"Bootstrap resamples for confidence intervals, 0 = none (default: {BOOTSTRAP_SAMPLES}).")
+    arg_parser.add_argument('--workers', type=int, default=1, help="Worker processes of the bootstrap (default: 1, 0 = all CPUs).")
+    arg_parser.add_argument('--output', help="Save the table of fits to this CSV file.")
+    args = arg_parser.parse_args()
+
+    sensors = args.sensors or parsed_files()
+    if args.blocks == 'auto':
+        blocks = 'auto'
+    else:
+        blocks = parse_time_ranges(args.blocks) if args.blocks else TIME_BLOCKS
+    fits, table = calibrate(args.reference, sensors, blocks, args.channels if len(args.channels) > 1 else args.channels[0],
+                           args.min_coverage, args.align, args.bootstrap, args.workers or None)
+
+    print(table.round(3).to_string(index=False))
+    print()
+    print(fits.round(4).to_string())
+    if args.output:
+        fits.to_csv(args.output)
+        print(f"Saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import time
+
+class Dataset:
+    """
+    Sensors selected for one request, each loaded once with all its columns.
+
+    The same object is passed to the plotting and the sampling interval code,
+    so a file is read from the series store only once per request. Bytes read
+    and load time are recorded per file.
+    """
+
+    def __init__(self, files, time_range=None, reader=None, offsets=None):
+        """
+        Parameters:
+            files (list): List of file names without extensions.
+            time_range (tuple): Start and end in epoch seconds (None = whole files).
+            reader (callable): reader(file_path, start, end) returning columns like
+                series_store.read_range (e.g. IngestService.read_range for live data).
+            offsets (dict): File name -> clock offset in whole seconds added to its times
+                (see modules/alignment.py); time_range applies to the shifted times.
+        """
+        self.files = files
+        self.file_paths = validate_files(files)
+        self.time_range = time_range
+        self.reader = reader or read_range
+        self.offsets = offsets or {}
+        self._frames = {}
+        self.stats = {}
+
+    def frame(self, file_path):
+        """
+        Return the data of one selected file, loading it on first use.
+
+        Parameters:
+            file_path (str): Path to the parsed CSV file (one of file_paths).
+
+        Returns:
+            pd.DataFrame: 'date_time' and all numeric columns; do not modify it in place.
+        """
+        if file_path not in self._frames:
+            started = time.perf_counter()
+            start, end = self.time_range or (None, None)
+            offset = self.offsets.get(os.path.splitext(os.path.basename(file_path))[0], 0)
+            if offset:
+                start, end = (None if start is None else start - offset), (None if end is None else end - offset)
+            columns = self.reader(file_path, start, end)
+            data = frame_from_columns(dict(columns, timestamp=columns['timestamp'] + offset) if offset else columns)
+            self.stats[os.path.basename(file_path)] = {
+                'rows': len(data),
+                'bytes_read': int(sum(values.nbytes for values in columns.values())),
+                'seconds': time.perf_counter() - started,
+            }
+            self._frames[file_path] = data
+        return self._frames[file_path]
+
+    def summary(self):
+        """
+        Return the totals of the loaded files.
+
+        Returns:
+            dict: 'files', 'rows', 'bytes_read' and 'seconds'.
+        """
+        return {
+            'files': len(self.stats),
+            'rows': sum(file_stats['rows'] for file_stats in self.stats.values()),
+            'bytes_read': sum(file_stats['bytes_read'] for file_stats in self.stats.values()),
+            'seconds': sum(file_stats['seconds'] for file_stats in self.stats.values()),
+        }
+
+# Importováno i ze skriptů spouštěných přímo ze složky modules (bez balíčku)
+if not __package__:
+    from tools import validate_files
+    from series_store import read_range, frame_from_columns
+else:
+    from modules.tools import validate_files
+    from modules.series_store import read_range, frame_from_columns
@@ -0,0 +1,260 @@
+import argparse
+import contextlib
+import csv
+import glob
+import io
+import json
+import os
+import re
+import time
+from typing import Any, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if not __package__:
+    from parser import parse_payload, replace_dot_with_comma, RAW_DIR
+else:
+    from modules.parser import parse_payload, replace_dot_with_comma, RAW_DIR
+
+# Registr dekodérů: (regulární výraz topiku, dekodér)
+DECODERS = []
+# Dekodér vrací FALLBACK, pokud si payloadem není jistý; použije se pak parse_payload
+FALLBACK = object()
+
+def register(pattern):
+    """
+    Register a decoder for topics matching a regular expression.
+
+    The decoder gets the payload string and returns the same result as
+    parse_payload, or FALLBACK to let parse_payload decide.
+    """
+    def decorator(decoder):
+        DECODERS.append((re.compile(pattern), decoder))
+        return decoder
+    return decorator
+
+# Memmert: slovník ve formátu Pythonu; čtou se jen 4 klíče, zbytek payloadu se neparsuje
+MEMMERT_FIELDS = re.compile(r"'(CO2Read|HumRead|Temp1Read|DoorOpen)': ([^,}]+)")
+# Tokeny, se kterými by json.loads v parse_payload selhal nebo dal jiný výsledek
+# (nejdřív rychlé hledání podřetězců, regulární výraz jen pokud se některý najde)
+MEMMERT_UNSAFE = re.compile(r'"|\\|[:,\[] ?(?:-?inf|nan|True|False)\b')
+NUMBER = re.compile(r'-?\d+(\.\d+)?([eE][-+]?\d+)?$')
+
+def _memmert_value(token):
+    """Convert a value of the Python dict literal as json.loads would after fix_json_format."""
+    if token == 'None':
+        return None
+    if len(token) >= 2 and token[0] == "'" and token[-1] == "'":
+        return token[1:-1].replace('None', 'null')
+    number = NUMBER.match(token)
+    if number is None:
+        return FALLBACK
+    # Stejný typ jako z json.loads: celé číslo bez desetinné části a exponentu
+    return int(token) if number.group(1) is None and number.group(2) is None else float(token)
+
+@register(r'^/klimakomora/memmert')
+def decode_memmert(payload):
+    text = payload.strip('"')
+    if not text.startswith('{') or not text.endswith('}'):
+        return FALLBACK
+    suspect = ('"' in text or '\\' in text or 'True' in text or 'False' in text
+               or 'nan' in text or 'inf' in text)
+    if suspect and MEMMERT_UNSAFE.search(text):
+        return FALLBACK
+    values = {}
+    for key, token in MEMMERT_FIELDS.findall(text):
+        value = _memmert_value(token.strip())
+        if value is FALLBACK:
+            return FALLBACK
+        values[key] = value
+    co2 = replace_dot_with_comma(values.get("CO2Read", "N/A"))
+    humidity = replace_dot_with_comma(values.get("HumRead", "N/A"))
+    temp = replace_dot_with_comma(values.get("Temp1Read", "N/A"))
+    if "N/D" in [co2, humidity, temp]:
+        return FALLBACK  # Řádek se zahodí v parse_payload (včetně výpisu)
+    return {
+        "co2": co2,
+        "humidity": humidity,
+        "temp": temp,
+        "door_open": values.get("DoorOpen", "N/A"),
+    }
+
+if msgspec is not None:
+    # Schéma zprávy TTN jen s potřebnými poli, ostatní klíče dekodér přeskočí
+    class DecodedPayload(msgspec.Struct):
+        decoded: Union[dict, msgspec.UnsetType] = msgspec.UNSET
+        msg: Union[str, msgspec.UnsetType] = msgspec.UNSET
+
+    class UplinkMessage(msgspec.Struct):
+        decoded_payload: Union[DecodedPayload, msgspec.UnsetType] = msgspec.UNSET
+
+    class TTNMessage(msgspec.Struct):
+        uplink_message: Union[UplinkMessage, msgspec.UnsetType] = msgspec.UNSET
+        CO2Read: Any = msgspec.UNSET
+
+    _ttn_decoder = msgspec.json.Decoder(TTNMessage)
+
+def _decoded_payload(payload):
+    """Return the 'decoded_payload' of a TTN message as a dict, None to drop the row, or FALLBACK."""
+    # Úpravy z fix_json_format by změnily obsah, takové payloady řeší parse_payload
+    if not payload.startswith('{') or not payload.endswith('}') or "'" in payload or "None" in payload:
+        return FALLBACK
+    if msgspec is None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return FALLBACK
+        if not isinstance(message, dict) or "CO2Read" in message or "uplink_message" not in message:
+            return FALLBACK
+        uplink = message["uplink_message"]
+        if not isinstance(uplink, dict):
+            return FALLBACK
+        if "decoded_payload" not in uplink:
+            return None
+        decoded_payload = uplink["decoded_payload"]
+        return decoded_payload if isinstance(decoded_payload, dict) else FALLBACK
+
+    try:
+        message = _ttn_decoder.decode(payload)
+    except (msgspec.DecodeError, msgspec.ValidationError):
+        return FALLBACK
+    if message.CO2Read is not msgspec.UNSET or message.uplink_message is msgspec.UNSET:
+        return FALLBACK
+    decoded_payload = message.uplink_message.decoded_payload
+    if decoded_payload is msgspec.UNSET:
+        return None
+    result = {}
+    if decoded_payload.decoded is not msgspec.UNSET:
+        result["decoded"] = decoded_payload.decoded
+    if decoded_payload.msg is not msgspec.UNSET:
+        result["msg"] = decoded_payload.msg
+    return result
+
+@register(r'^/ttndata/eui-24e124[0-9a-f]+-\d+$')
+def decode_milesight(payload):
+    """Milesight em300-th: temperature and humidity in 'decoded'."""
+    decoded_payload = _decoded_payload(payload)
+    if decoded_payload is None or decoded_payload is FALLBACK:
+        return decoded_payload
+    decoded = decoded_payload.get("decoded")
+    if not isinstance(decoded, dict):
+        return FALLBACK
+    return {
+        "co2": "null",
+        "humidity": replace_dot_with_comma(decoded.get("humidity", "N/A")),
+        "temp": replace_dot_with_comma(decoded.get("temperature", "N/A")),
+    }
+
+@register(r'^/ttndata/eui-[0-9a-f]+-co-\d+$')
+@register(r'^/ttndata/senzory/wifi/co2/\d+$')
+def decode_co2_msg(payload):
+    """CO2 sensors (LoRa and wifi): 'id;co2;temp;humidity' in 'msg'."""
+    decoded_payload = _decoded_payload(payload)
+    if decoded_payload is None or decoded_payload is FALLBACK:
+        return decoded_payload
+    if "decoded" in decoded_payload or not isinstance(decoded_payload.get("msg"), str):
+        return FALLBACK
+    msg_parts = decoded_payload["msg"].split(';')
+    if len(msg_parts) < 4:
+        return FALLBACK
+    return {
+        "co2": replace_dot_with_comma(msg_parts[1]),
+        "humidity": replace_dot_with_comma(msg_parts[3]),
+        "temp": replace_dot_with_comma(msg_parts[2]),
+    }
+
+_topic_decoders = {}
+
+def find_decoder(topic):
+    """
+    Return the registered decoder of a topic (the lookup is cached per topic).
+
+    Parameters:
+        topic (str): Topic of the row.
+
+    Returns:
+        callable: Decoder, or None for an unknown topic.
+    """
+    if topic not in _topic_decoders:
+        _topic_decoders[topic] = next((decoder for pattern, decoder in DECODERS if pattern.match(topic or '')), None)
+    return _topic_decoders[topic]
+
+def decode_payload(file, row):
+    """
+    Decode the payload of a raw row; same result as parse_payload, faster for known topics.
+
+    Parameters:
+        file (str): File name without extension.
+        row (dict): Raw row with 'topic' and 'payload'.
+
+    Returns:
+        dict: 'co2', 'humidity', 'temp' (and 'door_open' for the Memmert chamber), or None to drop the row.
+    """
+    # parse_payload bere soubor klarka vždy jako Memmert bez ohledu na topik
+    decoder = decode_memmert if file == "klarka" else find_decoder(row.get("topic"))
+    if decoder is not None and row.get("payload"):
+        result = decoder(row["payload"])
+        if result is not FALLBACK:
+            return result
+    return parse_payload(file, row)
+
+def benchmark(raw_dir=RAW_DIR, repeat=3):
+    """
+    Compare parse_payload and decode_payload on all raw exports.
+
+    Parameters:
+        raw_dir (str): Directory with the raw exports.
+        repeat (int): Number of runs; the fastest one is reported.
+
+    Returns:
+        dict: Decoder kind -> {'rows', 'parse_payload', 'decode_payload' (rows/s), 'speedup', 'mismatches'}.
+    """
+    # Použije se stejný název souboru jako v parser.py (klarka podle názvu, ostatní podle topiku)
+    groups = {}
+    for path in sorted(glob.glob(os.path.join(raw_dir, '*', '*.csv'))):
+        file = os.path.splitext(os.path.basename(path))[0]
+        with open(path, mode="r", encoding="utf-8-sig", newline="") as infile:
+            for row in csv.DictReader(infile):
+                decoder = decode_memmert if file == "klarka" else find_decoder(row["topic"])
+                kind = decoder.__name__ if decoder is not None else 'unknown'
+                groups.setdefault(kind, []).append((file, row))
+
+    def rate(function, rows):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            # Výpisy chyb parse_payload se do měření nepočítají
+            with contextlib.redirect_stdout(io.StringIO()):
+                for file, row in rows:
+                    function(file, dict(row))
+            seconds = time.perf_counter() - started
+            best = seconds if best is None else min(best, seconds)
+        return len(rows) / best if best > 0 else float('inf')
+
+    results = {}
+    for kind, rows in groups.items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            mismatches = sum(parse_payload(file, dict(row)) != decode_payload(file, dict(row)) for file, row in rows)
+        original = rate(parse_payload, rows)
+        fast = rate(decode_payload, rows)
+        results[kind] = {'rows': len(rows), 'parse_payload': original, 'decode_payload': fast,
+                         'speedup': fast / original, 'mismatches': mismatches}
+    return results
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the payload decoders against parse_payload.")
+    arg_parser.add_argument('--raw-dir', default=RAW_DIR)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    print(f"JSON dekodér: {'msgspec' if msgspec is not None else 'json'}")
+    for kind, result in benchmark(args.raw_dir, args.repeat).items():
+        print(f"{kind}: {result['rows']} řádků, parse_payload {result['parse_payload']:.0f} řádků/s, "
+              f"decode_payload {result['decode_payload']:.0f} řádků/s, zrychlení {result['speedup']:.1f}x, "
+              f"rozdílů {result['mismatches']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import numpy as np
+
+# Výchozí maximální počet bodů jedné stopy v grafu
+MAX_POINTS = 2000
+
+def lttb_indices(x, y, threshold):
+    """
+    Select points with the Largest-Triangle-Three-Buckets algorithm.
+
+    Parameters:
+        x (np.ndarray): Sorted x values (numeric).
+        y (np.ndarray): Values; NaN points are never selected.
+        threshold (int): Maximum number of selected points (at least 3).
+
+    Returns:
+        np.ndarray: Indices of the selected points in increasing order.
+    """
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if n <= threshold or threshold < 3:
+        return valid
+    xv = np.asarray(x, dtype=np.float64)[valid]
+    yv = np.asarray(y, dtype=np.float64)[valid]
+
+    # První a poslední bod zůstávají, zbytek se dělí do threshold - 2 skupin
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Průměry skupin (pro "další" bod trojúhelníku) přes kumulativní součty
+    cx = np.concatenate(([0.0], np.cumsum(xv)))
+    cy = np.concatenate(([0.0], np.cumsum(yv)))
+    counts = np.maximum(edges[1:] - edges[:-1], 1)
+    mean_x = (cx[edges[1:]] - cx[edges[:-1]]) / counts
+    mean_y = (cy[edges[1:]] - cy[edges[:-1]]) / counts
+    mean_x = np.append(mean_x[1:], xv[-1])
+    mean_y = np.append(mean_y[1:], yv[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        area = np.abs(
+            (xv[a] - mean_x[i]) * (yv[lo:hi] - yv[a])
+            - (xv[a] - xv[lo:hi]) * (mean_y[i] - yv[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return valid[np.unique(selected)]
+
+def min_max_indices(y, threshold):
+    """
+    Select the minimum and maximum of equally sized buckets.
+
+    Parameters:
+        y (np.ndarray): Values; NaN points are never selected.
+        threshold (int): Maximum number of selected points.
+
+    Returns:
+        np.ndarray: Indices of the selected points in increasing order.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    buckets = max(threshold // 2, 1)
+    if n <= threshold:
+        return np.flatnonzero(~np.isnan(y))
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    empty = np.isnan(padded).all(axis=1)
+    low = np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1) + offsets
+    high = np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1) + offsets
+    return np.unique(np.concatenate((low[~empty], high[~empty])))
+
+def select_points(x, y, max_points=MAX_POINTS, method='lttb'):
+    """
+    Choose which points of a trace to draw.
+
+    Parameters:
+        x (np.ndarray): Sorted x values (numeric).
+        y (np.ndarray): Values.
+        max_points (int): Maximum number of points (None = keep all).
+        method (str): 'lttb' (shape preserving) or 'minmax' (keeps every peak of a bucket).
+
+    Returns:
+        np.ndarray: Indices of the points to draw.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if max_points is None or len(y) <= max_points:
+        return np.arange(len(y))
+    if method == 'minmax':
+        return min_max_indices(y, max_points)
+    if method == 'lttb':
+        return lttb_indices(x, y, max_points)
+    raise ValueError(f"Unknown downsampling method: {method}")
@@ -0,0 +1,230 @@
+import argparse
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+if not __package__:
+    from tools import validate_files
+    from series_store import (load_series, epoch_to_local, find_sessions, range_fingerprint,
+                              parsed_files, load_table, save_table, SESSION_GAP)
+    from dataset import Dataset
+    from plateau import find_plateaus
+    from ploter import TOLERANCE
+    from calibration import block_means, fit_all, REFERENCE
+else:
+    from modules.tools import validate_files
+    from modules.series_store import (load_series, epoch_to_local, find_sessions, range_fingerprint,
+                                      parsed_files, load_table, save_table, SESSION_GAP)
+    from modules.dataset import Dataset
+    from modules.plateau import find_plateaus
+    from modules.ploter import TOLERANCE
+    from modules.calibration import block_means, fit_all, REFERENCE
+
+# Souhrnná tabulka fitů po sezeních (sezení viz series_store.find_sessions)
+# a délka klouzavých statistik (sezení)
+SUMMARY_FILE = "./drift_summary.csv"
+ROLLING_SESSIONS = 5
+
+COLUMNS = ['reference', 'sensor', 'session', 'session_start', 'session_end', 'k', 'q', 'r2', 'rmse',
+           'max_residual', 'plateaus', 'offset', 'max_deviation', 'reference_samples', 'reference_last',
+           'sensor_samples', 'sensor_last']
+
+def session_fits(reference, sensors, start, end, column='temp'):
+    """
+    Calibrate sensors against the reference over the stable blocks of one session.
+
+    Parameters:
+        reference (str): Reference file name without extension.
+        sensors (list): Sensor file names without extensions.
+        start (int): Session start in epoch seconds.
+        end (int): Session end in epoch seconds (inclusive).
+        column (str): Calibrated column.
+
+    Returns:
+        pd.DataFrame: One row per sensor with k, q, r2, rmse, max_residual, plateaus,
+        offset (mean of sensor - reference over the blocks) and max_deviation
+        (largest |sensor - reference| of a block), indexed by sensor.
+    """
+    dataset = Dataset([reference] + sensors, (start, end))
+    frames = [dataset.frame(path) for path in dataset.file_paths]
+    reference_frame = frames[0]
+    plateaus = find_plateaus(reference_frame['timestamp'].to_numpy(), reference_frame[column].to_numpy())
+    if not plateaus:
+        fits = pd.DataFrame(np.nan, index=range(len(sensors)), columns=['k', 'q', 'r2', 'rmse', 'max_residual', 'offset', 'max_deviation'])
+        fits['plateaus'] = 0
+    else:
+        edges = np.array(plateaus, dtype=np.int64)
+        # Konec plateau je čas posledního vzorku, bloky v block_means mají konec otevřený
+        means, _ = block_means(frames, edges[:, 0], edges[:, 1] + 1, column)
+        fits, _ = fit_all(means[0], means[1:])
+        deviation = means[1:] - means[0][None, :]
+        used = ~np.isnan(deviation)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fits['offset'] = np.where(used, deviation, 0.0).sum(axis=1) / used.sum(axis=1)
+        fits['max_deviation'] = np.where(used, np.abs(deviation), -np.inf).max(axis=1, initial=-np.inf)
+        fits.loc[~used.any(axis=1), 'max_deviation'] = np.nan
+    fits.index = pd.Index(sensors, name='sensor')
+    return fits
+
+def load_summary(summary_file=SUMMARY_FILE):
+    """
+    Load the summary table of session fits.
+
+    Parameters:
+        summary_file (str): Path to the CSV file.
+
+    Returns:
+        pd.DataFrame: Summary table (empty with COLUMNS if the file does not exist).
+    """
+    return load_table(summary_file, COLUMNS)
+
+def save_summary(summary, summary_file=SUMMARY_FILE):
+    """Write the summary table to summary_file atomically."""
+    save_table(summary, summary_file)
+
+def update_summary(reference=REFERENCE, sensors=None, summary_file=SUMMARY_FILE, column='temp', gap=SESSION_GAP):
+    """
+    Fit every sensor in every session of the reference and store the results.
+
+    Only new sessions and sessions whose data changed (number of samples or the
+    last sample of the reference or the sensor) are computed; the other rows
+    are kept from the summary file.
+
+    Parameters:
+        reference (str): Reference file name without extension.
+        sensors (list): Sensor file names without extensions (default: all parsed files).
+        summary_file (str): Path to the summary CSV file (None = do not store).
+        column (str): Calibrated column.
+        gap (float): Minimal gap between sessions in seconds.
+
+    Returns:
+        tuple: Summary rows of the reference (sorted by sensor and session) and the number of computed rows.
+    """
+    if sensors is None:
+        sensors = parsed_files()
+    sensors = [sensor for sensor in sensors if sensor != reference]
+    reference_path = validate_files([reference])[0]
+    sensor_paths = dict(zip(sensors, validate_files(sensors)))
+
+    summary = load_summary(summary_file)
+    stored = {(row.reference, row.sensor, int(row.session_start)): row for row in summary.itertuples(index=False)}
+    rows = []
+    computed = 0
+    for start, end in find_sessions(load_series(reference_path)['timestamp'], gap):
+        reference_fingerprint = range_fingerprint(reference_path, start, end)
+        changed = []
+        for sensor, path in sensor_paths.items():
+            fingerprint = range_fingerprint(path, start, end)
+            if fingerprint[0] == 0:
+                continue
+            row = stored.get((reference, sensor, start))
+            if row is not None and (row.reference_samples, row.reference_last, row.sensor_samples, row.sensor_last) \
+                    == reference_fingerprint + fingerprint:
+                rows.append(row._asdict())
+            else:
+                changed.append((sensor, fingerprint))
+        if not changed:
+            continue
+
+        fits = session_fits(reference, [sensor for sensor, _ in changed], start, end, column)
+        session = epoch_to_local([start])[0].strftime('%Y-%m-%d %H:%M')
+        for sensor, fingerprint in changed:
+            rows.append(dict(fits.loc[sensor], reference=reference, sensor=sensor, session=session,
+                             session_start=start, session_end=end,
+                             reference_samples=reference_fingerprint[0], reference_last=reference_fingerprint[1],
+                             sensor_samples=fingerprint[0], sensor_last=fingerprint[1]))
+        computed += len(changed)
+
+    result = pd.DataFrame(rows, columns=COLUMNS).astype({'plateaus': 'int64'})
+    result = result.sort_values(['sensor', 'session_start'], ignore_index=True)
+    if summary_file:
+        # Řádky jiných referencí a senzorů mimo výběr zůstávají v souboru beze změny
+        others = summary[(summary['reference'] != reference) | ~summary['sensor'].isin(sensors)]
+        save_summary(pd.concat([others, result], ignore_index=True) if len(others) else result, summary_file)
+    return result, computed
+
+def sensor_health(summary, tolerance=TOLERANCE, window=ROLLING_SESSIONS):
+    """
+    Summarize the drift of every sensor over its sessions.
+
+    Parameters:
+        summary (pd.DataFrame): Rows from update_summary.
+        tolerance (float): Allowed deviation from the reference (°C).
+        window (int): Number of last sessions of the rolling statistics.
+
+    Returns:
+        pd.DataFrame: Per sensor: number of sessions, last offset and gain, rolling mean and
+        standard deviation of the offset and of the rmse, drift of the offset per 30 days
+        and 'flagged' (a block of the last session outside ±tolerance), indexed by sensor.
+    """
+    rows = {}
+    for sensor, sessions in summary.sort_values('session_start').groupby('sensor'):
+        last = sessions.iloc[-1]
+        recent = sessions.tail(window)
+        fitted = sessions.dropna(subset=['offset'])
+        days = (fitted['session_start'] - fitted['session_start'].iloc[0]) / 86400 if len(fitted) else None
+        drift = np.polyfit(days, fitted['offset'], 1)[0] * 30 if len(fitted) >= 2 and days.iloc[-1] > 0 else np.nan
+        rows[sensor] = {
+            'sessions': len(sessions),
+            'last_session': last['session'],
+            'k': last['k'],
+            'q': last['q'],
+            'offset': last['offset'],
+            'offset_mean': recent['offset'].mean(),
+            'offset_std': recent['offset'].std(),
+            'rmse_mean': recent['rmse'].mean(),
+            'drift_30d': drift,
+            'flagged': bool(last['max_deviation'] > tolerance),
+        }
+    return pd.DataFrame.from_dict(rows, orient='index').rename_axis('sensor')
+
+def plot_drift(summary, tolerance=TOLERANCE):
+    """
+    Plot the offset and the gain of every sensor over its sessions.
+
+    Parameters:
+        summary (pd.DataFrame): Rows from update_summary.
+        tolerance (float): Drawn band of allowed offsets (°C).
+
+    Returns:
+        go.Figure: Offset (with the ±tolerance band) and gain k against the session start.
+    """
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.08,
+                        subplot_titles=('Offset vůči referenci (°C)', 'Zesílení k'))
+    for sensor, sessions in summary.sort_values('session_start').groupby('sensor'):
+        time = epoch_to_local(sessions['session_start'])
+        fig.add_trace(go.Scatter(x=time, y=sessions['offset'], mode='lines+markers', name=sensor,
+                                 legendgroup=sensor, customdata=sessions[['max_deviation', 'plateaus']],
+                                 hovertemplate='%{x}<br>offset %{y:.3f} °C<br>max. odchylka %{customdata[0]:.3f} °C'
+                                               '<br>bloků %{customdata[1]}<extra>' + sensor + '</extra>'),
+                      row=1, col=1)
+        fig.add_trace(go.Scatter(x=time, y=sessions['k'], mode='lines+markers', name=sensor,
+                                 legendgroup=sensor, showlegend=False),
+                      row=2, col=1)
+    for limit in (-tolerance, tolerance):
+        fig.add_hline(y=limit, line=dict(dash='dash', color='red'), row=1, col=1)
+    fig.update_layout(title='Drift senzorů vůči referenci', hovermode='closest')
+    return fig
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Fit all sensors in every session and report their drift against the reference.")
+    arg_parser.add_argument('--reference', default=REFERENCE, help=f"Reference file name without extension (default: {REFERENCE}).")
+    arg_parser.add_argument('--sensors', nargs='+', help="Sensor file names without extensions (default: all parsed files).")
+    arg_parser.add_argument('--summary', default=SUMMARY_FILE, help=f"Summary CSV file (default: {SUMMARY_FILE}).")
+    arg_parser.add_argument('--tolerance', type=float, default=TOLERANCE, help=f"Allowed deviation in °C (default: {TOLERANCE}).")
+    arg_parser.add_argument('--plot', action='store_true', help="Show the drift plot.")
+    args = arg_parser.parse_args()
+
+    summary, computed = update_summary(args.reference, args.sensors, args.summary)
+    print(f"Sezení: {summary['session'].nunique()}, řádků: {len(summary)}, nově spočteno: {computed}")
+    health = sensor_health(summary, args.tolerance)
+    print(health.round(4).to_string())
+    flagged = health.index[health['flagged']].tolist() if len(health) else []
+    if flagged:
+        print(f"Mimo toleranci ±{args.tolerance} °C: {', '.join(flagged)}")
+    if args.plot:
+        plot_drift(summary, args.tolerance).show()
+
+if __name__ == "__main__":
+    main()
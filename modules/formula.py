@@ -4,20 +4,26 @@ import numpy as np
 import plotly.graph_objects as go
 from sklearn.linear_model import LinearRegression
 
+if not __package__:
+    from series_store import load_frame, time_ranges_on_day
+    from blocks import block_stats
+    from uncertainty import fit_uncertainty
+else:
+    from modules.series_store import load_frame, time_ranges_on_day
+    from modules.blocks import block_stats
+    from modules.uncertainty import fit_uncertainty
+
 # Načtení dat ze dvou souborů
 file_x = './data_parsed/klarka.csv'  # Soubor pro osu X
 file_y = './data_parsed/co_04.csv'  # Soubor pro osu Y
 
-df_x = pd.read_csv(file_x)
-df_y = pd.read_csv(file_y)
+df_x = load_frame(file_x)
+df_y = load_frame(file_y)
 
-# Oprava sloupce 'temp' - převod na číselný formát
+# Příprava sloupce 'temp' (převod na čísla a čas v epoše 'timestamp' dělá series store)
 def clean_data(df):
-    # Převod hodnot 'temp' na číselné typy (nevalidní hodnoty budou NaN)
-    df['temp'] = pd.to_numeric(df['temp'].str.replace(',', '.'), errors='coerce')
-    df['datetime'] = pd.to_datetime(df['time'], errors='coerce')  # Převod 'time' na datetime
     # Odstranění záznamů s nevalidními hodnotami
-    return df.dropna(subset=['temp', 'datetime'])
+    return df.dropna(subset=['temp'])
 
 df_x = clean_data(df_x)
 df_y = clean_data(df_y)
@@ -34,21 +40,15 @@ time_blocks = [
 
 # Funkce pro průměrování hodnot v rámci bloků času
 def process_data(df, blocks):
-    averaged_data = []
-
-    for start, end in blocks:
-        start_time = pd.to_datetime(start)
-        end_time = pd.to_datetime(end)
-        
-        # Filtrování dat v rámci časového bloku
-        block_data = df[(df['datetime'] >= start_time) & (df['datetime'] < end_time)]
-        
-        # Výpočet průměrné teploty v bloku
-        if not block_data.empty:
-            avg_temp = block_data['temp'].mean()
-            averaged_data.append({'time_block': f"{start}-{end}", 'avg_temp': avg_temp})
-
-    return pd.DataFrame(averaged_data)
+    # Bloky na prvním dni souboru X v sekundách epochy, všechny najednou
+    starts, ends = time_ranges_on_day(file_x, blocks)
+
+    # Průměry všech bloků jedním průchodem (prefixové součty, modules/blocks.py)
+    stats = block_stats(df['timestamp'].to_numpy(), df['temp'].to_numpy(), starts, ends, np.nan)
+
+    # Jen bloky s daty
+    averaged_data = pd.DataFrame({'time_block': [f"{start}-{end}" for start, end in blocks], 'avg_temp': stats['mean']})
+    return averaged_data[stats['count'] > 0].reset_index(drop=True)
 
 # Zpracování dat
 processed_x = process_data(df_x, time_blocks)
@@ -66,6 +66,9 @@ model.fit(x, y)
 k = model.coef_[0]  # Sklon přímky
 q = model.intercept_  # Průsečík s osou y
 
+# Bootstrapové intervaly spolehlivosti k a q
+uncertainty = fit_uncertainty(x.ravel(), y)
+
 # Predikce pro fitovací přímku
 x_line = np.linspace(min(x), max(x), 100).reshape(-1, 1)
 y_line = model.predict(x_line)
@@ -113,4 +116,6 @@ fig.update_layout(
 fig.show()
 
 # Výsledek
-print(f"Rovnice přímky: y = {k:.2f}x + {q:.2f}")
\ No newline at end of file
+print(f"Rovnice přímky: y = {k:.2f}x + {q:.2f}")
+print(f"95% interval k: [{uncertainty['k_low']:.4f}, {uncertainty['k_high']:.4f}], "
+      f"q: [{uncertainty['q_low']:.4f}, {uncertainty['q_high']:.4f}]")
\ No newline at end of file
@@ -0,0 +1,476 @@
+import argparse
+import asyncio
+import calendar
+import csv
+import heapq
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+
+if not __package__:
+    from parser import parse_row, get_fieldnames, load_manifest, PARSED_DIR, MANIFEST_FILE
+    from series_store import CHANNELS, local_time_to_epoch
+else:
+    from modules.parser import parse_row, get_fieldnames, load_manifest, PARSED_DIR, MANIFEST_FILE
+    from modules.series_store import CHANNELS, local_time_to_epoch
+
+# Velikost dávky zapisované do data_parsed a nejdelší prodleva zápisu (s)
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 5.0
+# Počet vzorků v kruhovém bufferu jednoho senzoru (24 h při vzorku každých 10 s je 8640)
+CAPACITY = 20000
+
+# Blok čtený při zpětném čtení souboru
+BLOCK_SIZE = 1 << 16
+
+# Převod MQTT/TTN topiku na název souboru v data_parsed
+TOPIC_NAMES = [
+    (re.compile(r'^/klimakomora/memmert'), 'klarka'),
+    (re.compile(r'^/ttndata/eui-[0-9a-f]+-co-(\d+)$'), 'co_{0}'),
+    (re.compile(r'^/ttndata/eui-[0-9a-f]+-(\d+)$'), 'm_{0}'),
+    (re.compile(r'^/ttndata/senzory/wifi/co2/(\d+)$'), 'wifi{0}'),
+]
+
+def sensor_name_from_topic(topic):
+    """
+    Return the parsed file name of a sensor topic.
+
+    Parameters:
+        topic (str): Topic, e.g. '/ttndata/eui-70b3d57ed006209e-co-04'.
+
+    Returns:
+        str: File name without extension (e.g. 'co_04'), or None for an unknown topic.
+    """
+    for pattern, name in TOPIC_NAMES:
+        match = pattern.match(topic or '')
+        if match:
+            return name.format(*match.groups())
+    return None
+
+def _to_float(value):
+    try:
+        return float(str(value).replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+def reverse_lines(path, start=0, block_size=BLOCK_SIZE):
+    """
+    Yield the lines of a file from the last one to the first one, reading it backwards in blocks.
+
+    Parameters:
+        path (str): Path to the file.
+        start (int): Byte offset where reading stops (e.g. the end of the header line).
+        block_size (int): Number of bytes read at once.
+
+    Yields:
+        str: Decoded line without the line break; empty lines are skipped.
+    """
+    with open(path, mode="rb") as infile:
+        position = infile.seek(0, os.SEEK_END)
+        remainder = b''
+        while position > start:
+            size = min(block_size, position - start)
+            position -= size
+            infile.seek(position)
+            lines = (infile.read(size) + remainder).split(b'\n')
+            # První (možná neúplný) řádek bloku se dočte s dalším blokem
+            remainder = lines.pop(0) if position > start else b''
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.rstrip(b'\r').decode("utf-8")
+
+def read_rows(path):
+    """
+    Read a raw export as rows sorted by ascending id, without loading the whole file.
+
+    Exports sorted newest first are read backwards.
+
+    Parameters:
+        path (str): Path to the raw CSV file.
+
+    Yields:
+        dict: Raw row ('id', 'time', 'topic', 'payload').
+    """
+    with open(path, mode="rb") as infile:
+        header = infile.readline()
+        first = infile.readline()
+    fieldnames = next(csv.reader([header.decode("utf-8-sig")]))
+    if not first.strip():
+        return
+    last = next(reverse_lines(path, len(header)))
+    first_id = int(next(csv.reader([first.decode("utf-8")]))[0])
+    last_id = int(next(csv.reader([last]))[0])
+
+    if first_id > last_id:
+        for values in csv.reader(reverse_lines(path, len(header))):
+            yield dict(zip(fieldnames, values))
+        return
+    with open(path, mode="r", encoding="utf-8-sig", newline="") as infile:
+        reader = csv.reader(infile)
+        next(reader)  # Hlavička
+        for values in reader:
+            yield dict(zip(fieldnames, values))
+
+def merge_exports(paths):
+    """
+    Merge raw exports of several sensors into one stream ordered by time (heap-based k-way merge).
+
+    Parameters:
+        paths (list): Raw CSV files.
+
+    Yields:
+        dict: Raw row.
+    """
+    return heapq.merge(*[read_rows(path) for path in paths], key=lambda row: (row["time"], int(row["id"])))
+
+def _edge_ids(path):
+    """Ids of the first and the last row of a CSV file (the last one read backwards)."""
+    with open(path, mode="rb") as infile:
+        header = infile.readline()
+        first = infile.readline()
+    if not first.strip():
+        return []
+    column = next(csv.reader([header.decode("utf-8-sig")])).index("id")
+    ids = []
+    for line in (first.decode("utf-8"), next(reverse_lines(path, len(header)))):
+        value = next(csv.reader([line]))[column]
+        if value.isdigit():
+            ids.append(int(value))
+    return ids
+
+class RingBuffer:
+    """
+    Fixed-size buffer of the newest samples of one sensor.
+
+    Columns are preallocated numpy arrays written in a circle, so memory stays
+    bounded; reads return copies and may run in other threads.
+    """
+
+    def __init__(self, columns, capacity=CAPACITY):
+        self.capacity = capacity
+        self.columns = {'timestamp': np.zeros(capacity, dtype=np.int64)}
+        self.columns.update({name: np.full(capacity, np.nan, dtype=np.float32) for name in columns})
+        self.count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def append(self, samples):
+        """
+        Append samples.
+
+        Parameters:
+            samples (dict): Column name -> sequence of values (all of the same length, 'timestamp' included).
+        """
+        size = len(samples['timestamp'])
+        with self._lock:
+            for offset in range(0, size, self.capacity):
+                end = min(offset + self.capacity, size)
+                positions = (self._next + np.arange(end - offset)) % self.capacity
+                for name, values in self.columns.items():
+                    values[positions] = samples[name][offset:end]
+                self._next = (self._next + end - offset) % self.capacity
+                self.count = min(self.count + end - offset, self.capacity)
+
+    def read_range(self, start=None, end=None):
+        """
+        Return the buffered samples in the time range [start, end], sorted by time.
+
+        Parameters:
+            start (int): First epoch second (None = oldest sample).
+            end (int): Last epoch second, inclusive (None = newest sample).
+
+        Returns:
+            dict: Column name -> numpy array (like series_store.read_range).
+        """
+        with self._lock:
+            if self.count < self.capacity:
+                series = {name: values[:self.count].copy() for name, values in self.columns.items()}
+            else:
+                series = {name: np.roll(values, -self._next) for name, values in self.columns.items()}
+        order = np.argsort(series['timestamp'], kind='stable')
+        timestamp = series['timestamp'][order]
+        lo = 0 if start is None else np.searchsorted(timestamp, start, side='left')
+        hi = len(timestamp) if end is None else np.searchsorted(timestamp, end, side='right')
+        return {name: values[order][lo:hi] for name, values in series.items()}
+
+    def latest(self):
+        """Return the newest epoch second in the buffer (None if empty)."""
+        with self._lock:
+            return int(self.columns['timestamp'][:self.count].max()) if self.count else None
+
+class IngestService:
+    """
+    Decode incoming raw messages, append them to the parsed CSV files in batches
+    and keep the newest samples of every sensor in memory.
+
+    Messages are rows like in the raw exports: 'id', 'time' ('YYYY-MM-DD HH:MM:SS'),
+    'topic' and 'payload'; payloads are decoded by the same rules as in modules/parser.py.
+    """
+
+    def __init__(self, output_dir=PARSED_DIR, capacity=CAPACITY, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 on_stored=None):
+        self.output_dir = output_dir
+        # Volitelná funkce volaná s každou uloženou zprávou (měření zpoždění v replay.py)
+        self.on_stored = on_stored
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffers = {}
+        self.stats = {'received': 0, 'parsed': 0, 'dropped': 0, 'duplicate': 0, 'unknown_topic': 0, 'written': 0}
+        # Počitadlo změn bufferů (součást klíče výsledků z živých dat)
+        self.version = 0
+        self._pending = {}
+        self._last_ids = {}
+        self._flush_lock = None
+
+    def _last_id(self, name):
+        """
+        Highest id already stored for a sensor, looked up once without reading the whole file.
+
+        The parser records the highest id of every raw export in its manifest;
+        rows appended later by the ingest are at the end of the parsed CSV file,
+        rows of a single export at its start, so only the edge rows are read.
+        """
+        if name not in self._last_ids:
+            manifest = load_manifest(os.path.join(self.output_dir, MANIFEST_FILE))
+            ids = [entry['last_id'] for entry in manifest.values()
+                   if entry.get('output') == name and entry.get('last_id') is not None]
+            path = os.path.join(self.output_dir, f"{name}.csv")
+            if os.path.exists(path):
+                ids.extend(_edge_ids(path))
+            self._last_ids[name] = max(ids) if ids else None
+        return self._last_ids[name]
+
+    def handle(self, message):
+        """
+        Decode one raw message and queue it for the buffer and the next batch.
+
+        Parameters:
+            message (dict): Raw row with 'id', 'time', 'topic' and 'payload'.
+
+        Returns:
+            bool: True if the message was stored.
+        """
+        self.stats['received'] += 1
+        name = sensor_name_from_topic(message.get('topic'))
+        if name is None:
+            self.stats['unknown_topic'] += 1
+            return False
+        try:
+            row_id = int(message['id'])
+        except (KeyError, TypeError, ValueError):
+            self.stats['dropped'] += 1
+            return False
+        last_id = self._last_id(name)
+        if last_id is not None and row_id <= last_id:
+            self.stats['duplicate'] += 1
+            return False
+
+        row = parse_row(name, {key: str(value) for key, value in message.items()})
+        if row is None:
+            self.stats['dropped'] += 1
+            return False
+        try:
+            timestamp = local_time_to_epoch(f"{row['date']} {row['time']}")
+        except ValueError:
+            self.stats['dropped'] += 1
+            return False
+
+        self._last_ids[name] = row_id
+        fieldnames = get_fieldnames(name)
+        self._pending.setdefault(name, []).append({key: row[key] for key in fieldnames if key in row})
+
+        columns = CHANNELS + (['door_open'] if 'door_open' in fieldnames else [])
+        if name not in self.buffers:
+            self.buffers[name] = RingBuffer(columns, self.capacity)
+        sample = {'timestamp': [timestamp]}
+        sample.update({column: [_to_float(row.get(column, 'N/A'))] for column in columns})
+        self.buffers[name].append(sample)
+        self.stats['parsed'] += 1
+        self.version += 1
+        if self.on_stored is not None:
+            self.on_stored(message)
+        return True
+
+    def _write(self, batches):
+        """Append parsed rows to the CSV files (runs in a worker thread)."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        for name, rows in batches.items():
+            path = os.path.join(self.output_dir, f"{name}.csv")
+            exists = os.path.exists(path)
+            with open(path, mode="a", encoding="utf-8", newline="") as outfile:
+                writer = csv.DictWriter(outfile, fieldnames=get_fieldnames(name))
+                if not exists:
+                    writer.writeheader()
+                writer.writerows(rows)
+        return sum(len(rows) for rows in batches.values())
+
+    async def flush(self):
+        """Write all queued rows to data_parsed."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batches, self._pending = self._pending, {}
+            if batches:
+                self.stats['written'] += await asyncio.to_thread(self._write, batches)
+
+    def pending(self):
+        return sum(len(rows) for rows in self._pending.values())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def run(self, source):
+        """
+        Consume messages from an async source until it ends.
+
+        Parameters:
+            source: Async iterator of raw messages (e.g. csv_source or tcp_source).
+        """
+        flusher = asyncio.create_task(self._flush_periodically())
+        try:
+            async for message in source:
+                self.handle(message)
+                if self.pending() >= self.batch_size:
+                    await self.flush()
+        finally:
+            flusher.cancel()
+            await self.flush()
+
+    def start_in_thread(self, source):
+        """
+        Run the service in a daemon thread with its own event loop (used by the web app).
+
+        Parameters:
+            source: Async iterator of raw messages.
+
+        Returns:
+            threading.Thread: The running thread.
+        """
+        thread = threading.Thread(target=asyncio.run, args=(self.run(source),), name='ingest', daemon=True)
+        thread.start()
+        return thread
+
+    def read_range(self, file_path, start=None, end=None):
+        """
+        Read buffered samples of a sensor; same signature as series_store.read_range.
+
+        Parameters:
+            file_path (str): Path to the parsed CSV file (only its name is used).
+            start (int): First epoch second (None = oldest sample).
+            end (int): Last epoch second, inclusive (None = newest sample).
+
+        Returns:
+            dict: Column name -> numpy array.
+        """
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        if name not in self.buffers:
+            raise KeyError(f"Live data of {name} not exist.")
+        return self.buffers[name].read_range(start, end)
+
+    def latest(self, files):
+        """
+        Return the newest epoch second buffered for any of the files.
+
+        Parameters:
+            files (list): File names without extensions.
+
+        Returns:
+            int: Epoch second, or None if nothing is buffered.
+        """
+        times = [self.buffers[file].latest() for file in files if file in self.buffers]
+        times = [t for t in times if t is not None]
+        return max(times) if times else None
+
+async def csv_source(paths, speed=None):
+    """
+    Replay raw CSV exports as messages in time order.
+
+    Parameters:
+        paths (list): Raw CSV files, streamed by merge_exports (exports sorted newest first are read backwards).
+        speed (float): Replay speed relative to real time (None = as fast as possible).
+
+    Yields:
+        dict: Raw row.
+    """
+    previous = None
+    for count, row in enumerate(merge_exports(paths)):
+        if speed:
+            current = calendar.timegm(time.strptime(row["time"], '%Y-%m-%d %H:%M:%S'))
+            if previous is not None and current > previous:
+                await asyncio.sleep((current - previous) / speed)
+            previous = current
+        elif count % 1000 == 0:
+            await asyncio.sleep(0)
+        yield row
+
+async def tcp_source(host='127.0.0.1', port=9000):
+    """
+    Receive messages as JSON lines over TCP (a local stand-in for the MQTT broker).
+
+    Every line is one JSON object with 'id', 'time', 'topic' and 'payload'.
+
+    Parameters:
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+
+    Yields:
+        dict: Raw row.
+    """
+    queue = asyncio.Queue()
+
+    async def client(reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    await queue.put(json.loads(line))
+                except ValueError:
+                    print(f"Neplatná zpráva: {line[:200]!r}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(client, host, port)
+    async with server:
+        while True:
+            yield await queue.get()
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Ingest live sensor messages into data_parsed.")
+    source_group = arg_parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--replay', nargs='+', help="Raw CSV files or folders (e.g. data_raw/2024-12-19) to replay.")
+    source_group.add_argument('--tcp', help="Listen for JSON lines on HOST:PORT (e.g. 127.0.0.1:9000).")
+    arg_parser.add_argument('--speed', type=float, default=None, help="Replay speed (e.g. 60 = one hour per minute, default: no delay).")
+    arg_parser.add_argument('--output-dir', default=PARSED_DIR)
+    arg_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    arg_parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL)
+    args = arg_parser.parse_args()
+
+    service = IngestService(args.output_dir, batch_size=args.batch_size, flush_interval=args.flush_interval)
+    if args.replay:
+        paths = []
+        for path in args.replay:
+            if os.path.isdir(path):
+                paths.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.csv'))
+            else:
+                paths.append(path)
+        source = csv_source(paths, args.speed)
+    else:
+        host, port = args.tcp.rsplit(':', 1)
+        source = tcp_source(host, int(port))
+
+    started = time.perf_counter()
+    try:
+        asyncio.run(service.run(source))
+    except KeyboardInterrupt:
+        pass
+    seconds = time.perf_counter() - started
+    print(", ".join(f"{name}: {value}" for name, value in service.stats.items()))
+    print(f"Doba: {seconds:.2f} s, rychlost: {service.stats['received'] / seconds:.0f} zpráv/s.")
+
+if __name__ == "__main__":
+    main()
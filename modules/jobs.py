@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+if not __package__:
+    from profiling import start_trace, end_trace
+else:
+    from modules.profiling import start_trace, end_trace
+
+# Počet vláken pro výpočty a doba, po kterou zůstává dokončená úloha v tabulce (s)
+WORKERS = min(4, os.cpu_count() or 1)
+JOB_TTL = 3600
+
+class JobQueue:
+    """
+    Background computations with a job table, results stored in a ResultCache.
+
+    The job id is the cache key of the result, so identical requests submitted
+    while a job is queued or running share that job, and a request whose result
+    is already cached does not start a job at all.
+    """
+
+    def __init__(self, cache, workers=WORKERS, ttl=JOB_TTL):
+        self.cache = cache
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, compute):
+        """
+        Start a computation unless its result is cached or already being computed.
+
+        Parameters:
+            key (str): Cache key of the result (from make_key), used as the job id.
+            compute (callable): Function taking a progress callback progress(fraction, message)
+                and returning the text to cache.
+
+        Returns:
+            str: Job id.
+        """
+        with self._lock:
+            self._cleanup()
+            job = self._jobs.get(key)
+            if job is not None and job['status'] in ('queued', 'running'):
+                return key
+            if self.cache.contains(key):
+                return key
+            self._jobs[key] = {'status': 'queued', 'progress': 0.0, 'message': '', 'error': None,
+                               'timings': {}, 'created': time.time(), 'finished': None}
+        self._executor.submit(self._run, key, compute)
+        return key
+
+    def status(self, key):
+        """
+        Return the state of a job.
+
+        Parameters:
+            key (str): Job id.
+
+        Returns:
+            dict: 'status' ('queued', 'running', 'done', 'error' or 'unknown'), 'progress' (0-1),
+            'message', 'error' and 'timings' (stage name -> seconds of a finished job, see profiling.span).
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job['status'] != 'done':
+                return {name: job[name] for name in ('status', 'progress', 'message', 'error', 'timings')}
+            timings = job['timings'] if job is not None else {}
+        if self.cache.contains(key):
+            return {'status': 'done', 'progress': 1.0, 'message': '', 'error': None, 'timings': timings}
+        return {'status': 'unknown', 'progress': 0.0, 'message': '', 'error': None, 'timings': {}}
+
+    def _update(self, key, **changes):
+        with self._lock:
+            self._jobs[key].update(changes)
+
+    def _run(self, key, compute):
+        self._update(key, status='running')
+
+        def progress(fraction, message=''):
+            self._update(key, progress=float(fraction), message=message)
+
+        # Doby jednotlivých fází výpočtu (profiling.span) se uloží k úloze
+        token = start_trace()
+        try:
+            result = compute(progress)
+        except Exception as e:
+            self._update(key, status='error', error=str(e), timings=end_trace(token), finished=time.time())
+            return
+        timings = end_trace(token)
+        self.cache.put(key, result)
+        self._update(key, status='done', progress=1.0, message='', timings=timings, finished=time.time())
+
+    def _cleanup(self):
+        # Odstranění dávno dokončených úloh (volá se se zámkem)
+        limit = time.time() - self.ttl
+        for key in [key for key, job in self._jobs.items() if job['finished'] and job['finished'] < limit]:
+            del self._jobs[key]
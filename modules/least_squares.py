@@ -6,7 +6,7 @@ sensor_2 = "co_15"
 # global_time_range = ("17:50:00", "19:15:00")
 global_time_range = ("16:50:00", "19:15:00")
 
-# Intervaly pro zvýraznění (volitelné)
+# Intervaly pro zvýraznění (volitelné, 'auto' = automaticky nalezené ustálené úseky senzoru 1)
 # highlight_intervals = [ ("18:00:00", "18:05:00"), ("18:15:00", "18:20:00"), ("18:40:00", "19:00:00") ]
 # ("16:50:00", "17:19:00"), ("17:30:00", "17:49:00")
 highlight_intervals = [("18:00:00", "18:05:00"), ("18:15:00", "18:20:00"), ("18:40:00", "19:00:00"), ("16:50:00", "17:19:00"), ("17:30:00", "17:49:00")]
@@ -14,129 +14,265 @@ highlight_intervals = [("18:00:00", "18:05:00"), ("18:15:00", "18:20:00"), ("18:
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+if not __package__:
+    from series_store import load_frame, read_range, time_range_on_day, time_ranges_on_day, epoch_to_local
+    from rollups import load_rollup, rollup_resolution
+    from blocks import block_stats, coverage, join_blocks, sampling_interval, MIN_COVERAGE
+    from downsample import select_points, MAX_POINTS
+    from plateau import detect_blocks
+    from profiling import span
+    from tools import interval_index
+    from uncertainty import fit_uncertainty, BOOTSTRAP_SAMPLES
+else:
+    from modules.series_store import load_frame, read_range, time_range_on_day, time_ranges_on_day, epoch_to_local
+    from modules.rollups import load_rollup, rollup_resolution
+    from modules.blocks import block_stats, coverage, join_blocks, sampling_interval, MIN_COVERAGE
+    from modules.downsample import select_points, MAX_POINTS
+    from modules.plateau import detect_blocks
+    from modules.profiling import span
+    from modules.tools import interval_index
+    from modules.uncertainty import fit_uncertainty, BOOTSTRAP_SAMPLES
 
 # Boolean přepínač
 merge_highlight_intervals = True
 
-def load_and_process(file_path):
+def load_and_process(file_path, time_range=None, channels=('temp',)):
     try:
-        data = pd.read_csv(file_path, delimiter=',')
-        if data['temp'].dtype == 'object':
-            data['temp'] = data['temp'].replace('N/D', np.nan).str.replace(',', '.').astype(float)
-        else:
-            data['temp'] = data['temp'].replace('N/D', np.nan).astype(float)
-        return data[['date', 'time', 'temp']]
+        start, end = time_range or (None, None)
+        data = load_frame(file_path, start, end)
+        data['date'] = data['date_time'].dt.normalize()
+        return data[['date', 'timestamp'] + list(channels)]
     except Exception as e:
         print(f"Chyba při načítání souboru {file_path}: {e}")
         return None
 
-def average_in_time_blocks(data, freq='5min'):
+def average_in_time_blocks(data, freq='5min', time_range=None, channels=('temp',)):
     try:
-        data['time'] = pd.to_datetime(data['time'], format='%H:%M:%S').dt.time
-        data['datetime'] = pd.to_datetime(data['time'].astype(str), format='%H:%M:%S')
-        data = data.set_index('datetime')
-        averaged = data.resample(freq).mean(numeric_only=True)
-        averaged['time'] = averaged.index.time
-        return averaged.dropna().reset_index()
+        # Bloky podle epochy (začátek bloku v sekundách), více dní se nepřekrývá
+        step = int(pd.Timedelta(freq).total_seconds())
+        timestamp = data['timestamp'].to_numpy()
+        starts = np.unique(timestamp // step * step)
+        # Krajní bloky jsou oříznuté časovým rozsahem (délka bloku pro pokrytí)
+        start, end = time_range or (None, None)
+        block_starts = starts if start is None else np.maximum(starts, start)
+        block_ends = starts + step if end is None else np.minimum(starts + step, end + 1)
+        # Všechny kanály jedním průchodem přes prefixové součty (modules/blocks.py)
+        stats = block_stats(timestamp, data[list(channels)].to_numpy(dtype=np.float64), block_starts, block_ends, np.nan)
+        averaged = pd.DataFrame({'datetime': starts, 'duration': block_ends - block_starts})
+        for c, channel in enumerate(channels):
+            averaged[channel] = stats['mean'][c]
+            averaged[f'{channel}_count'] = stats['count'][c]
+        return averaged
     except Exception as e:
         print(f"Chyba při zpracování časových bloků: {e}")
         return None
 
-def plot_calibrated_data(sensor_1, sensor_2, global_time_range=None, highlight_intervals=None):
+def load_block_averages(file_path, time_range=None, channels=('temp',), freq='5min'):
+    """
+    Return the block means of a file, read from the precomputed rollups where possible.
+
+    Blocks lying whole inside the time range come from the rollup of the same
+    length (modules/rollups.py); blocks cut by the range edges and frequencies
+    without a rollup are averaged from the raw samples.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+        time_range (tuple): Start and end in epoch seconds, inclusive (None = whole file).
+        channels (tuple): Averaged channels.
+        freq (str): Block length (pandas frequency).
+
+    Returns:
+        pd.DataFrame: 'datetime' (block start in epoch seconds), the channel means and
+        '<channel>_coverage' (share of the expected samples, see blocks.coverage), or None on error.
+    """
     try:
-        # Load data
-        data_1 = load_and_process(sensor_1)
-        data_2 = load_and_process(sensor_2)
+        channels = list(channels)
+        start, end = time_range or (None, None)
+        interval = sampling_interval(read_range(file_path, start, end)['timestamp'])
+        resolution = rollup_resolution(freq)
+        if resolution is None:
+            parts, blocks = [time_range], []
+        else:
+            # Celé bloky uvnitř rozsahu z agregací, oříznuté krajní bloky ze vzorků
+            inner_start = None if start is None else -(-start // resolution) * resolution
+            inner_end = None if end is None else (end + 1) // resolution * resolution
+            parts, blocks = [], []
+            if start is not None and start < inner_start:
+                parts.append((start, min(inner_start - 1, end)))
+            if end is not None and inner_end <= end and (start is None or inner_end > start):
+                parts.append((inner_end, end))
+            if inner_start is None or inner_end is None or inner_start < inner_end:
+                rollup = load_rollup(file_path, resolution, inner_start, None if inner_end is None else inner_end - 1, channels)
+                rollup = rollup.rename(columns={'timestamp': 'datetime'})
+                rollup['duration'] = resolution
+                blocks.append(rollup[['datetime', 'duration'] + channels + [f'{channel}_count' for channel in channels]])
+        for part in parts:
+            data = load_and_process(file_path, part, channels)
+            if data is not None and not data.empty:
+                blocks.append(average_in_time_blocks(data, freq, part, channels))
+        averaged = pd.concat(blocks, ignore_index=True).sort_values('datetime', ignore_index=True)
+        for channel in channels:
+            averaged[f'{channel}_coverage'] = coverage(averaged[f'{channel}_count'], averaged['duration'], interval)
+        averaged = averaged.dropna(subset=channels, how='all').reset_index(drop=True)
+        return averaged[['datetime'] + channels + [f'{channel}_coverage' for channel in channels]]
+    except Exception as e:
+        print(f"Chyba při zpracování časových bloků: {e}")
+        return None
+
+def plot_calibrated_data(sensor_1, sensor_2, global_time_range=None, highlight_intervals=None, max_points=MAX_POINTS,
+                         channels=('temp',), min_coverage=MIN_COVERAGE, bootstrap_samples=BOOTSTRAP_SAMPLES, workers=1):
+    try:
+        channels = list(channels)
+        # Time range in epoch seconds, times without a date on the first day of sensor 1 (only this part of the files is read)
+        time_range = time_range_on_day(sensor_1, global_time_range) if global_time_range else None
+
+        # Load the 5 min block means (precomputed rollups, see modules/rollups.py)
+        with span('least_squares.load'):
+            data_1_avg = load_block_averages(sensor_1, time_range, channels)
+            data_2_avg = load_block_averages(sensor_2, time_range, channels)
 
-        if data_1 is None or data_2 is None:
+        if data_1_avg is None or data_2_avg is None or data_1_avg.empty or data_2_avg.empty:
             print("Chyba: Nebylo možné načíst nebo zpracovat data.")
             return
 
         # Checking the dates to ensure consistency
-        date_1 = data_1['date'].iloc[0]
-        date_2 = data_2['date'].iloc[0]
+        date_1 = epoch_to_local(data_1_avg['datetime'].iloc[:1])[0].date()
+        date_2 = epoch_to_local(data_2_avg['datetime'].iloc[:1])[0].date()
+        # Runs in background jobs too, so a date mismatch is only reported (printed and shown in the figure)
+        date_warning = None
         if date_1 != date_2:
-            proceed = input(f"Varování: Zjištěna nesrovnalost data. Očekáváno {date_1}, nalezeno {date_2}. Pokračovat? (ano/a/yes/y): ")
-            if proceed.lower() not in ['ano', 'a', 'yes', 'y']:
-                print("Skript ukončen.")
-                return
+            date_warning = f"Varování: Zjištěna nesrovnalost data. Očekáváno {date_1}, nalezeno {date_2}."
+            print(date_warning)
 
         # Debugging: Print first few entries for sensor 1 and sensor 2
         #print("Sensor 1 sample data:", data_1.head())
         #print("Sensor 2 sample data:", data_2.head())
 
-        # Convert times to pandas datetime objects for easier processing
-        data_1['time'] = pd.to_datetime(data_1['time'], format='%H:%M:%S', errors='coerce').dt.time
-        data_2['time'] = pd.to_datetime(data_2['time'], format='%H:%M:%S', errors='coerce').dt.time
-
-        # Check for NaT values and remove rows where time is invalid
-        if data_1['time'].isna().any() or data_2['time'].isna().any():
-            print("Warning: Some time values are invalid (NaT). These will be removed.")
-            data_1 = data_1.dropna(subset=['time'])
-            data_2 = data_2.dropna(subset=['time'])
-
-        # Debugging: Print after cleaning the data
-        #print("Sensor 1 cleaned data:", data_1.head())
-        #print("Sensor 2 cleaned data:", data_2.head())
-
-        if global_time_range:
-            start_time, end_time = [pd.to_datetime(t, format='%H:%M:%S').time() for t in global_time_range]
-            data_1 = data_1[(data_1['time'] >= start_time) & (data_1['time'] <= end_time)]
-            data_2 = data_2[(data_2['time'] >= start_time) & (data_2['time'] <= end_time)]
-
-        # Proceed with averaging and merging data
-        data_1_avg = average_in_time_blocks(data_1)
-        data_2_avg = average_in_time_blocks(data_2)
-
-        # Merge the two dataframes
-        merged = pd.merge_asof(data_1_avg, data_2_avg, on='datetime', suffixes=('_1', '_2'))
-
-        merged['time'] = merged['datetime'].dt.time
-
-        # Create the plot
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=merged['temp_1'],
-            y=merged['temp_2'],
-            mode='markers+lines',
-            name='Kalibrační data',
-            marker=dict(size=8, color='blue')
-        ))
-
-        # Optional: Add highlight intervals
-        if highlight_intervals:
-            for start, end in highlight_intervals:
-                start_time, end_time = [pd.to_datetime(t, format='%H:%M:%S').time() for t in (start, end)]
-                interval_data = merged[(merged['time'] >= start_time) & (merged['time'] <= end_time)]
-                for _, row in interval_data.iterrows():
+        # Pair the same blocks of both sensors (a block with a gap in one sensor is not paired)
+        with span('least_squares.average'):
+            merged = join_blocks([data_1_avg, data_2_avg], channels, min_coverage=min_coverage)
+
+        # One scatter plot per channel, side by side
+        multi = len(channels) > 1
+        fig = make_subplots(rows=1, cols=len(channels), subplot_titles=channels) if multi else go.Figure()
+
+        with span('least_squares.highlight'):
+            # Stable intervals of sensor 1 detected automatically (modules/plateau.py)
+            if highlight_intervals == 'auto':
+                highlight_intervals = detect_blocks(sensor_1)
+
+            # Points of the highlight intervals (one binary search for all intervals and channels)
+            if highlight_intervals:
+                starts, ends = time_ranges_on_day(sensor_1, highlight_intervals)
+                interval = interval_index(merged['datetime'].to_numpy(), starts, ends)
+                labels = np.array([f'{start} - {end}' for start, end in highlight_intervals], dtype=object)
+
+        for c, channel in enumerate(channels):
+            position = dict(row=1, col=c + 1) if multi else {}
+            group = dict(legendgroup=channel, showlegend=c == 0) if multi else {}
+            pair = merged[['datetime', f'{channel}_1', f'{channel}_2']].dropna()
+            if pair.empty:
+                continue
+            x_values = pair[f'{channel}_1'].to_numpy()
+            y_values = pair[f'{channel}_2'].to_numpy()
+
+            # Cap the number of drawn calibration points (peaks of sensor 2 are preserved)
+            selected = select_points(pair['datetime'].to_numpy(), y_values, max_points)
+
+            fig.add_trace(go.Scatter(
+                x=x_values[selected],
+                y=y_values[selected],
+                mode='markers+lines',
+                name='Kalibrační data',
+                marker=dict(size=8, color='blue'),
+                **group
+            ), **position)
+
+            # Optional: Add highlight intervals (one trace, the interval is in the hover label)
+            if highlight_intervals:
+                inside = interval[pair.index.to_numpy()] >= 0
+                fig.add_trace(go.Scatter(
+                    x=x_values[inside],
+                    y=y_values[inside],
+                    mode='markers',
+                    name='Ustálené body',
+                    text=labels[interval[pair.index.to_numpy()][inside]],
+                    hovertemplate='%{text}<br>(%{x}, %{y})<extra></extra>',
+                    marker=dict(size=12, color='red', symbol='diamond'),
+                    **group
+                ), **position)
+
+            # Add the x = y line
+            min_value = min(x_values.min(), y_values.min())
+            max_value = max(x_values.max(), y_values.max())
+            fig.add_trace(go.Scatter(
+                x=[min_value, max_value],
+                y=[min_value, max_value],
+                mode='lines',
+                name='x = y',
+                line=dict(dash='dash', color='red'),
+                **group
+            ), **position)
+
+            # Fit y = kx + q of the stable points (all points without highlight intervals)
+            # with bootstrap confidence and prediction bands (modules/uncertainty.py)
+            if bootstrap_samples:
+                fitted = inside if highlight_intervals else np.ones(len(x_values), dtype=bool)
+                with span('least_squares.bootstrap'):
+                    fit = fit_uncertainty(x_values[fitted], y_values[fitted], bootstrap_samples, workers=workers)
+                if len(fit['x']):
+                    k, q = np.polyfit(x_values[fitted], y_values[fitted], 1)
+                    band_x = np.concatenate((fit['x'], fit['x'][::-1]))
+                    fig.add_trace(go.Scatter(
+                        x=band_x,
+                        y=np.concatenate((fit['prediction_high'], fit['prediction_low'][::-1])),
+                        fill='toself',
+                        fillcolor='rgba(0, 128, 0, 0.1)',
+                        line=dict(width=0),
+                        hoverinfo='skip',
+                        name=f"Predikční pásmo {fit['band']:.3f}",
+                        **group
+                    ), **position)
                     fig.add_trace(go.Scatter(
-                        x=[row['temp_1']],
-                        y=[row['temp_2']],
-                        mode='markers',
-                        name=f'Ustálený bod ({start} - {end})',
-                        marker=dict(size=12, color='red', symbol='diamond')
-                    ))
-
-        # Add the x = y line
-        min_temp = min(merged['temp_1'].min(), merged['temp_2'].min())
-        max_temp = max(merged['temp_1'].max(), merged['temp_2'].max())
-        fig.add_trace(go.Scatter(
-            x=[min_temp, max_temp],
-            y=[min_temp, max_temp],
-            mode='lines',
-            name='x = y',
-            line=dict(dash='dash', color='red')
-        ))
-
-        fig.update_layout(
-            title='Kalibrace teplotních senzorů',
-            xaxis_title='Teplota senzoru 1 (°C)',
-            yaxis_title='Teplota senzoru 2 (°C)',
-            xaxis=dict(scaleanchor="y", scaleratio=1),
-            yaxis=dict(scaleanchor="x", scaleratio=1),
-            hovermode='closest'
-        )
+                        x=band_x,
+                        y=np.concatenate((fit['fit_high'], fit['fit_low'][::-1])),
+                        fill='toself',
+                        fillcolor='rgba(0, 128, 0, 0.3)',
+                        line=dict(width=0),
+                        hoverinfo='skip',
+                        name='Interval spolehlivosti fitu',
+                        **group
+                    ), **position)
+                    fig.add_trace(go.Scatter(
+                        x=fit['x'],
+                        y=k * fit['x'] + q,
+                        mode='lines',
+                        name=f"Fit y = {k:.4f}x {q:+.4f} (k ∈ [{fit['k_low']:.4f}, {fit['k_high']:.4f}], "
+                             f"q ∈ [{fit['q_low']:.3f}, {fit['q_high']:.3f}])",
+                        line=dict(color='green'),
+                        **group
+                    ), **position)
+
+        if multi:
+            fig.update_layout(title='Kalibrace senzorů', hovermode='closest', height=500)
+            for c, channel in enumerate(channels):
+                fig.update_xaxes(title_text=f'{channel} senzoru 1', row=1, col=c + 1)
+                fig.update_yaxes(title_text=f'{channel} senzoru 2', row=1, col=c + 1)
+        else:
+            fig.update_layout(
+                title='Kalibrace teplotních senzorů',
+                xaxis_title='Teplota senzoru 1 (°C)',
+                yaxis_title='Teplota senzoru 2 (°C)',
+                xaxis=dict(scaleanchor="y", scaleratio=1),
+                yaxis=dict(scaleanchor="x", scaleratio=1),
+                hovermode='closest'
+            )
 
+        if date_warning:
+            fig.add_annotation(text=date_warning, xref='paper', yref='paper', x=0, y=1.1, showarrow=False,
+                               font=dict(color='red'))
         return fig
     except Exception as e:
         print(f"Chyba při vytváření grafu: {e}")
@@ -1,9 +1,26 @@
-# Názvy vstupních souborů (zadejte seznam názvů bez přípony)
-files = ["co_15","co_02","co_04", "m_26", "klarka", "wifi69"]
-folder = "2024-12-19"
-
+import argparse
 import csv
+import fnmatch
+import hashlib
 import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Výchozí složky se surovými a upravenými daty
+RAW_DIR = "./data_raw"
+PARSED_DIR = "./data_parsed"
+
+# Počet řádků v jednom bloku, který se posílá do procesu
+CHUNK_SIZE = 2000
+
+# Manifest s posledním zpracovaným řádkem každého surového souboru (ve složce data_parsed)
+MANIFEST_FILE = "manifest.json"
+# Počet bajtů před kontrolním bodem, ze kterých se počítá hash
+HASH_WINDOW = 65536
+
+FIELDNAMES = ["id", "date", "time", "topic", "co2", "humidity", "temp"]
 
 # Funkce pro opravu formátování JSON
 def fix_json_format(payload_str):
@@ -41,11 +58,11 @@ def parse_payload(file, row):
             humidity = replace_dot_with_comma(payload.get("HumRead", "N/A"))
             temp = replace_dot_with_comma(payload.get("Temp1Read", "N/A"))
             door_open = payload.get("DoorOpen", "N/A")
-            
+
             # Kontrola, zda obsahuje hodnoty 'N/D'
             if "N/D" in [co2, humidity, temp]:
                 raise ValueError("Řádek obsahuje hodnotu 'N/D'.")
-            
+
             return {
                 "co2": co2,
                 "humidity": humidity,
@@ -77,55 +94,358 @@ def parse_payload(file, row):
         print(f"Chyba parsování JSON: {e}\nPayload: {repr(payload_str)}")
         return None
 
-# Iterace přes všechny soubory
-for file in files:
-    input_file = f"./data_raw/{folder}/{file}.csv"
-    output_file = f"./data_parsed/{file}.csv"
+def get_fieldnames(file):
+    """
+    Return the output columns for a parsed file.
+
+    Parameters:
+        file (str): File name without extension.
+
+    Returns:
+        list: Column names of the parsed CSV.
+    """
+    fieldnames = list(FIELDNAMES)
+    if file == "klarka":
+        fieldnames.append("door_open")
+    return fieldnames
+
+def parse_row(file, row):
+    """
+    Split the timestamp and decode the payload of one raw row.
+
+    Parameters:
+        file (str): File name without extension.
+        row (dict): Raw row with 'id', 'time', 'topic' and 'payload'.
+
+    Returns:
+        dict: Parsed row, or None if the row has to be dropped.
+    """
+    try:
+        time_value = row["time"]
+        if time_value:
+            date, time_part = time_value.split(" ")
+            row["date"] = date
+            row["time"] = time_part
+        else:
+            row["date"] = "N/A"
+            row["time"] = "N/A"
+
+        # Zpracování payloadu (známé topiky rychlým dekodérem, ostatní přes parse_payload)
+        parsed_data = decoders.decode_payload(file, row)
+        if parsed_data is None:
+            return None
+
+        row.update(parsed_data)
+    except Exception as e:
+        print(f"Obecná chyba při zpracování řádku: {e}")
+        return None
+    return row
+
+def parse_chunk(task):
+    """
+    Parse one block of raw rows (runs in a worker process).
+
+    Parameters:
+        task (tuple): File name without extension and a list of raw rows.
+
+    Returns:
+        tuple: File name, list of output rows filtered to the fieldnames and the number of dropped rows.
+    """
+    file, rows = task
+    fieldnames = get_fieldnames(file)
+    parsed = []
+    dropped = 0
+    for row in rows:
+        row = parse_row(file, row)
+        if row is None:
+            dropped += 1
+            continue
+        # Odstranění klíčů, které nejsou v fieldnames
+        parsed.append({key: row[key] for key in fieldnames if key in row})
+    return file, parsed, dropped
+
+def _checkpoint_hash(infile, offset):
+    """Hash of the block of bytes just before the checkpoint offset."""
+    start = max(0, offset - HASH_WINDOW)
+    infile.seek(start)
+    return hashlib.sha1(infile.read(offset - start)).hexdigest()
+
+class _LineReader:
+    """Iterate decoded lines of a binary file and track the byte offset of the consumed lines."""
+
+    def __init__(self, infile, offset):
+        self.infile = infile
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.infile.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode("utf-8")
+
+def read_chunks(input_file, chunk_size=CHUNK_SIZE, checkpoint=None):
+    """
+    Read a raw CSV file as a stream of row blocks.
+
+    With a checkpoint only rows with an id greater than the last processed id are read.
+    Exports sorted by descending id (newest rows first) are read only up to the first
+    known row, ascending exports continue from the stored byte offset if the bytes before
+    it did not change. The checkpoint is updated in place after the file is read.
+
+    Parameters:
+        input_file (str): Path to the raw CSV file.
+        chunk_size (int): Maximum number of rows in one block.
+        checkpoint (dict): Manifest entry of the file ('last_id', 'order', 'offset', 'size', 'hash').
+
+    Yields:
+        list: Block of raw rows as dictionaries.
+    """
+    if checkpoint is None:
+        checkpoint = {}
+    size = os.path.getsize(input_file)
+    last_id = checkpoint.get('last_id')
 
-    # Načtení dat ze vstupního CSV
-    with open(input_file, mode="r", encoding="utf-8") as infile:
-        reader = csv.DictReader(infile)
+    with open(input_file, mode="rb") as infile:
+        # Beze změny souboru není co zpracovávat
+        if last_id is not None and checkpoint.get('size') == size \
+                and checkpoint.get('hash') == _checkpoint_hash(infile, size):
+            return
 
-        # Přidání nových sloupců do hlavičky
-        fieldnames = ["id", "date", "time", "topic", "co2", "humidity", "temp"]
-        if file == "klarka":
-            fieldnames.append("door_open")
-        rows = []
-        deleted_count = 0
+        infile.seek(0)
+        header = infile.readline()
+        fieldnames = next(csv.reader([header.decode("utf-8-sig")]))
+        start = len(header)
+        offset = checkpoint.get('offset')
+        if checkpoint.get('order') == 'asc' and offset is not None and start <= offset <= size \
+                and checkpoint.get('offset_hash') == _checkpoint_hash(infile, offset):
+            start = offset
+        infile.seek(start)
 
+        lines = _LineReader(infile, start)
+        reader = csv.DictReader(lines, fieldnames=fieldnames)
+        order = checkpoint.get('order')
+        max_id = last_id
+        previous_id = None
+        chunk = []
         for row in reader:
-            try:
-                time_value = row["time"]
-                if time_value:
-                    date, time = time_value.split(" ")
-                    row["date"] = date
-                    row["time"] = time
-                else:
-                    row["date"] = "N/A"
-                    row["time"] = "N/A"
-
-                # Zpracování payloadu
-                parsed_data = parse_payload(file, row)
-                if parsed_data is None:
-                    deleted_count += 1
-                    continue
+            row_id = int(row["id"])
+            if order is None and previous_id is not None:
+                order = 'desc' if row_id < previous_id else 'asc'
+            previous_id = row_id
+            if last_id is not None and row_id <= last_id:
+                if order == 'desc':
+                    break  # Zbytek souboru už byl zpracován
+                continue
+            if max_id is None or row_id > max_id:
+                max_id = row_id
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+        checkpoint.update({
+            'last_id': max_id,
+            'order': order or 'asc',
+            'offset': lines.offset,
+            'offset_hash': _checkpoint_hash(infile, lines.offset),
+            'size': size,
+            'hash': _checkpoint_hash(infile, size),
+        })
+
+def load_manifest(manifest_path):
+    """
+    Load the checkpoint manifest of the incremental parsing.
+
+    Parameters:
+        manifest_path (str): Path to the manifest JSON file.
+
+    Returns:
+        dict: Raw file paths as keys and checkpoints as values.
+    """
+    try:
+        with open(manifest_path, mode="r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(manifest, manifest_path):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
 
-                row.update(parsed_data)
-            except Exception as e:
-                print(f"Obecná chyba při zpracování řádku: {e}")
-                deleted_count += 1
+def find_sources(folders=None, pattern="*.csv", files=None, date_from=None, date_to=None, raw_dir=RAW_DIR):
+    """
+    Find raw CSV exports and group them by output file name.
+
+    Parameters:
+        folders (list): Names of folders in raw_dir (e.g. '2024-12-19').
+        pattern (str): Glob pattern for the file names inside the folders.
+        files (list): File names without extensions; overrides the pattern.
+        date_from (str): First folder (YYYY-MM-DD) of a date range, inclusive.
+        date_to (str): Last folder (YYYY-MM-DD) of a date range, inclusive.
+        raw_dir (str): Directory with the raw exports.
+
+    Returns:
+        dict: File names without extensions as keys and lists of raw file paths (in folder order) as values.
+    """
+    selected = set(folders or [])
+    if date_from or date_to:
+        for folder in os.listdir(raw_dir):
+            if not os.path.isdir(os.path.join(raw_dir, folder)):
+                continue
+            if date_from and folder < date_from:
+                continue
+            if date_to and folder > date_to:
                 continue
+            selected.add(folder)
+    if not selected:
+        raise ValueError("Nebyla zadána žádná složka ani rozsah dat.")
+
+    sources = {}
+    for folder in sorted(selected):
+        folder_path = os.path.join(raw_dir, folder)
+        if not os.path.isdir(folder_path):
+            raise FileNotFoundError(f"Folder {folder_path} not exist.")
+        for name in sorted(os.listdir(folder_path)):
+            file, ext = os.path.splitext(name)
+            if ext != ".csv":
+                continue
+            if files is not None:
+                if file not in files:
+                    continue
+            elif not fnmatch.fnmatch(name, pattern):
+                continue
+            sources.setdefault(file, []).append(os.path.join(folder_path, name))
+    return sources
+
+def _iter_tasks(sources, chunk_size, manifest):
+    for file, paths in sources.items():
+        for path in paths:
+            checkpoint = manifest.setdefault(os.path.normpath(path), {'output': file})
+            for chunk in read_chunks(path, chunk_size, checkpoint):
+                yield file, chunk
+
+def _iter_results(tasks, workers):
+    """Parse tasks in order; at most 2 blocks per worker are in flight at once."""
+    if workers == 1:
+        for task in tasks:
+            yield parse_chunk(task)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(parse_chunk, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def parse_files(sources, output_dir=PARSED_DIR, workers=None, chunk_size=CHUNK_SIZE, incremental=False):
+    """
+    Parse raw exports and stream the results into the parsed CSV files.
+
+    Independent files and blocks of large files are parsed in a process pool;
+    the parsed blocks are written in the original order as soon as they are ready.
+    The last processed row of every raw file is recorded in the manifest in output_dir;
+    in incremental mode only new rows are parsed and appended to the existing outputs.
+
+    Parameters:
+        sources (dict): Output file names as keys and lists of raw file paths as values (see find_sources).
+        output_dir (str): Directory for the parsed CSV files.
+        workers (int): Number of worker processes (default: number of CPUs, 1 = no pool).
+        chunk_size (int): Number of rows in one block.
+        incremental (bool): Parse only rows added since the last run.
+
+    Returns:
+        dict: Statistics per file ('rows', 'dropped', 'seconds', 'rows_per_sec').
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = load_manifest(manifest_path)
+
+    # Soubory, které nelze doplnit, se zpracují celé znovu
+    append = set()
+    for file, paths in sources.items():
+        keys = [os.path.normpath(path) for path in paths]
+        if incremental and os.path.exists(os.path.join(output_dir, f"{file}.csv")) \
+                and all(key in manifest for key in keys):
+            append.add(file)
+        else:
+            for key in keys:
+                manifest.pop(key, None)
+
+    stats = {}
+    current = None
+    outfile = None
+    writer = None
+    started = time.perf_counter()
+
+    def finish(file):
+        outfile.close()
+        file_stats = stats[file]
+        file_stats['seconds'] = time.perf_counter() - file_stats.pop('started')
+        total = file_stats['rows'] + file_stats['dropped']
+        file_stats['rows_per_sec'] = total / file_stats['seconds'] if file_stats['seconds'] > 0 else 0.0
+
+    try:
+        for file, rows, dropped in _iter_results(_iter_tasks(sources, chunk_size, manifest), workers):
+            if file != current:
+                if current is not None:
+                    finish(current)
+                current = file
+                mode = "a" if file in append else "w"
+                outfile = open(os.path.join(output_dir, f"{file}.csv"), mode=mode, encoding="utf-8", newline="")
+                writer = csv.DictWriter(outfile, fieldnames=get_fieldnames(file))
+                if mode == "w":
+                    writer.writeheader()
+                stats[file] = {'rows': 0, 'dropped': 0, 'started': started}
+            writer.writerows(rows)
+            stats[file]['rows'] += len(rows)
+            stats[file]['dropped'] += dropped
+            started = time.perf_counter()
+    finally:
+        if current is not None:
+            finish(current)
+    save_manifest(manifest, manifest_path)
+    return stats
+
+def print_stats(stats, output_dir=PARSED_DIR):
+    for file, file_stats in stats.items():
+        print(f"Data byla úspěšně uložena do souboru {os.path.join(output_dir, file)}.csv.")
+        print(f"Počet zpracovaných řádků: {file_stats['rows']}, počet smazaných řádků: {file_stats['dropped']}, "
+              f"rychlost: {file_stats['rows_per_sec']:.0f} řádků/s.")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Parse raw sensor exports from data_raw into data_parsed.")
+    arg_parser.add_argument('--folder', action='append', help="Folder in data_raw (e.g. 2024-12-19), can be repeated.")
+    arg_parser.add_argument('--date-from', help="First folder of a date range (YYYY-MM-DD).")
+    arg_parser.add_argument('--date-to', help="Last folder of a date range (YYYY-MM-DD).")
+    arg_parser.add_argument('--glob', default="*.csv", help="Glob pattern for file names (default: *.csv).")
+    arg_parser.add_argument('--files', nargs='+', help="File names without extensions (overrides --glob).")
+    arg_parser.add_argument('--raw-dir', default=RAW_DIR)
+    arg_parser.add_argument('--output-dir', default=PARSED_DIR)
+    arg_parser.add_argument('--workers', type=int, default=None, help="Number of processes (1 = no pool).")
+    arg_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    arg_parser.add_argument('--incremental', action='store_true', help="Parse only rows added since the last run.")
+    args = arg_parser.parse_args()
 
-            rows.append(row)
+    sources = find_sources(args.folder, args.glob, args.files, args.date_from, args.date_to, args.raw_dir)
+    stats = parse_files(sources, args.output_dir, args.workers, args.chunk_size, args.incremental)
+    print_stats(stats, args.output_dir)
 
-    # Uložení upravených dat do výstupního CSV
-    with open(output_file, mode="w", encoding="utf-8", newline="") as outfile:
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in rows:
-            # Odstranění klíčů, které nejsou v fieldnames
-            filtered_row = {key: row[key] for key in fieldnames if key in row}
-            writer.writerow(filtered_row)
+# Import až na konci modulu: decoders používá funkce z tohoto modulu
+if not __package__:
+    import decoders
+else:
+    from modules import decoders
 
-    print(f"Data byla úspěšně uložena do souboru {output_file}.")
-    print(f"Počet smazaných řádků: {deleted_count}.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import numpy as np
+
+if not __package__:
+    from tools import validate_files
+    from series_store import load_series, epoch_to_local
+else:
+    from modules.tools import validate_files
+    from modules.series_store import load_series, epoch_to_local
+
+# Výchozí parametry detekce ustálených úseků
+WINDOW = 300          # Délka klouzavého okna (s)
+MAX_SLOPE = 0.02      # Maximální sklon v okně (°C/min)
+MAX_STD = 0.05        # Maximální směrodatná odchylka v okně (°C)
+MIN_DURATION = 300    # Minimální délka ustáleného úseku (s)
+MIN_SAMPLES = 5       # Minimální počet vzorků v okně
+
+def rolling_stats(times, values, window=WINDOW):
+    """
+    Compute the slope and standard deviation of a trailing time window for every sample.
+
+    The window of sample i contains samples with time in [t_i - window, t_i]. All
+    windows are evaluated at once from cumulative sums, so the cost is O(n)
+    apart from one searchsorted call.
+
+    Parameters:
+        times (np.ndarray): Sorted times in seconds.
+        values (np.ndarray): Values without NaN.
+        window (float): Window length in seconds.
+
+    Returns:
+        tuple: Index of the first sample of each window, number of samples,
+        slope (units per second) and standard deviation, each an array of length n.
+    """
+    t = np.asarray(times, dtype=np.float64)
+    v = np.asarray(values, dtype=np.float64)
+    if len(t) == 0:
+        empty = np.zeros(0)
+        return empty.astype(np.int64), empty.astype(np.int64), empty, empty
+    # Posun času i hodnot zmenší zaokrouhlovací chyby kumulativních součtů
+    t = t - t[0]
+    v = v - v[0]
+
+    def prefix(x):
+        return np.concatenate(([0.0], np.cumsum(x)))
+
+    s_t, s_v, s_tt, s_tv, s_vv = prefix(t), prefix(v), prefix(t * t), prefix(t * v), prefix(v * v)
+    left = np.searchsorted(t, t - window, side='left')
+    right = np.arange(1, len(t) + 1)
+
+    n = (right - left).astype(np.float64)
+    sum_t = s_t[right] - s_t[left]
+    sum_v = s_v[right] - s_v[left]
+    sum_tt = s_tt[right] - s_tt[left]
+    sum_tv = s_tv[right] - s_tv[left]
+    sum_vv = s_vv[right] - s_vv[left]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var_t = n * sum_tt - sum_t ** 2
+        slope = np.where(var_t > 0, (n * sum_tv - sum_t * sum_v) / var_t, np.nan)
+        variance = np.maximum(sum_vv / n - (sum_v / n) ** 2, 0.0)
+    return left, right - left, slope, np.sqrt(variance)
+
+def find_plateaus(times, values, window=WINDOW, max_slope=MAX_SLOPE, max_std=MAX_STD,
+                  min_duration=MIN_DURATION, min_samples=MIN_SAMPLES):
+    """
+    Find stable (steady-state) intervals of a series.
+
+    A window is stable when its slope and standard deviation are within the
+    tolerances; overlapping stable windows are merged and intervals shorter
+    than min_duration are dropped.
+
+    Parameters:
+        times (np.ndarray): Sorted times in epoch seconds.
+        values (np.ndarray): Values; NaN samples are ignored.
+        window (float): Window length in seconds.
+        max_slope (float): Maximum absolute slope in units per minute.
+        max_std (float): Maximum standard deviation in the window.
+        min_duration (float): Minimum length of an interval in seconds.
+        min_samples (int): Minimum number of samples of a stable window.
+
+    Returns:
+        list: List of (start, end) tuples in epoch seconds.
+    """
+    times = np.asarray(times)
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    times, values = times[valid], values[valid]
+
+    left, count, slope, std = rolling_stats(times, values, window)
+    # Okno musí pokrývat aspoň 90 % své délky (začátek řady, výpadky dat)
+    full = times - times[left] >= 0.9 * window
+    with np.errstate(invalid='ignore'):
+        stable = full & (count >= min_samples) & (np.abs(slope) * 60 <= max_slope) & (std <= max_std)
+    if not stable.any():
+        return []
+
+    # Sjednocení překrývajících se stabilních oken
+    starts = times[left[stable]]
+    ends = times[stable]
+    reach = np.maximum.accumulate(ends)
+    new = np.concatenate(([True], starts[1:] > reach[:-1]))
+    interval_start = starts[new]
+    interval_end = np.maximum.reduceat(ends, np.flatnonzero(new))
+
+    keep = interval_end - interval_start >= min_duration
+    return [(int(start), int(end)) for start, end in zip(interval_start[keep], interval_end[keep])]
+
+def to_time_blocks(intervals):
+    """
+    Convert intervals in epoch seconds to local time blocks (as used by least_squares and calibration).
+
+    The blocks carry the date, so they stay unambiguous in files spanning several days.
+
+    Parameters:
+        intervals (list): List of (start, end) tuples in epoch seconds.
+
+    Returns:
+        list: List of (start, end) 'YYYY-MM-DD HH:MM:SS' tuples.
+    """
+    return [tuple(epoch_to_local([start, end]).strftime('%Y-%m-%d %H:%M:%S')) for start, end in intervals]
+
+def detect_blocks(file_path, column='temp', **options):
+    """
+    Detect stable blocks of a parsed file.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file (usually the reference).
+        column (str): Scanned column.
+        **options: Tolerances passed to find_plateaus.
+
+    Returns:
+        list: List of (start, end) 'YYYY-MM-DD HH:MM:SS' tuples.
+    """
+    series = load_series(file_path)
+    return to_time_blocks(find_plateaus(series['timestamp'], series[column], **options))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Detect stable (steady-state) intervals of a sensor.")
+    arg_parser.add_argument('file', help="File name without extension (e.g. klarka).")
+    arg_parser.add_argument('--window', type=float, default=WINDOW, help=f"Window length in seconds (default: {WINDOW}).")
+    arg_parser.add_argument('--max-slope', type=float, default=MAX_SLOPE, help=f"Maximum slope in °C/min (default: {MAX_SLOPE}).")
+    arg_parser.add_argument('--max-std', type=float, default=MAX_STD, help=f"Maximum standard deviation in °C (default: {MAX_STD}).")
+    arg_parser.add_argument('--min-duration', type=float, default=MIN_DURATION, help=f"Minimum duration in seconds (default: {MIN_DURATION}).")
+    args = arg_parser.parse_args()
+
+    blocks = detect_blocks(validate_files([args.file])[0], window=args.window, max_slope=args.max_slope,
+                           max_std=args.max_std, min_duration=args.min_duration)
+    print(", ".join(f"{start}-{end}" for start, end in blocks))
+
+if __name__ == "__main__":
+    main()
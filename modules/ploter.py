@@ -1,77 +1,98 @@
-import pandas as pd
 import numpy as np
-from scipy.interpolate import interp1d
 import plotly.graph_objects as go
+from plotly.colors import DEFAULT_PLOTLY_COLORS
+from plotly.subplots import make_subplots
 import os
 
-def load_file(file_path):
+if not __package__:
+    from series_store import load_frame, epoch_to_local, local_to_epoch, source_decimals, round_values, round_significant, CHANNELS
+    from downsample import select_points, MAX_POINTS
+    from dataset import Dataset
+    from profiling import span
+    from rollups import load_rollup
+else:
+    from modules.series_store import load_frame, epoch_to_local, local_to_epoch, source_decimals, round_values, round_significant, CHANNELS
+    from modules.downsample import select_points, MAX_POINTS
+    from modules.dataset import Dataset
+    from modules.profiling import span
+    from modules.rollups import load_rollup
+
+# Nejvyšší počet bodů společné mřížky; u dat z mnoha dní se krok mřížky zvětší
+MAX_GRID_POINTS = 1_000_000
+# Popisky os kanálů; toleranční pásmo reference se kreslí jen u teploty
+CHANNEL_TITLES = {'temp': 'Temperature (°C)', 'humidity': 'Humidity (%)', 'co2': 'CO2'}
+# Povolená odchylka od reference (°C); stejné pásmo používají drift.py a uncertainty.py
+TOLERANCE = 0.5
+
+def load_file(file_path, time_range=None, dataset=None, channels=('temp',)):
     """
     Load and process a CSV file.
 
     Parameters:
         file_path (str): Path to the CSV file.
+        time_range (tuple): Start and end in epoch seconds; only this window is read.
+        dataset (Dataset): Data already loaded for the current request (time_range is then ignored).
+        channels (tuple): Channels of interest; rows where all of them are missing are dropped.
 
     Returns:
         pd.DataFrame: Processed data.
     """
-    data = pd.read_csv(file_path, delimiter=',')
-    if 'date' not in data.columns or 'temp' not in data.columns or 'time' not in data.columns:
-        raise KeyError(f"'date', 'temp or 'time' {file_path} not exist.")
-
-    # Handle missing data and decimal separators
-    if data['temp'].dtype == object:  # Check if 'temp' contains strings
-        data['temp'] = data['temp'].replace('N/D', np.nan).str.replace(',', '.').astype(float)
+    if dataset is not None:
+        data = dataset.frame(file_path)
     else:
-        data['temp'] = data['temp'].replace('N/D', np.nan)  # No .str.replace() needed
+        start, end = time_range or (None, None)
+        data = load_frame(file_path, start, end)
+
+    # Handle missing data ('N/D' is already converted to NaN in the series store)
+    data = data.dropna(subset=list(channels), how='all').reset_index(drop=True)
 
-    # Convert 'time' to datetime
-    data['time'] = pd.to_datetime(data['time'], format='%H:%M:%S')
+    # Local wall-clock time for the graph axis (computations use the epoch 'timestamp')
+    data['time'] = epoch_to_local(data['timestamp'])
 
     # Debug: Print first few rows of the processed data
     # print(f"Processed data from {file_path}:\n{data.head()}")
     return data
 
-def interpolate_data(data):
+def resample_to_grid(series, start, end, step=1):
     """
-    Create an interpolation function for temperature data.
+    Align several series onto one shared time grid in a single np.interp pass.
+
+    The series are shifted to disjoint segments of one concatenated time axis,
+    so all of them are evaluated by one vectorized call.
 
     Parameters:
-        data (pd.DataFrame): Data with 'time' and 'temp' columns.
+        series (list): List of (time_seconds, values) array pairs sorted by time, within [start, end].
+        start (float): First grid point in seconds.
+        end (float): Last grid point in seconds.
+        step (float): Grid step in seconds.
 
     Returns:
-        interp1d: Interpolation function.
+        tuple: Grid in seconds (np.ndarray) and a 2-D array (series x grid) of interpolated values;
+        grid points outside the time range of a series are NaN.
     """
-    time_seconds = data['time'].astype(np.int64) // 10**9
-    temp = data['temp']
-
-    # Debug: Print interpolation input ranges
-    # print(f"Interpolation input time range: {time_seconds.min()} - {time_seconds.max()}")
-    return interp1d(
-        time_seconds, temp, kind='linear', fill_value="extrapolate"
-    )
+    count = int((end - start) // step) + 1
+    grid = start + step * np.arange(count, dtype=np.float64)
+    resampled = np.full((len(series), count), np.nan)
+    filled = [k for k, (times, _) in enumerate(series) if len(times) > 0]
+    if not filled:
+        return grid, resampled
 
-def calculate_global_min_time(files):
-    """
-    Calculate the earliest time across all files.
+    # Každá řada dostane vlastní úsek osy, aby se interpolace nepřelévala mezi řadami
+    shift = (end - start) + 2 * step
+    xp = np.concatenate([np.asarray(series[k][0], dtype=np.float64) - start + i * shift for i, k in enumerate(filled)])
+    fp = np.concatenate([np.asarray(series[k][1], dtype=np.float64) for k in filled])
+    x = (grid - start)[None, :] + shift * np.arange(len(filled))[:, None]
+    values = np.interp(x.ravel(), xp, fp).reshape(len(filled), count)
 
-    Parameters:
-        files (list): List of file paths.
+    for i, k in enumerate(filled):
+        times = series[k][0]
+        outside = (grid < times[0]) | (grid > times[-1])
+        values[i, outside] = np.nan
+        resampled[k] = values[i]
+    return grid, resampled
 
-    Returns:
-        pd.Timestamp: Earliest time found in the files.
-    """
-    min_time = None
-    for file_path in files:
-        data = pd.read_csv(file_path, delimiter=',')
-        file_min_time = pd.to_datetime(data['time'], format='%H:%M:%S').min()
-        if min_time is None or file_min_time < min_time:
-            min_time = file_min_time
-
-    # Debug: Print global minimum time
-    # print(f"Global minimum time: {min_time}")
-    return min_time
-
-def plot_figure(files, ref_file=None, show_points=False):
+def plot_figure(files, ref_file=None, show_points=False, time_range=None, grid_step=1, points_only=False,
+                max_points=MAX_POINTS, downsample_method='lttb', dataset=None, channels=('temp',), resolution=None):
     """
     Plot temperature data with optional reference file.
 
@@ -79,85 +100,221 @@ def plot_figure(files, ref_file=None, show_points=False):
         files (list): List of file names without extensions.
         ref_file (str): Reference file name (without extension).
         show_points (bool): Whether to display actual data points on the graph.
+        time_range (tuple): Start and end in epoch seconds (None = whole files).
+        grid_step (float): Step of the shared interpolation grid in seconds (enlarged if the grid
+            would have more than MAX_GRID_POINTS points).
+        points_only (bool): Plot only the measured samples, without interpolation.
+        max_points (int): Maximum number of points of one trace (None = all points).
+        downsample_method (str): 'lttb' or 'minmax' (see modules/downsample.py).
+        dataset (Dataset): Data loaded once for the request and shared with other code paths.
+        channels (tuple): Plotted channels (see series_store.CHANNELS); more than one channel
+            is drawn as subplots with a shared time axis.
+        resolution (int): Plot the precomputed means of this rollup resolution in seconds
+            (see modules/rollups.py) instead of the raw samples (None = raw samples); the
+            buckets of all files are aligned, so no interpolation grid is used.
 
     Returns:
-        None
+        go.Figure: The figure.
     """
-    file_paths = validate_files(files)
-    fig = go.Figure()
-    global_min_time = calculate_global_min_time(file_paths)
-
-    for file_path in file_paths:
-        try:
-            # Load and process file
-            data = load_file(file_path)
-            interpolation_function = interpolate_data(data)
-            time_seconds = data['time']
-            temperature = data['temp']
-            full_time_range = pd.date_range(start=global_min_time, end=time_seconds.max(), freq='s')
+    channels = list(channels)
+    for channel in channels:
+        if channel not in CHANNELS:
+            raise KeyError(f"Channel {channel} not exist.")
+    if dataset is None:
+        dataset = Dataset(files, time_range)
+    file_paths = dataset.file_paths
+    multi = len(channels) > 1
+    if multi:
+        fig = make_subplots(rows=len(channels), cols=1, shared_xaxes=True, vertical_spacing=0.04)
+    else:
+        fig = go.Figure()
 
-            # Debug: Check time and temperature ranges
-            #print(f"File: {file_path}")
-            #print(f"Time range: {time_seconds.min()} - {time_seconds.max()}")
-            #print(f"Temperature stats: {temperature.describe()}")
+    # Load all files first, they share one time grid; the channels of a file form one 2-D array (sample x channel)
+    loaded = {}
+    values = {}
+    with span('plot.load'):
+        for file_path in file_paths:
+            try:
+                if resolution:
+                    start, end = dataset.time_range or (None, None)
+                    offset = dataset.offsets.get(os.path.basename(file_path).replace('.csv', ''), 0)
+                    data = load_rollup(file_path, resolution, None if start is None else start - offset,
+                                       None if end is None else end - offset, channels)
+                    data['timestamp'] += offset
+                    data['time'] = epoch_to_local(data['timestamp'])
+                else:
+                    data = load_file(file_path, dataset=dataset, channels=channels)
+                if not data.empty:
+                    loaded[file_path] = data.sort_values('timestamp', kind='stable').reset_index(drop=True)
+                    values[file_path] = loaded[file_path][channels].to_numpy(dtype=np.float64)
+            except Exception as e:
+                print(f"Error processing file {file_path}: {e}")
+
+    # Agregace mají společné začátky bloků, kreslí se přímo bez mřížky
+    points_only = points_only or bool(resolution)
+    if not points_only and loaded:
+        # Interpolate all files and channels onto one grid from the global minimum to the global maximum time
+        with span('plot.interpolate'):
+            seconds = [data['timestamp'].to_numpy() for data in loaded.values()]
+            start = min(times[0] for times in seconds)
+            end = max(times[-1] for times in seconds)
+            series = []
+            for times, file_path in zip(seconds, loaded):
+                for c in range(len(channels)):
+                    valid = ~np.isnan(values[file_path][:, c])
+                    series.append((times[valid], values[file_path][valid, c]))
+            grid, resampled = resample_to_grid(series, start, end, max(grid_step, (end - start) / MAX_GRID_POINTS))
+            resampled = resampled.reshape(len(loaded), len(channels), len(grid))
+            grid_time = epoch_to_local(grid)
 
-            # Interpolate temperature over the full time range
-            interpolated_temp = interpolation_function(
-                full_time_range.astype(np.int64) // 10**9
-            )
+    with span('plot.traces'):
+        for k, (file_path, data) in enumerate(loaded.items()):
+            time_seconds = data['time']
+            sample_seconds = data['timestamp'].to_numpy()
 
             # Extract file name without extension
             file_name = os.path.basename(file_path).replace('.csv', '')
+            is_reference = bool(ref_file) and ref_file in file_path
+            # Hodnoty se do JSON zapisují zaokrouhlené na přesnost zdroje (bez šumu float32)
+            decimals = source_decimals(file_path)
+            # U více kanálů má senzor ve všech podgrafech stejnou barvu a jednu položku legendy
+            color = 'purple' if is_reference else (DEFAULT_PLOTLY_COLORS[k % len(DEFAULT_PLOTLY_COLORS)] if multi else None)
+
+            for c, channel in enumerate(channels):
+                valid = ~np.isnan(values[file_path][:, c])
+                if not valid.any():
+                    continue
+                position = dict(row=c + 1, col=1) if multi else {}
+                group = dict(legendgroup=file_name, showlegend=c == 0) if multi else {}
+                measured = data[channel].to_numpy()[valid]
 
-            if ref_file and ref_file in file_path:
-                # Plot reference file with tolerance bands
-                fig.add_trace(go.Scatter(x=full_time_range, y=interpolated_temp, mode='lines', name=f'{file_name}' , line=dict(color='purple')))
-                fig.add_trace(go.Scatter(
-                    x=full_time_range, y=interpolated_temp + 0.5, mode='lines',
-                    name=f'+0.5°C {file_name}', line=dict(dash='dash', color='purple')
-                ))
-                fig.add_trace(go.Scatter(
-                    x=full_time_range, y=interpolated_temp - 0.5, mode='lines',
-                    name=f'-0.5°C {file_name}', line=dict(dash='dash', color='purple')
-                ))
-            else:
-                # Plot regular file data
-                fig.add_trace(go.Scatter(x=full_time_range, y=interpolated_temp, mode='lines', name=f'{file_name}'))
-
-            if show_points:
-                # Plot actual data points
-                fig.add_trace(go.Scatter(
-                    x=time_seconds, y=temperature, mode='markers', name=f'Měření {file_name}',
-                    marker=dict(color='red', size=8, symbol='circle')
-                ))
+                if points_only:
+                    x, y, x_seconds = time_seconds.to_numpy()[valid], measured, sample_seconds[valid]
+                else:
+                    x, y, x_seconds = grid_time, resampled[k, c], grid
+
+                # Cap the number of drawn points, peaks are preserved by the downsampling
+                selected = select_points(x_seconds, y, max_points, downsample_method)
+                # Naměřené hodnoty na přesnost zdroje, interpolované a průměry agregací jen bez šumu float32
+                raw = points_only and not resolution
+                x, y = x[selected], round_values(y[selected], decimals[channel]) if raw else round_significant(y[selected])
+
+                if resolution:
+                    # Rozsah min-max bloků agregace jako šedé pásmo pod průměrem
+                    low = round_significant(data[f'{channel}_min'].to_numpy()[valid][selected])
+                    high = round_significant(data[f'{channel}_max'].to_numpy()[valid][selected])
+                    fig.add_trace(go.Scatter(
+                        x=np.concatenate((x, x[::-1])), y=np.concatenate((high, low[::-1])), mode='lines',
+                        name=f'Min-max {file_name}', fill='toself', fillcolor='rgba(128, 128, 128, 0.2)',
+                        line=dict(width=0), hoverinfo='skip', showlegend=False
+                    ), **position)
+
+                if is_reference and channel == 'temp':
+                    # Plot reference file with tolerance bands
+                    fig.add_trace(go.Scatter(x=x, y=y, mode='lines', name=f'{file_name}' , line=dict(color='purple'),
+                                             meta=dict(file=file_name, column=channel, offset=0), **group), **position)
+                    fig.add_trace(go.Scatter(
+                        x=x, y=round_significant(y + TOLERANCE), mode='lines',
+                        name=f'+{TOLERANCE}°C {file_name}', line=dict(dash='dash', color='purple'),
+                        meta=dict(file=file_name, column=channel, offset=TOLERANCE)
+                    ), **position)
+                    fig.add_trace(go.Scatter(
+                        x=x, y=round_significant(y - TOLERANCE), mode='lines',
+                        name=f'-{TOLERANCE}°C {file_name}', line=dict(dash='dash', color='purple'),
+                        meta=dict(file=file_name, column=channel, offset=-TOLERANCE)
+                    ), **position)
+                else:
+                    # Plot regular file data
+                    fig.add_trace(go.Scatter(x=x, y=y, mode='lines', name=f'{file_name}',
+                                             line=dict(color=color) if color else None,
+                                             meta=dict(file=file_name, column=channel, offset=0), **group), **position)
+
+                if show_points and not resolution:
+                    # Plot actual data points (not loaded for rollups)
+                    selected = select_points(sample_seconds[valid], measured, max_points, downsample_method)
+                    fig.add_trace(go.Scatter(
+                        x=time_seconds.to_numpy()[valid][selected], y=round_values(measured[selected], decimals[channel]),
+                        mode='markers', name=f'Měření {file_name}',
+                        marker=dict(color='red', size=8, symbol='circle'),
+                        meta=dict(file=file_name, column=channel, offset=0), **group
+                    ), **position)
 
             try:
-                data = pd.read_csv(file_path, delimiter=',')  # Reload for door_open
                 if 'door_open' in data.columns:
-                    door_open = data['door_open'].astype(int)
+                    door_open = data['door_open'].to_numpy()
+                    selected = select_points(sample_seconds, door_open, max_points, 'minmax')
                     fig.add_trace(go.Scatter(
-                        x=time_seconds, 
-                        y=door_open, 
-                        mode='lines', 
-                        name=f'Stav dveří ({file_name})', 
-                        line=dict(color='red', dash='dot')
-                    ))
+                        x=time_seconds.to_numpy()[selected],
+                        y=round_values(door_open[selected], decimals['door_open']),
+                        mode='lines',
+                        name=f'Stav dveří ({file_name})',
+                        line=dict(color='red', dash='dot'),
+                        meta=dict(file=file_name, column='door_open', offset=0)
+                    ), **(dict(row=1, col=1) if multi else {}))
             except Exception as e:
                 print(f"Error: door_open {file_name}: {e}")
 
-        except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
-
-    # Configure the graph layout
-    fig.update_layout(
-        title='Temp data',
-        xaxis_title='Time',
-        yaxis_title='Temperature (°C)',
-        hovermode='x unified',
-        xaxis=dict(tickformat='%H:%M:%S'),
-    )
+    # Configure the graph layout (dates on the axis only for data spanning several days)
+    days = {day for data in loaded.values() for day in (data['time'].iloc[0].date(), data['time'].iloc[-1].date())}
+    tickformat = dict(tickformat='%H:%M:%S') if len(days) <= 1 else dict()
+    if multi:
+        fig.update_layout(title='Sensor data', hovermode='x unified', height=300 + 250 * len(channels))
+        for c, channel in enumerate(channels):
+            fig.update_yaxes(title_text=CHANNEL_TITLES[channel], row=c + 1, col=1)
+        fig.update_xaxes(**tickformat)
+        fig.update_xaxes(title_text='Time', row=len(channels), col=1)
+    else:
+        fig.update_layout(
+            title='Temp data' if channels == ['temp'] else 'Sensor data',
+            xaxis_title='Time',
+            yaxis_title=CHANNEL_TITLES[channels[0]],
+            hovermode='x unified',
+            xaxis=tickformat,
+        )
+    if any(dataset.offsets.values()):
+        # Posuny hodin senzorů pro načítání podrobných dat po přiblížení (zoom.js)
+        fig.update_layout(meta=dict(offsets=dataset.offsets))
     return fig
 
+def load_window(files, start, end, max_points=MAX_POINTS, downsample_method='lttb', offsets=None):
+    """
+    Load the measured samples of files in a zoomed time window.
+
+    Parameters:
+        files (list): List of file names without extensions.
+        start (pd.Timestamp): Start of the window on the graph time axis (local time).
+        end (pd.Timestamp): End of the window on the graph time axis (local time).
+        max_points (int): Maximum number of points per file and column.
+        downsample_method (str): 'lttb' or 'minmax'.
+        offsets (dict): File name -> clock offset in seconds applied in the graph (see modules/alignment.py).
+
+    Returns:
+        dict: File name -> column name -> {'x': times as strings, 'y': values}, for the channels
+        with data in the window and 'door_open'.
+    """
+    window = {}
+    time_range = tuple(int(t) for t in local_to_epoch([start.floor('s'), end.ceil('s')]))
+    dataset = Dataset(files, time_range, offsets=offsets)
+    for file_path in dataset.file_paths:
+        file_name = os.path.basename(file_path).replace('.csv', '')
+        data = load_file(file_path, dataset=dataset, channels=CHANNELS)
+        seconds = data['timestamp'].to_numpy()
+        decimals = source_decimals(file_path)
+        window[file_name] = {}
+        for column in CHANNELS + ['door_open']:
+            if column not in data.columns:
+                continue
+            values = data[column].to_numpy(dtype=np.float64)
+            valid = np.flatnonzero(~np.isnan(values))
+            if len(valid) == 0:
+                continue
+            method = 'minmax' if column == 'door_open' else downsample_method
+            selected = valid[select_points(seconds[valid], values[valid], max_points, method)]
+            # Formátují se jen vybrané časy, ne celé okno
+            times = data['time'].iloc[selected].dt.strftime('%Y-%m-%d %H:%M:%S')
+            window[file_name][column] = {'x': times.tolist(), 'y': round_values(values[selected], decimals[column]).tolist()}
+    return window
+
 def main():
     """
     Main function to execute the script.
@@ -174,13 +331,10 @@ def main():
             print("Exiting program.")
             return
         else:
-            ref_file = None 
+            ref_file = None
 
     fig = plot_figure(files, ref_file=ref_file, show_points=show_points)
     fig.show()
 
 if __name__ == "__main__":
-    from tools import validate_files
     main()
-else:
-    from modules.tools import validate_files
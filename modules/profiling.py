@@ -0,0 +1,231 @@
+import contextvars
+import cProfile
+import io
+import math
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Horní meze košů histogramu dob trvání (s) a složka pro výstupy cProfile
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf)
+PROFILE_DIR = './profiles'
+PROFILE_LINES = 30
+
+# Úseky aktuálního požadavku nebo úlohy (každé vlákno má vlastní kontext)
+_trace = contextvars.ContextVar('trace', default=None)
+
+class Histogram:
+    """Counts of durations in the BUCKETS with their total."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket containing the q-quantile (None without observations)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+class Metrics:
+    """Duration histograms of named stages, shared by all threads."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(self.buckets)
+            self._histograms[name].observe(seconds)
+
+    def snapshot(self):
+        """
+        Return a summary of all stages.
+
+        Returns:
+            dict: Stage name -> {'count', 'sum', 'mean', 'p50', 'p95', 'p99'} in seconds
+            (quantiles are bucket upper bounds).
+        """
+        with self._lock:
+            return {
+                name: {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'mean': histogram.sum / histogram.count if histogram.count else None,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                }
+                for name, histogram in sorted(self._histograms.items())
+            }
+
+    def to_text(self, metric='stage_duration_seconds'):
+        """
+        Return the histograms in the Prometheus text format.
+
+        Returns:
+            str: Cumulative '_bucket' lines with '_sum' and '_count' per stage.
+        """
+        lines = [f"# HELP {metric} Duration of instrumented stages.", f"# TYPE {metric} histogram"]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(float(bound))
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.sum}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+# Souhrnné histogramy všech požadavků (vystavené na /metrics)
+METRICS = Metrics()
+
+@contextmanager
+def span(name):
+    """
+    Measure the duration of a block of code.
+
+    The duration is added to METRICS and to the trace of the current request
+    or job, if one is active.
+
+    Parameters:
+        name (str): Stage name (e.g. 'plot.interpolate').
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        METRICS.observe(name, seconds)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((name, seconds))
+
+def start_trace():
+    """
+    Start collecting the spans of the current request or job.
+
+    Returns:
+        contextvars.Token: Token for end_trace.
+    """
+    return _trace.set([])
+
+def end_trace(token):
+    """
+    Stop collecting spans.
+
+    Parameters:
+        token (contextvars.Token): Token from start_trace.
+
+    Returns:
+        dict: Stage name -> total seconds, in the order the stages first finished.
+    """
+    spans = _trace.get() or []
+    _trace.reset(token)
+    timings = {}
+    for name, seconds in spans:
+        timings[name] = timings.get(name, 0.0) + seconds
+    return timings
+
+def server_timing(timings):
+    """
+    Format stage durations as a Server-Timing header value.
+
+    Parameters:
+        timings (dict): Stage name -> seconds (from end_trace).
+
+    Returns:
+        str: E.g. 'plot.load;dur=12.3, plot.interpolate;dur=40.1'.
+    """
+    # Název metriky v hlavičce musí být token bez mezer a oddělovačů
+    return ", ".join(f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)};dur={seconds * 1000:.1f}"
+                     for name, seconds in timings.items())
+
+def start_profile():
+    """
+    Start a cProfile profiler for the current thread.
+
+    Returns:
+        cProfile.Profile: The profiler, or None if another profiler is already active
+        (Python 3.12+ allows only one at a time).
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+def save_profile(profiler, label, directory=PROFILE_DIR, lines=PROFILE_LINES):
+    """
+    Stop a profiler and save its statistics.
+
+    The binary statistics (for pstats or snakeviz) and a text summary sorted
+    by cumulative time are written next to each other.
+
+    Parameters:
+        profiler (cProfile.Profile): Profiler from start_profile (may be None).
+        label (str): Name of the profiled request or job (part of the file name).
+        directory (str): Output directory.
+        lines (int): Number of functions in the text summary.
+
+    Returns:
+        str: Path to the .prof file (None without a profiler).
+    """
+    if profiler is None:
+        return None
+    profiler.disable()
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{re.sub(r'[^A-Za-z0-9_.-]', '_', label)}-{threading.get_ident()}"
+    path = os.path.join(directory, f"{name}.prof")
+    profiler.dump_stats(path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(lines)
+    with open(os.path.join(directory, f"{name}.txt"), mode="w", encoding="utf-8") as f:
+        f.write(summary.getvalue())
+    return path
+
+def profiled(function, label, directory=PROFILE_DIR):
+    """
+    Wrap a function so that every call is profiled with cProfile.
+
+    Used for background jobs, which run in another thread than the request.
+
+    Parameters:
+        function (callable): Function to wrap.
+        label (str): Name used in the profile file names.
+        directory (str): Output directory.
+
+    Returns:
+        callable: Wrapped function.
+    """
+    def wrapper(*args, **kwargs):
+        profiler = start_profile()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            save_profile(profiler, label, directory)
+    return wrapper
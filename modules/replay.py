@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import calendar
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+
+if not __package__:
+    from parser import parse_row, RAW_DIR
+    from ingest import IngestService, sensor_name_from_topic, tcp_source, merge_exports
+else:
+    from modules.parser import parse_row, RAW_DIR
+    from modules.ingest import IngestService, sensor_name_from_topic, tcp_source, merge_exports
+
+# Povolený rozsah zrychlení
+MIN_SPEED = 1
+MAX_SPEED = 1000
+# Nejdelší čekání (s) na zpracování zpráv lokální službou po konci přehrávání
+DRAIN_TIMEOUT = 60
+
+def find_exports(folders, raw_dir=RAW_DIR):
+    """
+    Return the raw CSV files of folders in raw_dir (e.g. '2024-12-19') or of direct paths.
+
+    Parameters:
+        folders (list): Folder names, folder paths or CSV file paths.
+        raw_dir (str): Directory with the raw exports.
+
+    Returns:
+        list: Paths to the raw CSV files.
+    """
+    paths = []
+    for folder in folders:
+        if os.path.isfile(folder):
+            paths.append(folder)
+            continue
+        folder_path = folder if os.path.isdir(folder) else os.path.join(raw_dir, folder)
+        if not os.path.isdir(folder_path):
+            raise FileNotFoundError(f"Folder {folder_path} not exist.")
+        paths.extend(os.path.join(folder_path, name) for name in sorted(os.listdir(folder_path)) if name.endswith('.csv'))
+    return paths
+
+class Recorder:
+    """Collect the delay of every delivered message and the emission lag behind the schedule."""
+
+    def __init__(self):
+        self.latency = []
+        self.lag = []
+        self.started = None
+        self.finished = None
+
+    def report(self):
+        """
+        Return throughput and delay percentiles.
+
+        Returns:
+            dict: 'messages', 'delivered', 'seconds', 'messages_per_sec' and latency/lag percentiles in ms.
+        """
+        seconds = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        report = {
+            'messages': len(self.lag),
+            'delivered': len(self.latency),
+            'seconds': seconds,
+            'messages_per_sec': len(self.lag) / seconds if seconds > 0 else 0.0,
+        }
+        for name, values in (('latency', self.latency), ('lag', self.lag)):
+            values = np.asarray(values) * 1000
+            for q in (50, 95, 99):
+                report[f'{name}_p{q}_ms'] = float(np.percentile(values, q)) if len(values) else None
+            report[f'{name}_max_ms'] = float(values.max()) if len(values) else None
+        return report
+
+async def replay(rows, emit, speed=None, recorder=None):
+    """
+    Emit rows with the original spacing divided by speed.
+
+    Parameters:
+        rows (iterable): Raw rows ordered by time (e.g. from merge_exports).
+        emit (callable): Coroutine function emit(row, scheduled) delivering one row.
+        speed (float): Speed relative to real time (MIN_SPEED-MAX_SPEED, None = as fast as possible).
+        recorder (Recorder): Collects the emission lag.
+
+    Returns:
+        Recorder: The recorder.
+    """
+    if speed is not None and not MIN_SPEED <= speed <= MAX_SPEED:
+        raise ValueError(f"Speed must be between {MIN_SPEED} and {MAX_SPEED}.")
+    recorder = recorder or Recorder()
+    recorder.started = time.perf_counter()
+    first_time = None
+    for count, row in enumerate(rows):
+        now = time.perf_counter()
+        if speed:
+            event_time = calendar.timegm(time.strptime(row["time"], '%Y-%m-%d %H:%M:%S'))
+            if first_time is None:
+                first_time = event_time
+            scheduled = recorder.started + (event_time - first_time) / speed
+            if scheduled > now:
+                await asyncio.sleep(scheduled - now)
+        else:
+            scheduled = now
+            if count % 1000 == 0:
+                await asyncio.sleep(0)
+        recorder.lag.append(time.perf_counter() - scheduled)
+        await emit(row, scheduled)
+    recorder.finished = time.perf_counter()
+    return recorder
+
+async def run_parser(rows, speed):
+    """Replay into the payload decoding of parser.py (in this process)."""
+    recorder = Recorder()
+
+    async def emit(row, scheduled):
+        name = sensor_name_from_topic(row["topic"])
+        if name is not None and parse_row(name, dict(row)) is not None:
+            recorder.latency.append(time.perf_counter() - scheduled)
+
+    return await replay(rows, emit, speed, recorder)
+
+async def run_ingest(rows, speed, output_dir):
+    """Replay directly into an IngestService (in this process), including the batched writes."""
+    recorder = Recorder()
+    service = IngestService(output_dir)
+
+    async def emit(row, scheduled):
+        if service.handle(row):
+            recorder.latency.append(time.perf_counter() - scheduled)
+        if service.pending() >= service.batch_size:
+            await service.flush()
+
+    await replay(rows, emit, speed, recorder)
+    await service.flush()
+    recorder.finished = time.perf_counter()
+    return recorder, service
+
+async def _wait_received(service, server, count):
+    """Wait until the service received count messages; re-raise the error of the server task if it ended."""
+    while service.stats['received'] < count:
+        if server.done():
+            if not server.cancelled() and server.exception() is not None:
+                raise server.exception()
+            raise ConnectionError(f"Ingest server stopped after {service.stats['received']} of {count} messages.")
+        await asyncio.sleep(0.01)
+
+async def run_tcp(rows, speed, host, port, output_dir=None, timeout=DRAIN_TIMEOUT):
+    """
+    Replay as JSON lines over TCP.
+
+    Without output_dir the messages go to a service that is already listening on
+    host:port and only the emission lag is measured. With output_dir a local
+    IngestService listens on host:port in this process and the end-to-end latency
+    (from the scheduled time to the stored sample) is measured as well; waiting
+    for the service to store the last messages fails after timeout seconds.
+    """
+    recorder = Recorder()
+    service = None
+    server = None
+    if output_dir is not None:
+        def stored(message):
+            recorder.latency.append(time.perf_counter() - float(message['_scheduled']))
+
+        service = IngestService(output_dir, on_stored=stored)
+        server = asyncio.create_task(service.run(tcp_source(host, port)))
+        await asyncio.sleep(0.1)
+
+    for attempt in range(50):
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            break
+        except OSError:
+            await asyncio.sleep(0.1)
+    else:
+        raise ConnectionError(f"Cannot connect to {host}:{port}.")
+
+    async def emit(row, scheduled):
+        writer.write(json.dumps(dict(row, _scheduled=scheduled)).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    await replay(rows, emit, speed, recorder)
+    writer.close()
+    await writer.wait_closed()
+
+    if service is not None:
+        try:
+            # Počkání na zpracování zpráv, které ještě čekají ve frontě služby
+            await asyncio.wait_for(_wait_received(service, server, len(recorder.lag)), timeout)
+            recorder.finished = time.perf_counter()
+        finally:
+            server.cancel()
+            try:
+                await server
+            except asyncio.CancelledError:
+                pass
+    return recorder, service
+
+def print_report(report, service=None):
+    print(f"Zpráv: {report['messages']}, doručeno: {report['delivered']}, doba: {report['seconds']:.2f} s, "
+          f"propustnost: {report['messages_per_sec']:.0f} zpráv/s.")
+    for name in ('latency', 'lag'):
+        if report[f'{name}_p50_ms'] is not None:
+            print(f"{name}: p50 {report[f'{name}_p50_ms']:.2f} ms, p95 {report[f'{name}_p95_ms']:.2f} ms, "
+                  f"p99 {report[f'{name}_p99_ms']:.2f} ms, max {report[f'{name}_max_ms']:.2f} ms")
+    if service is not None:
+        print(", ".join(f"{name}: {value}" for name, value in service.stats.items()))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Replay raw exports at accelerated speed and measure latency and throughput.")
+    arg_parser.add_argument('folders', nargs='+', help="Folders in data_raw (e.g. 2024-12-19), folder paths or raw CSV files.")
+    arg_parser.add_argument('--speed', type=float, default=None,
+                            help=f"Speed relative to real time ({MIN_SPEED}-{MAX_SPEED}, default: as fast as possible).")
+    arg_parser.add_argument('--target', choices=['parser', 'ingest', 'tcp'], default='ingest')
+    arg_parser.add_argument('--address', default='127.0.0.1:9000', help="HOST:PORT for the tcp target.")
+    arg_parser.add_argument('--external', action='store_true', help="Send to an already running service (tcp target), measure only the lag.")
+    arg_parser.add_argument('--output-dir', help="Directory for the parsed output (default: a temporary directory).")
+    arg_parser.add_argument('--json', help="Save the report to this JSON file.")
+    args = arg_parser.parse_args()
+
+    rows = merge_exports(find_exports(args.folders))
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="replay_")
+    service = None
+    try:
+        if args.target == 'parser':
+            recorder = asyncio.run(run_parser(rows, args.speed))
+        elif args.target == 'ingest':
+            recorder, service = asyncio.run(run_ingest(rows, args.speed, output_dir))
+        else:
+            host, port = args.address.rsplit(':', 1)
+            recorder, service = asyncio.run(run_tcp(rows, args.speed, host, int(port), None if args.external else output_dir))
+    finally:
+        if args.output_dir is None:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    report = recorder.report()
+    print_report(report, service)
+    if args.json:
+        with open(args.json, mode="w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+
+# Výchozí složka a velikost cache hotových výsledků (grafy ve formátu JSON)
+CACHE_DIR = './result_cache'
+MAX_BYTES = 256 * 1024 * 1024
+# Verze tvaru uložených výsledků; zvýší se při každé změně výstupu výpočtů
+# (struktura grafu nebo tabulky, výchozí konstanty), aby se staré položky nepoužily
+CACHE_VERSION = 2
+
+def make_key(kind, params, file_paths):
+    """
+    Build a content-addressed key of a computation.
+
+    The key changes whenever a parameter, the content of a source file or
+    CACHE_VERSION changes, so identical requests from different users share one entry.
+
+    Parameters:
+        kind (str): Name of the computation (e.g. 'progress_graph').
+        params (dict): JSON serializable parameters.
+        file_paths (list): Paths to the parsed CSV files used by the computation.
+
+    Returns:
+        str: Hex digest usable as a file name.
+    """
+    sources = {os.path.basename(path): source_hash(path) for path in file_paths}
+    description = json.dumps({'version': CACHE_VERSION, 'kind': kind, 'params': params, 'sources': sources}, sort_keys=True)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """
+    Size-bounded on-disk cache of computed results with LRU eviction.
+
+    Every entry is one file named by its key; the file modification time is
+    refreshed on every hit and the least recently used entries are removed
+    when the total size exceeds max_bytes.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        if not key or not all(c in '0123456789abcdef' for c in key):
+            raise ValueError(f"Invalid cache key: {key}")
+        return os.path.join(self.directory, f"{key}.json")
+
+    def contains(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """
+        Return the cached value, or None if it is not (or no longer) cached.
+
+        Parameters:
+            key (str): Key from make_key.
+
+        Returns:
+            str: Cached text.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # Označení posledního použití pro LRU
+        except FileNotFoundError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """
+        Store a value and evict old entries if the cache is too large.
+
+        Parameters:
+            key (str): Key from make_key.
+            value (str): Text to store.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value or compute, store and return it.
+
+        Parameters:
+            key (str): Key from make_key.
+            compute (callable): Function without arguments returning the text to cache.
+
+        Returns:
+            str: Cached or computed text.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits into max_bytes."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+if not __package__:
+    from series_store import source_hash
+else:
+    from modules.series_store import source_hash
@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+
+if not __package__:
+    from tools import validate_files
+    from series_store import read_range, source_hash, load_series, parsed_files, CHANNELS
+else:
+    from modules.tools import validate_files
+    from modules.series_store import read_range, source_hash, load_series, parsed_files, CHANNELS
+
+# Složka s agregacemi (vedle zdrojových CSV) a jejich rozlišení v sekundách (od nejjemnějšího)
+ROLLUP_DIR = ".rollups"
+RESOLUTIONS = (60, 300, 3600)
+# Verze formátu; při změně se agregace přepočítají celé
+ROLLUP_VERSION = 2
+# Statistiky každého kanálu v agregaci
+STATS = ('count', 'sum', 'min', 'max')
+
+# Načtené agregace v tomto procesu: cesta -> (sha1 zdroje, {rozlišení: pole})
+_rollups = {}
+_lock = threading.Lock()
+
+def rollup_path(file_path):
+    """
+    Return the directory with the rollups of a parsed CSV file.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+
+    Returns:
+        str: Path to the directory (data_parsed/.rollups/<name>).
+    """
+    folder, name = os.path.split(file_path)
+    return os.path.join(folder, ROLLUP_DIR, os.path.splitext(name)[0])
+
+def aggregate(timestamp, columns, resolution):
+    """
+    Aggregate sorted samples or finer rollup rows into buckets of a fixed length.
+
+    Parameters:
+        timestamp (np.ndarray): Sorted epoch seconds (or bucket starts of a finer rollup).
+        columns (dict): Channel -> dict with 'count', 'sum', 'min' and 'max' arrays of the same length
+            as timestamp (for raw samples count is 1 and sum, min and max are the value; NaN values are skipped).
+        resolution (int): Bucket length in seconds.
+
+    Returns:
+        dict: 'bucket' (bucket starts, epoch seconds aligned to resolution) and '<channel>_<stat>' arrays.
+    """
+    bucket = np.asarray(timestamp, dtype=np.int64) // resolution * resolution
+    if len(bucket) == 0:
+        return {'bucket': bucket, **{f'{channel}_{stat}': np.zeros(0) for channel in columns for stat in STATS}}
+    # Data jsou seřazená, začátky skupin jsou místa změny bloku
+    starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+    result = {'bucket': bucket[starts]}
+    for channel, stats in columns.items():
+        count = np.asarray(stats['count'], dtype=np.int64)
+        valid = count > 0
+        result[f'{channel}_count'] = np.add.reduceat(count, starts)
+        result[f'{channel}_sum'] = np.add.reduceat(np.where(valid, stats['sum'], 0.0).astype(np.float64), starts)
+        # fmin/fmax přeskakují NaN; blok bez platné hodnoty zůstane NaN
+        result[f'{channel}_min'] = np.fmin.reduceat(np.where(valid, stats['min'], np.nan).astype(np.float64), starts)
+        result[f'{channel}_max'] = np.fmax.reduceat(np.where(valid, stats['max'], np.nan).astype(np.float64), starts)
+    return result
+
+def _raw_columns(series):
+    """Statistics of single raw samples for aggregate."""
+    columns = {}
+    for channel in CHANNELS:
+        values = np.asarray(series[channel], dtype=np.float64)
+        columns[channel] = {'count': (~np.isnan(values)).astype(np.int64), 'sum': values, 'min': values, 'max': values}
+    return columns
+
+def _rollup_columns(rollup, start=0):
+    """Statistics of rollup rows from position start, for aggregating into a coarser resolution."""
+    return {channel: {stat: rollup[f'{channel}_{stat}'][start:] for stat in STATS} for channel in CHANNELS}
+
+def _concat(old, keep, new):
+    """Keep the first keep rows of a rollup and append new rows."""
+    return {name: np.concatenate((values[:keep], new[name])) for name, values in old.items()}
+
+def build_rollups(file_path, previous=None):
+    """
+    Compute the rollups of a file, reusing previous rollups when only new samples were appended.
+
+    The last bucket of the finest resolution and everything after it is
+    aggregated again from the raw samples; coarser resolutions are aggregated
+    from the finest rollup rows. The previous rollups are reused only if the
+    samples before that bucket are unchanged (same first time and count);
+    update_rollups passes them only if the old source is a byte prefix of the new one.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+        previous (dict): Rollups and state from an earlier call (None = build from scratch).
+
+    Returns:
+        dict: 'rollups' (resolution -> arrays), 'first' (first time), 'covered' (samples before
+        the last bucket of the finest resolution) and 'rebuilt' (False if only the tail was updated).
+    """
+    timestamp = load_series(file_path)['timestamp']
+    finest = RESOLUTIONS[0]
+    start = None
+    if previous is not None and len(timestamp) and previous['first'] == int(timestamp[0]):
+        rows = previous['rollups'][finest]['bucket']
+        if len(rows) and int(np.searchsorted(timestamp, rows[-1], side='left')) == previous['covered']:
+            start = int(rows[-1])
+
+    tail = read_range(file_path, start, None)
+    fine = aggregate(tail['timestamp'], _raw_columns(tail), finest)
+    rollups = {}
+    if start is None:
+        rollups[finest] = fine
+    else:
+        old = previous['rollups'][finest]
+        rollups[finest] = _concat(old, len(old['bucket']) - 1, fine)
+    for resolution in RESOLUTIONS[1:]:
+        if start is None:
+            rollups[resolution] = aggregate(rollups[finest]['bucket'], _rollup_columns(rollups[finest]), resolution)
+            continue
+        # Přepočítá se poslední hrubý blok a vše za ním
+        old = previous['rollups'][resolution]
+        coarse_start = int(old['bucket'][-1]) if len(old['bucket']) else start
+        position = int(np.searchsorted(rollups[finest]['bucket'], coarse_start, side='left'))
+        new = aggregate(rollups[finest]['bucket'][position:], _rollup_columns(rollups[finest], position), resolution)
+        rollups[resolution] = _concat(old, max(len(old['bucket']) - 1, 0), new)
+
+    last = rollups[finest]['bucket']
+    covered = int(np.searchsorted(timestamp, last[-1], side='left')) if len(last) else 0
+    return {'rollups': rollups, 'first': int(timestamp[0]) if len(timestamp) else None,
+            'covered': covered, 'rebuilt': start is None}
+
+def _prefix_hash(file_path, size):
+    """SHA-1 of the first size bytes of a file (None if the file is shorter)."""
+    sha1 = hashlib.sha1()
+    remaining = size
+    with open(file_path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(remaining, 1 << 20))
+            if not block:
+                return None
+            sha1.update(block)
+            remaining -= len(block)
+    return sha1.hexdigest()
+
+def _save(directory, state, sha1, prefix):
+    os.makedirs(directory, exist_ok=True)
+    # Jedinečná dočasná jména, aby se zápisy z více procesů nepřepisovaly
+    for resolution, rollup in state['rollups'].items():
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{resolution}.", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **rollup)
+        os.replace(tmp_path, os.path.join(directory, f"{resolution}.npz"))
+    # meta.json se zapisuje poslední, označuje platné agregace
+    meta = {'version': ROLLUP_VERSION, 'sha1': sha1, 'first': state['first'], 'covered': state['covered'],
+            'resolutions': list(RESOLUTIONS), 'size': prefix[0], 'prefix_sha1': prefix[1]}
+    fd, tmp_path = tempfile.mkstemp(prefix="meta.", suffix=".tmp", dir=directory)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+def _load(directory):
+    """Read stored rollups and their meta data (None if missing or of another version)."""
+    try:
+        with open(os.path.join(directory, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != ROLLUP_VERSION or meta.get('resolutions') != list(RESOLUTIONS):
+            return None
+        rollups = {}
+        for resolution in RESOLUTIONS:
+            with np.load(os.path.join(directory, f"{resolution}.npz")) as data:
+                rollups[resolution] = {name: data[name] for name in data.files}
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+    return meta, {'rollups': rollups, 'first': meta['first'], 'covered': meta['covered']}
+
+def update_rollups(file_path):
+    """
+    Return the up-to-date rollups of a file, updating the stored ones if the source changed.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+
+    Returns:
+        dict: Resolution (s) -> dict of arrays ('bucket' and '<channel>_<stat>').
+    """
+    key = os.path.abspath(file_path)
+    sha1 = source_hash(file_path)
+    with _lock:
+        cached = _rollups.get(key)
+        if cached is not None and cached[0] == sha1:
+            return cached[1]
+        directory = rollup_path(file_path)
+        stored = _load(directory)
+        if stored is not None and stored[0]['sha1'] == sha1:
+            state = stored[1]
+        else:
+            # Navázat lze jen na zdroj, který je začátkem nového (připsané řádky); jinak vše znovu
+            previous = None
+            if stored is not None and _prefix_hash(file_path, stored[0]['size']) == stored[0]['prefix_sha1']:
+                previous = stored[1]
+            size = os.path.getsize(file_path)
+            state = build_rollups(file_path, previous)
+            _save(directory, state, sha1, (size, _prefix_hash(file_path, size)))
+        _rollups[key] = (sha1, state['rollups'])
+        return state['rollups']
+
+def load_rollup(file_path, resolution, start=None, end=None, channels=CHANNELS):
+    """
+    Read the rollup of a file at one resolution.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+        resolution (int): One of RESOLUTIONS (s).
+        start (int): First epoch second (None = from the beginning); buckets starting before it are skipped.
+        end (int): Last epoch second, inclusive (None = to the end).
+        channels (list): Returned channels.
+
+    Returns:
+        pd.DataFrame: 'timestamp' (bucket start, epoch seconds) and '<channel>' (mean),
+        '<channel>_min', '<channel>_max', '<channel>_count' for every channel; buckets
+        without any value of the channels are left out.
+    """
+    if resolution not in RESOLUTIONS:
+        raise KeyError(f"Resolution {resolution} not exist.")
+    rollup = update_rollups(file_path)[resolution]
+    bucket = rollup['bucket']
+    lo = 0 if start is None else int(np.searchsorted(bucket, start, side='left'))
+    hi = len(bucket) if end is None else int(np.searchsorted(bucket, end, side='right'))
+    data = {'timestamp': bucket[lo:hi]}
+    for channel in channels:
+        count = rollup[f'{channel}_count'][lo:hi]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            data[channel] = rollup[f'{channel}_sum'][lo:hi] / count
+        data[f'{channel}_min'] = rollup[f'{channel}_min'][lo:hi]
+        data[f'{channel}_max'] = rollup[f'{channel}_max'][lo:hi]
+        data[f'{channel}_count'] = count
+    frame = pd.DataFrame(data)
+    used = frame[[f'{channel}_count' for channel in channels]].to_numpy().sum(axis=1) > 0
+    return frame[used].reset_index(drop=True)
+
+def rollup_resolution(freq):
+    """
+    Return the rollup resolution equal to a pandas frequency (e.g. '5min'), or None.
+
+    Parameters:
+        freq (str): Frequency string.
+
+    Returns:
+        int: Resolution in seconds if a rollup of this length exists.
+    """
+    seconds = int(pd.Timedelta(freq).total_seconds())
+    return seconds if seconds in RESOLUTIONS else None
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Build or update the rollups (1 min, 5 min, 1 h) of parsed files.")
+    arg_parser.add_argument('files', nargs='*', help="File names without extensions (default: all parsed files).")
+    args = arg_parser.parse_args()
+
+    files = args.files or parsed_files()
+    for file_path in validate_files(files):
+        rollups = update_rollups(file_path)
+        print(f"{os.path.basename(file_path)}: " + ", ".join(f"{resolution} s: {len(rollup['bucket'])} řádků"
+                                                          for resolution, rollup in rollups.items()))
+
+if __name__ == "__main__":
+    main()
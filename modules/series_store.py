@@ -0,0 +1,507 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+
+# Název složky s binárními kopiemi (vedle zdrojového CSV)
+CACHE_DIR = ".cache"
+# Verze formátu; při změně převodu se všechny cache přestaví
+STORE_VERSION = 4
+# Každý INDEX_STRIDE-tý čas se ukládá do malého indexu pro rychlé hledání rozsahu
+INDEX_STRIDE = 1024
+
+# Otevřené memory-mapy v tomto procesu: cesta -> ((mtime_ns, size), sloupce, index, sha1 zdroje, desetinná místa)
+_handles = {}
+# Zámek pro každou cestu: cache jednoho souboru staví (a otevírá) vždy jen jedno vlákno
+_locks = {}
+_locks_guard = threading.Lock()
+
+# Číselné kanály uložené jako float32
+CHANNELS = ['temp', 'humidity', 'co2']
+# Nejvíce desetinných míst zdrojových hodnot (float32 má asi 7 platných číslic)
+MAX_DECIMALS = 6
+# Platné číslice hodnot odvozených z kanálů (interpolace, průměry) v JSON
+SIGNIFICANT_DIGITS = 6
+# Časové pásmo, ve kterém jsou zapsány časy v exportech (místní čas laboratoře)
+TIMEZONE = 'Europe/Prague'
+# Mezera v datech (s), po které začíná nové měření (sezení)
+SESSION_GAP = 6 * 3600
+# Složka se zpracovanými CSV soubory
+PARSED_DIR = './data_parsed/'
+_ZONE = ZoneInfo(TIMEZONE)
+
+def cache_path(file_path):
+    """
+    Return the cache directory of a parsed CSV file.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+
+    Returns:
+        str: Path to the directory with the column files.
+    """
+    folder, name = os.path.split(file_path)
+    return os.path.join(folder, CACHE_DIR, os.path.splitext(name)[0])
+
+def _file_hash(file_path):
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def _to_float(column):
+    """Convert a column with decimal commas and 'N/D'/'N/A'/'null' markers to float32."""
+    return pd.to_numeric(column.str.replace(',', '.'), errors='coerce').to_numpy(dtype=np.float32)
+
+def local_to_epoch(local_times):
+    """
+    Convert naive local date-times (TIMEZONE) to epoch seconds.
+
+    Times in the hour repeated when daylight saving time ends are resolved from
+    the order of the samples where possible, otherwise as standard time; times
+    skipped when it starts are shifted forward.
+
+    Parameters:
+        local_times (array-like): Naive datetime values, ideally sorted.
+
+    Returns:
+        np.ndarray: int64 epoch seconds (UTC).
+    """
+    local_times = pd.DatetimeIndex(local_times)
+    try:
+        aware = local_times.tz_localize(TIMEZONE, ambiguous='infer', nonexistent='shift_forward')
+    except (ValueError, TypeError):
+        # Opakovanou hodinu nelze odvodit z pořadí, bere se jako zimní čas
+        aware = local_times.tz_localize(TIMEZONE, ambiguous=np.zeros(len(local_times), dtype=bool),
+                                        nonexistent='shift_forward')
+    return aware.as_unit('s').asi8
+
+def local_time_to_epoch(text):
+    """
+    Convert one local time 'YYYY-MM-DD HH:MM:SS' (TIMEZONE) to epoch seconds.
+
+    Faster than local_to_epoch for single values (e.g. live messages); in the
+    repeated hour at the end of daylight saving time the first occurrence is used.
+
+    Parameters:
+        text (str): Local date and time.
+
+    Returns:
+        int: Epoch seconds (UTC).
+    """
+    return int(datetime.strptime(text, '%Y-%m-%d %H:%M:%S').replace(tzinfo=_ZONE).timestamp())
+
+def epoch_to_local(timestamps):
+    """
+    Convert epoch seconds to naive local date-times (TIMEZONE), e.g. for the graph axes.
+
+    Parameters:
+        timestamps (array-like): Epoch seconds.
+
+    Returns:
+        pd.DatetimeIndex: Local wall-clock times without a timezone.
+    """
+    return pd.to_datetime(np.asarray(timestamps), unit='s', utc=True).tz_convert(TIMEZONE).tz_localize(None)
+
+def build_series(file_path):
+    """
+    Convert a parsed CSV file into typed columns.
+
+    The local 'date' and 'time' of every row are converted once to epoch seconds,
+    so rows from several days or across midnight keep their order.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+
+    Returns:
+        dict: Column name -> numpy array, sorted by 'timestamp' (int64 epoch seconds, UTC).
+    """
+    data = pd.read_csv(file_path, delimiter=',', dtype=str, encoding='utf-8-sig')
+    if 'date' not in data.columns or 'temp' not in data.columns or 'time' not in data.columns:
+        raise KeyError(f"'date', 'temp or 'time' {file_path} not exist.")
+
+    date_time = pd.to_datetime(data['date'] + ' ' + data['time'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    rows = np.flatnonzero(date_time.notna().to_numpy())
+    local_times = date_time.to_numpy()[rows]
+    # Seřazení podle místního času (kvůli odvození opakované hodiny), pak podle epochy
+    rows = rows[np.argsort(local_times, kind='stable')]
+    timestamp = local_to_epoch(date_time.to_numpy()[rows])
+    order = np.argsort(timestamp, kind='stable')
+    rows = rows[order]
+
+    series = {'timestamp': timestamp[order]}
+    for channel in CHANNELS:
+        if channel in data.columns:
+            series[channel] = _to_float(data[channel])[rows]
+        else:
+            series[channel] = np.full(len(rows), np.nan, dtype=np.float32)
+    if 'door_open' in data.columns:
+        series['door_open'] = _to_float(data['door_open'])[rows]
+    return series
+
+def value_decimals(values):
+    """
+    Return the number of decimal places of float32 values parsed from text.
+
+    Parameters:
+        values (np.ndarray): float32 values (NaN are ignored).
+
+    Returns:
+        int: Smallest number of decimals (at most MAX_DECIMALS) at which all values
+        convert back to the same float32, i.e. the precision of the source file.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    values = values[~np.isnan(values)]
+    wide = values.astype(np.float64)
+    for decimals in range(MAX_DECIMALS):
+        if np.array_equal(np.round(wide, decimals).astype(np.float32), values):
+            return decimals
+    return MAX_DECIMALS
+
+def round_values(values, decimals):
+    """
+    Convert values to float64 rounded to the source precision, without float32 noise in JSON.
+
+    Parameters:
+        values (np.ndarray): Values (float32 columns or values computed from them).
+        decimals (int): Number of decimal places (see source_decimals).
+
+    Returns:
+        np.ndarray: Rounded float64 values.
+    """
+    return np.round(np.asarray(values, dtype=np.float64), decimals)
+
+def round_significant(values, digits=SIGNIFICANT_DIGITS):
+    """
+    Round values computed from float32 columns (interpolated, averaged) to significant digits.
+
+    Unlike round_values this keeps their resolution and only strips the float32 noise.
+
+    Parameters:
+        values (np.ndarray): Values.
+        digits (int): Number of significant digits.
+
+    Returns:
+        np.ndarray: Rounded float64 values (NaN and zeros unchanged).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    exponent = np.where(np.isfinite(magnitude), digits - 1 - magnitude, 0)
+    # Násobí se i dělí přesnou mocninou deseti, aby výsledek neměl nový šum
+    scale = 10.0 ** np.abs(exponent)
+    return np.where(exponent >= 0, np.round(values * scale) / scale, np.round(values / scale) * scale)
+
+def _write_cache(directory, series, meta):
+    """
+    Write the columns into a new generation folder and switch meta.json to it.
+
+    Readers that still have the previous generation memory-mapped keep working;
+    old generations are removed when possible.
+    """
+    generation = meta['generation']
+    target = os.path.join(directory, generation)
+    os.makedirs(target, exist_ok=True)
+    # Jedinečná dočasná jména, aby se zápisy z více procesů nepřepisovaly
+    for name, values in series.items():
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=target)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, values)
+        os.replace(tmp_path, os.path.join(target, f"{name}.npy"))
+    # meta.json se zapisuje poslední, označuje platnou cache
+    fd, tmp_path = tempfile.mkstemp(prefix="meta.", suffix=".tmp", dir=directory)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+    # Starší generace se mažou, pokud je právě neplní jiný proces (rozepsané soubory .tmp)
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name != generation and os.path.isdir(path) and not any(f.endswith('.tmp') for f in os.listdir(path)):
+            shutil.rmtree(path, ignore_errors=True)
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, "meta.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _is_valid(meta, file_path, stat):
+    """Check the cache against the source file: mtime and size first, content hash if only mtime changed."""
+    if meta is None or meta.get('version') != STORE_VERSION or meta.get('size') != stat.st_size:
+        return False
+    if meta.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    return meta.get('sha1') == _file_hash(file_path)
+
+def _open_cache(directory, meta):
+    """Memory-map the columns and the time index of a cache generation."""
+    target = os.path.join(directory, meta['generation'])
+    series = {name: np.load(os.path.join(target, f"{name}.npy"), mmap_mode='r') for name in meta['columns']}
+    if any(len(values) != meta['rows'] for values in series.values()):
+        return None
+    index = np.load(os.path.join(target, "index.npy"))
+    return series, index
+
+def _path_lock(key):
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+def _open_series(file_path):
+    """Return memory-mapped columns and the time index, rebuilding the cache if the source changed."""
+    key = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    handle = _handles.get(key)
+    if handle is not None and handle[0] == (stat.st_mtime_ns, stat.st_size):
+        return handle[1], handle[2]
+
+    with _path_lock(key):
+        # Mezitím mohlo cache postavit jiné vlákno
+        handle = _handles.get(key)
+        if handle is not None and handle[0] == (stat.st_mtime_ns, stat.st_size):
+            return handle[1], handle[2]
+        opened, meta = _build_or_open(file_path, stat)
+        _handles[key] = ((stat.st_mtime_ns, stat.st_size), opened[0], opened[1], meta['sha1'], meta['decimals'])
+    return opened
+
+def _build_or_open(file_path, stat):
+    """Open a valid cache of the file, or build it; called under the lock of the path."""
+    directory = cache_path(file_path)
+    meta = _read_meta(directory)
+    opened = None
+    if _is_valid(meta, file_path, stat):
+        try:
+            opened = _open_cache(directory, meta)
+        except (FileNotFoundError, ValueError):
+            opened = None
+        if opened is not None and meta['mtime_ns'] != stat.st_mtime_ns:
+            meta['mtime_ns'] = stat.st_mtime_ns
+            _write_cache(directory, {}, meta)
+
+    if opened is None:
+        series = build_series(file_path)
+        sha1 = _file_hash(file_path)
+        meta = {
+            'version': STORE_VERSION,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha1': sha1,
+            'generation': sha1[:16],
+            'columns': list(series),
+            'rows': len(series['timestamp']),
+            'decimals': {name: value_decimals(values) for name, values in series.items() if name != 'timestamp'},
+        }
+        series['index'] = np.ascontiguousarray(series['timestamp'][::INDEX_STRIDE])
+        _write_cache(directory, series, meta)
+        opened = _open_cache(directory, meta)
+    return opened, meta
+
+def load_series(file_path):
+    """
+    Load the typed columns of a parsed CSV file, converting it on first use.
+
+    The binary copy is stored in data_parsed/.cache/<name>/ and rebuilt whenever
+    the source CSV changes. The arrays are read-only memory maps, so processes
+    reading the same file share its pages through the OS cache.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+
+    Returns:
+        dict: Column name -> numpy array ('timestamp' int64 epoch seconds, channels float32).
+    """
+    return _open_series(file_path)[0]
+
+def source_hash(file_path):
+    """
+    Return the SHA-1 of the source CSV file (computed when its cache was built).
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    _open_series(file_path)
+    return _handles[os.path.abspath(file_path)][3]
+
+def source_decimals(file_path):
+    """
+    Return the precision of the channels of a parsed CSV file (computed when its cache was built).
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+
+    Returns:
+        dict: Column name -> number of decimal places in the source file.
+    """
+    _open_series(file_path)
+    return _handles[os.path.abspath(file_path)][4]
+
+def _search(timestamp, index, value, side):
+    """Binary search in the sparse index, then inside one block of the memory-mapped timestamps."""
+    block = int(np.searchsorted(index, value, side=side))
+    lo = max(block - 1, 0) * INDEX_STRIDE
+    hi = min(block * INDEX_STRIDE + 1, len(timestamp))
+    return lo + int(np.searchsorted(timestamp[lo:hi], value, side=side))
+
+def read_range(file_path, start=None, end=None):
+    """
+    Read the samples of a parsed CSV file in the time range [start, end].
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+        start (int): First epoch second (None = from the beginning).
+        end (int): Last epoch second, inclusive (None = to the end).
+
+    Returns:
+        dict: Column name -> zero-copy slice of the memory-mapped column.
+    """
+    series, index = _open_series(file_path)
+    timestamp = series['timestamp']
+    lo = 0 if start is None else _search(timestamp, index, start, 'left')
+    hi = len(timestamp) if end is None else _search(timestamp, index, end, 'right')
+    return {name: values[lo:hi] for name, values in series.items()}
+
+def load_frame(file_path, start=None, end=None):
+    """
+    Load a parsed CSV file as a DataFrame with numeric columns only.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+        start (int): First epoch second (None = from the beginning).
+        end (int): Last epoch second, inclusive (None = to the end).
+
+    Returns:
+        pd.DataFrame: 'timestamp' (int64 epoch seconds), 'date_time' (timezone-aware, TIMEZONE)
+        and the float32 channels ('temp', 'humidity', 'co2', optionally 'door_open').
+    """
+    return frame_from_columns(read_range(file_path, start, end))
+
+def frame_from_columns(series):
+    """
+    Copy columns (e.g. from read_range) into a DataFrame.
+
+    Parameters:
+        series (dict): Column name -> numpy array, including 'timestamp'.
+
+    Returns:
+        pd.DataFrame: 'timestamp' (int64 epoch seconds), 'date_time' (timezone-aware, TIMEZONE)
+        and the other columns.
+    """
+    data = pd.DataFrame({name: np.array(values) for name, values in series.items() if name != 'timestamp'})
+    timestamp = np.array(series['timestamp'], dtype=np.int64)
+    data.insert(0, 'date_time', pd.to_datetime(timestamp, unit='s', utc=True).tz_convert(TIMEZONE))
+    data.insert(0, 'timestamp', timestamp)
+    return data
+
+def time_ranges_on_day(file_path, time_ranges):
+    """
+    Convert many local time ranges to epoch seconds at once (see time_range_on_day).
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+        time_ranges (list): (start, end) tuples of 'HH:MM:SS' or 'YYYY-MM-DD HH:MM:SS' strings.
+
+    Returns:
+        tuple: Start and end arrays (int64 epoch seconds) in the order of time_ranges,
+        or None for an empty file.
+    """
+    timestamp = load_series(file_path)['timestamp']
+    if len(timestamp) == 0:
+        return None
+    day = epoch_to_local(timestamp[:1])[0].normalize()
+    texts = np.array([[t.strip() for t in time_range] for time_range in time_ranges], dtype=object).reshape(-1, 2)
+    dated = np.char.find(texts.astype(str), ' ') >= 0
+    local = np.empty(texts.shape, dtype='datetime64[ns]')
+    if dated.any():
+        local[dated] = pd.to_datetime(texts[dated], format='%Y-%m-%d %H:%M:%S').to_numpy()
+    if (~dated).any():
+        local[~dated] = (day + pd.to_timedelta(texts[~dated])).to_numpy()
+    # Rozsah bez data, jehož konec není po začátku, pokračuje přes půlnoc
+    crosses = ~dated[:, 1] & (local[:, 1] <= local[:, 0])
+    local[crosses, 1] += np.timedelta64(1, 'D')
+    # Každý sloupec zvlášť, aby se opakovaná hodina na konci letního času určila podle pořadí
+    return local_to_epoch(local[:, 0]), local_to_epoch(local[:, 1])
+
+def time_range_on_day(file_path, time_range):
+    """
+    Convert a local time range to epoch seconds.
+
+    'HH:MM:SS' times are taken on the first day of the file; a range whose end is
+    not after its start crosses midnight and ends on the next day. Times written
+    as 'YYYY-MM-DD HH:MM:SS' select any day of a multi-day file.
+
+    Parameters:
+        file_path (str): Path to the parsed CSV file.
+        time_range (tuple): Start and end as 'HH:MM:SS' or 'YYYY-MM-DD HH:MM:SS' strings.
+
+    Returns:
+        tuple: Start and end in epoch seconds, or None for an empty file.
+    """
+    edges = time_ranges_on_day(file_path, [time_range])
+    if edges is None:
+        return None
+    return int(edges[0][0]), int(edges[1][0])
+
+def find_sessions(timestamp, gap=SESSION_GAP):
+    """
+    Split sorted times (e.g. of the reference) into measurement sessions.
+
+    A new session starts after a gap without data longer than gap, so a
+    session running over midnight stays one session.
+
+    Parameters:
+        timestamp (np.ndarray): Sorted epoch seconds.
+        gap (float): Minimal gap between sessions in seconds.
+
+    Returns:
+        list: List of (start, end) tuples in epoch seconds (end is the last sample).
+    """
+    timestamp = np.asarray(timestamp)
+    if len(timestamp) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(timestamp) > gap) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(timestamp)])) - 1
+    return [(int(timestamp[start]), int(timestamp[end])) for start, end in zip(starts, ends)]
+
+def range_fingerprint(file_path, start, end):
+    """Return the number of samples and the last time of a file within a time range (-1 without samples)."""
+    timestamp = read_range(file_path, start, end)['timestamp']
+    return len(timestamp), int(timestamp[-1]) if len(timestamp) else -1
+
+def parsed_files(directory=PARSED_DIR):
+    """Return the sorted names (without extensions) of all parsed CSV files."""
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(directory) if f.endswith('.csv'))
+
+def load_table(table_file, columns):
+    """
+    Load a cached result table from a CSV file.
+
+    Parameters:
+        table_file (str): Path to the CSV file (None = no file).
+        columns (list): Columns of the empty table.
+
+    Returns:
+        pd.DataFrame: The table (empty with the columns if the file does not exist).
+    """
+    if not table_file or not os.path.exists(table_file):
+        return pd.DataFrame(columns=columns)
+    return pd.read_csv(table_file)
+
+def save_table(table, table_file):
+    """Write a result table to a CSV file atomically (through a uniquely named temporary file)."""
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(table_file) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(table_file)))
+    with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+        table.to_csv(f, index=False)
+    os.replace(tmp_path, table_file)
@@ -1,4 +1,10 @@
 import os
+import re
+from datetime import datetime
+import numpy as np
+
+# Časový úsek 'HH:MM:SS-HH:MM:SS', případně s datem u obou konců
+TIME_RANGE = re.compile(r'^((?:\d{4}-\d{2}-\d{2} )?\d{1,2}:\d{2}:\d{2}) ?- ?((?:\d{4}-\d{2}-\d{2} )?\d{1,2}:\d{2}:\d{2})$')
 
 def validate_files(files):
     """
@@ -16,4 +22,79 @@ def validate_files(files):
             raise FileNotFoundError(f"File {path} not exist.")
     # Debug: Print validated file paths
     # print(f"Validated file paths: {paths}")
-    return paths
\ No newline at end of file
+    return paths
+
+def _parse_time(text):
+    """Parse 'HH:MM:SS' or 'YYYY-MM-DD HH:MM:SS' and return it normalized."""
+    time_format = '%Y-%m-%d %H:%M:%S' if ' ' in text else '%H:%M:%S'
+    return datetime.strptime(text, time_format).strftime(time_format)
+
+def parse_time_ranges(text):
+    """
+    Parse time ranges written as 'HH:MM:SS-HH:MM:SS', separated by commas or semicolons.
+
+    Both ends may also carry a date ('YYYY-MM-DD HH:MM:SS-YYYY-MM-DD HH:MM:SS')
+    to select a day of a multi-day file. A range of times without dates whose
+    end is before its start crosses midnight.
+
+    Parameters:
+        text (str): Time ranges (e.g. '16:25:00-16:35:00, 23:50:00-00:10:00').
+
+    Returns:
+        list: List of (start, end) tuples of 'HH:MM:SS' or 'YYYY-MM-DD HH:MM:SS' strings; empty for empty text.
+    """
+    ranges = []
+    for part in (text or '').replace(';', ',').split(','):
+        part = ' '.join(part.split())
+        if not part:
+            continue
+        match = TIME_RANGE.match(part)
+        try:
+            start, end = [_parse_time(t) for t in match.groups()]
+        except (AttributeError, ValueError):
+            raise ValueError(f"Invalid time range '{part}', expected HH:MM:SS-HH:MM:SS or YYYY-MM-DD HH:MM:SS-YYYY-MM-DD HH:MM:SS.")
+        if (' ' in start) != (' ' in end):
+            raise ValueError(f"Invalid time range '{part}', use dates on both ends or on neither.")
+        if end == start or (' ' in start and end < start):
+            raise ValueError(f"Invalid time range '{part}', end must be after start.")
+        ranges.append((start, end))
+    return ranges
+
+def interval_index(times, starts, ends):
+    """
+    Mark which interval each time belongs to, for any number of (possibly overlapping) intervals.
+
+    The intervals are sorted once and every time is looked up with one binary
+    search, so the cost is O((n + m) log m) instead of checking each interval
+    against all times.
+
+    Parameters:
+        times (array-like): Times (any comparable numeric values, e.g. epoch seconds).
+        starts (array-like): Interval starts.
+        ends (array-like): Interval ends (inclusive).
+
+    Returns:
+        np.ndarray: Index of an interval containing each time (position in starts), -1 outside
+        all intervals. The intervals are not merged; where several contain a time, the latest
+        started one is returned if it contains it, otherwise the earlier one reaching furthest.
+    """
+    times = np.asarray(times)
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+    result = np.full(len(times), -1, dtype=np.int64)
+    if len(starts) == 0 or len(times) == 0:
+        return result
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    # Pro každý začátek interval s dosud nejpozdějším koncem (pokrývá časy za koncem aktuálního)
+    reach = np.maximum.accumulate(ends)
+    widest = np.maximum.accumulate(np.where(ends == reach, np.arange(len(ends)), 0))
+
+    position = np.searchsorted(starts, times, side='right') - 1
+    valid = position >= 0
+    position = np.where(valid, position, 0)
+    own = valid & (times <= ends[position])
+    covered = valid & ~own & (times <= reach[position])
+    result[own] = order[position[own]]
+    result[covered] = order[widest[position[covered]]]
+    return result
@@ -0,0 +1,120 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+if not __package__:
+    from ploter import TOLERANCE
+else:
+    from modules.ploter import TOLERANCE
+
+# Počet bootstrapových výběrů, hladina spolehlivosti, semínko generátoru a počet bodů pásma
+BOOTSTRAP_SAMPLES = 2000
+CONFIDENCE = 0.95
+SEED = 0
+BAND_POINTS = 50
+# Pod tímto počtem hodnot (výběry x body) se pool procesů nevyplatí
+POOL_MIN_VALUES = 2_000_000
+
+def _bootstrap_chunk(x, y, samples, seed):
+    """Coefficients (k, q) and resampled residual noise of samples bootstrap resamples."""
+    rng = np.random.default_rng(seed)
+    count = len(x)
+    index = rng.integers(0, count, size=(samples, count))
+    xs, ys = x[index], y[index]
+    # Všechny výběry jako jedno dávkové řešení nejmenších čtverců nad 3-D polem (výběr x bod x 2);
+    # x je posunuté o průměr kvůli podmíněnosti normálních rovnic
+    center = x.mean()
+    design = np.stack([xs - center, np.ones_like(xs)], axis=2)
+    gram = np.matmul(design.transpose(0, 2, 1), design)
+    rhs = np.matmul(design.transpose(0, 2, 1), ys[:, :, None])
+    # Výběr se všemi body ve stejném x nemá definovanou přímku
+    degenerate = np.ptp(xs, axis=1) == 0
+    gram[degenerate] = np.eye(2)
+    coef = np.linalg.solve(gram, rhs)[:, :, 0]
+    coef[:, 1] -= coef[:, 0] * center
+    coef[degenerate] = np.nan
+    residuals = ys - (coef[:, 0:1] * xs + coef[:, 1:2])
+    noise = residuals[np.arange(samples), rng.integers(0, count, size=samples)]
+    return coef, noise
+
+def bootstrap_coefficients(x, y, samples=BOOTSTRAP_SAMPLES, seed=SEED, workers=1):
+    """
+    Fit y = k * x + q on bootstrap resamples of the points.
+
+    All resamples are drawn at once and solved as one batched least squares
+    (3-D array resample x point x 2). With more than one worker and enough
+    work the resamples are split among worker processes.
+
+    Parameters:
+        x (np.ndarray): Reference values (point).
+        y (np.ndarray): Sensor values (point).
+        samples (int): Number of bootstrap resamples.
+        seed (int): Seed of the random generator (results are repeatable for the same workers).
+        workers (int): Number of worker processes (1 = no pool, None = number of CPUs).
+
+    Returns:
+        tuple: Coefficients (resample x 2, columns k and q; NaN for degenerate resamples) and one
+        resampled residual per resample (noise of a new measurement, for prediction bands).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or samples * len(x) < POOL_MIN_VALUES:
+        return _bootstrap_chunk(x, y, samples, seed)
+    sizes = [len(part) for part in np.array_split(np.arange(samples), workers)]
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_bootstrap_chunk, [x] * workers, [y] * workers, sizes, seeds))
+    return np.concatenate([coef for coef, _ in results]), np.concatenate([noise for _, noise in results])
+
+def fit_uncertainty(x, y, samples=BOOTSTRAP_SAMPLES, confidence=CONFIDENCE, tolerance=TOLERANCE,
+                    band_points=BAND_POINTS, seed=SEED, workers=1):
+    """
+    Return bootstrap confidence intervals of a calibration fit and its bands.
+
+    Parameters:
+        x (np.ndarray): Reference values (point); points missing in x or y are left out.
+        y (np.ndarray): Sensor values (point).
+        samples (int): Number of bootstrap resamples.
+        confidence (float): Confidence level of the intervals and bands.
+        tolerance (float): Allowed deviation of the sensor from the reference (°C).
+        band_points (int): Number of points of the bands over the range of x.
+        seed (int): Seed of the random generator.
+        workers (int): Number of worker processes (see bootstrap_coefficients).
+
+    Returns:
+        dict: 'k_low', 'k_high', 'q_low', 'q_high' (percentile intervals), 'band' (largest half-width
+        of the prediction band), 'within_tolerance' (the prediction band of y - x lies within
+        ±tolerance over the range of x) and 'x', 'fit_low', 'fit_high', 'prediction_low',
+        'prediction_high' arrays of the confidence band of the line and of the prediction band.
+        Values are NaN (and the arrays empty) for fewer than three points.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    used = ~np.isnan(x) & ~np.isnan(y)
+    x, y = x[used], y[used]
+    result = {name: np.nan for name in ('k_low', 'k_high', 'q_low', 'q_high', 'band')}
+    result.update(within_tolerance=False, **{name: np.array([]) for name in
+                                              ('x', 'fit_low', 'fit_high', 'prediction_low', 'prediction_high')})
+    if len(x) < 3 or np.ptp(x) == 0:
+        return result
+
+    coef, noise = bootstrap_coefficients(x, y, samples, seed, workers)
+    valid = ~np.isnan(coef[:, 0])
+    coef, noise = coef[valid], noise[valid]
+    tail = (1 - confidence) / 2 * 100
+    percentiles = [tail, 100 - tail]
+    result['k_low'], result['k_high'] = np.percentile(coef[:, 0], percentiles)
+    result['q_low'], result['q_high'] = np.percentile(coef[:, 1], percentiles)
+
+    # Pásma přes rozsah x: přímky všech výběrů (výběr x bod), u predikce s přičteným reziduem
+    grid = np.linspace(x.min(), x.max(), band_points)
+    lines = coef[:, 0:1] * grid[None, :] + coef[:, 1:2]
+    fit_low, fit_high = np.percentile(lines, percentiles, axis=0)
+    prediction_low, prediction_high = np.percentile(lines + noise[:, None], percentiles, axis=0)
+    result.update(x=grid, fit_low=fit_low, fit_high=fit_high, prediction_low=prediction_low,
+                  prediction_high=prediction_high)
+    result['band'] = float(np.max(prediction_high - prediction_low) / 2)
+    result['within_tolerance'] = bool(np.all(prediction_low - grid >= -tolerance) and
+                                      np.all(prediction_high - grid <= tolerance))
+    return result
@@ -0,0 +1,13 @@
+// Načtení grafu z cache výsledků a jeho vykreslení
+function loadFigure(plotId, key) {
+    const plot = document.getElementById(plotId);
+    return fetch('/api/figure/' + key)
+        .then(response => response.json())
+        .then(figure => {
+            if (figure.error) {
+                plot.innerHTML = '<p style="color: red;">' + figure.error + '</p>';
+                throw new Error(figure.error);
+            }
+            return Plotly.newPlot(plot, figure.data, figure.layout, { responsive: true });
+        });
+}
@@ -0,0 +1,25 @@
+// Čekání na dokončení úlohy na pozadí se zobrazením jejího stavu
+function waitForJob(key, statusId, interval = 500) {
+    const status = document.getElementById(statusId);
+    return new Promise((resolve, reject) => {
+        function poll() {
+            fetch('/api/jobs/' + key)
+                .then(response => response.json())
+                .then(job => {
+                    if (job.status === 'done') {
+                        resolve(job);
+                    } else if (job.status === 'error' || job.status === 'unknown') {
+                        status.innerHTML = '<span style="color: red;">Error: ' + (job.error || 'Úloha nebyla nalezena, spusťte výpočet znovu.') + '</span>';
+                        reject(new Error(job.error));
+                    } else {
+                        const percent = Math.round(job.progress * 100);
+                        status.textContent = (job.status === 'queued' ? 'Čeká ve frontě' : 'Počítá se') +
+                            (job.message ? ' (' + job.message + ')' : '') + ': ' + percent + ' %';
+                        setTimeout(poll, interval);
+                    }
+                })
+                .catch(() => setTimeout(poll, interval * 4));
+        }
+        poll();
+    });
+}
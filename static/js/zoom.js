@@ -0,0 +1,58 @@
+// Načtení podrobnějších dat viditelného úseku po přiblížení grafu
+function enableZoomDetail(plotId, points) {
+    const plot = document.getElementById(plotId);
+    if (!plot || !plot.data) {
+        return;
+    }
+
+    // Původní data pro návrat po zrušení přiblížení
+    const original = plot.data.map(trace => ({ x: trace.x, y: trace.y }));
+    const files = [...new Set(plot.data.filter(trace => trace.meta && trace.meta.file).map(trace => trace.meta.file))];
+
+    plot.on('plotly_relayout', function (event) {
+        // U více kanálů (podgrafů) se sdílenou osou přijde událost i pro 'xaxis2', 'xaxis3'...
+        const axis = Object.keys(event).map(key => key.split('.')[0]).find(key => /^xaxis\d*$/.test(key));
+        if (!axis) {
+            return;
+        }
+        if (event[axis + '.autorange']) {
+            Plotly.restyle(plot, { x: original.map(trace => trace.x), y: original.map(trace => trace.y) });
+            return;
+        }
+
+        const range = event[axis + '.range'] || [event[axis + '.range[0]'], event[axis + '.range[1]']];
+        if (range[0] === undefined || range[1] === undefined) {
+            return;
+        }
+
+        const params = new URLSearchParams({ files: files.join(','), start: range[0], end: range[1], points: points });
+        // Posuny hodin senzorů, pokud byl graf zarovnán na referenci
+        const offsets = plot.layout.meta && plot.layout.meta.offsets;
+        if (offsets) {
+            params.set('offsets', Object.entries(offsets).map(([file, offset]) => file + ':' + offset).join(','));
+        }
+        fetch('/api/series?' + params)
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    return;
+                }
+                const x = [];
+                const y = [];
+                const indices = [];
+                plot.data.forEach((trace, index) => {
+                    const meta = trace.meta;
+                    if (!meta || !data[meta.file] || !data[meta.file][meta.column]) {
+                        return;
+                    }
+                    const series = data[meta.file][meta.column];
+                    x.push(series.x);
+                    y.push(series.y.map(value => value + meta.offset));
+                    indices.push(index);
+                });
+                if (indices.length > 0) {
+                    Plotly.restyle(plot, { x: x, y: y }, indices);
+                }
+            });
+    });
+}
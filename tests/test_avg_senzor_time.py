@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from modules.avg_senzor_time import interval_stats
+
+
+def _timestamps():
+    """Irregular sampling: a dense start, then 10 s sampling with gaps and duplicates."""
+    rng = np.random.default_rng(0)
+    dense = np.cumsum(rng.integers(1, 4, size=200))
+    regular = dense[-1] + np.cumsum(np.full(2000, 10))
+    timestamp = np.concatenate((dense, regular))
+    # Mezery a duplicitní časy v pravidelné části
+    gaps = np.zeros(len(timestamp), dtype=np.int64)
+    gaps[[500, 900, 1500, 2100]] = [300, 45, 3600 * 2, 120]
+    timestamp = timestamp + np.cumsum(gaps)
+    return np.sort(np.concatenate((timestamp, timestamp[[700, 701, 1800]])))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 61, 500, 1 << 20])
+def test_chunked_equals_unchunked(chunk_size):
+    timestamp = _timestamps()
+    expected = interval_stats(timestamp, chunk_size=len(timestamp))
+    assert expected['gaps'] > 0
+    assert interval_stats(timestamp, chunk_size=chunk_size) == expected
+
+
+def test_gaps_use_final_median():
+    # První blok s řídkým vzorkováním nesmí zvednout práh mezer pro zbytek souboru
+    timestamp = np.concatenate((np.arange(0, 6000, 60), 6000 + np.arange(0, 20000, 10)))
+    result = interval_stats(timestamp, chunk_size=61)
+    assert result == interval_stats(timestamp, chunk_size=len(timestamp))
+    assert result['median'] == 10
+    assert result['gaps'] == 100